@@ -1,9 +1,11 @@
 from codefind import ConformException, code_registry as db
 
 from .codetools import CodeFile
-from .live import Watcher, watch
-from .recode import Recoder, make_recoder, virtual_file
+from .live import Watcher, awatch, watch
+from .memo import memoize
+from .recode import Recoder, make_recoder, virtual_file, virtual_file_stats
 from .register import registry
+from .safepoint import SafePoint
 from .utils import glob_filter
 from .version import version as __version__
 
@@ -13,10 +15,14 @@ __all__ = [
     "CodeFile",
     "Watcher",
     "watch",
+    "awatch",
+    "memoize",
     "Recoder",
     "make_recoder",
     "virtual_file",
+    "virtual_file_stats",
     "registry",
+    "SafePoint",
     "glob_filter",
     "__version__",
 ]
@@ -0,0 +1,340 @@
+"""Serializable records of the changes made to a CodeFile.
+
+A PatchBundle holds the compiled code of the changes made by a merge, which
+can be applied again without the source, e.g. in another process with
+Registry.apply_bundle, or saved to replay or audit a reload later.
+"""
+
+import ast
+import importlib.util
+import marshal
+import sys
+from dataclasses import dataclass, fields
+from types import CodeType
+
+from codefind import code_registry as codereg, conform
+
+from .codetools import (
+    AddOperation,
+    ClassDefinition,
+    DeleteOperation,
+    FunctionDefinition,
+    ModuleCode,
+    UpdateOperation,
+    _compile_with_flags,
+    attrproxy,
+)
+
+# Version of the serialized format
+BUNDLE_FORMAT = 1
+
+
+@dataclass
+class PatchOperation:
+    """An operation of a PatchBundle.
+
+    Attributes:
+        kind: One of:
+
+            * "conform": replace the code of the function at path.
+            * "exec": execute code in the module, or in the class at path,
+              to add a definition or run a new statement.
+            * "delete": delete name from the module or from the class at path.
+            * "refresh": refresh the file from its source, for changes that
+              cannot be serialized, e.g. a default that is not a constant.
+        filename: The file the change is in.
+        module_name: The name of the module for the file.
+        path: The names of the classes and functions leading to the function
+            to conform, or to the class to execute code in or delete from.
+        name: The name that is defined or deleted, if any.
+        code: The code to conform the function to, or to execute.
+        defaults: The new __defaults__ of the function.
+        kwdefaults: The new __kwdefaults__ of the function. The defaults
+            are left as they are if both are None.
+        span: The first and last lines of the definition in the file.
+        source: The source code of the definition.
+    """
+
+    kind: str
+    filename: str
+    module_name: str = None
+    path: tuple = ()
+    name: str = None
+    code: CodeType = None
+    defaults: tuple = None
+    kwdefaults: dict = None
+    span: tuple = None
+    source: str = None
+
+    def __str__(self):
+        where = ".".join(
+            p for p in (self.module_name, *self.path, self.name) if p
+        )
+        line = f"{self.kind} {where or self.filename}"
+        if self.span:
+            line += f" @L{self.span[0]}"
+        return line
+
+
+@dataclass
+class PatchBundle:
+    """A list of PatchOperations, which can be serialized with marshal.
+
+    Since marshal's format for code objects depends on the version of
+    Python, a bundle can only be loaded by the same version it was dumped
+    with.
+    """
+
+    operations: list
+
+    def __str__(self):
+        return "\n".join(map(str, self.operations))
+
+    def dumps(self):
+        """Serialize the bundle to bytes.
+
+        Raises ValueError if an operation holds something marshal cannot
+        serialize, e.g. a default that is not a constant.
+        """
+        ops = [
+            {
+                f.name: value
+                for f in fields(op)
+                if (value := getattr(op, f.name)) != f.default
+            }
+            for op in self.operations
+        ]
+        return marshal.dumps((importlib.util.MAGIC_NUMBER, BUNDLE_FORMAT, ops))
+
+    @classmethod
+    def loads(cls, data):
+        magic, fmt, ops = marshal.loads(data)
+        if magic != importlib.util.MAGIC_NUMBER or fmt != BUNDLE_FORMAT:
+            raise ValueError(
+                "The bundle was made by another version of Python or jurigged."
+            )
+        return cls([PatchOperation(**op) for op in ops])
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.dumps())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            return cls.loads(f.read())
+
+    def apply(self, registry):
+        """Apply the operations, see Registry.apply_bundle."""
+        for op in self.operations:
+            try:
+                _apply_operation(op, registry)
+            except Exception as exc:
+                registry.log(exc)
+
+
+def _find_owner(module_name, path):
+    # The globals of the module, and the class at path, if any
+    glb = vars(sys.modules[module_name])
+    if not path:
+        return glb, None
+    owner = glb[path[0]]
+    for name in path[1:]:
+        owner = getattr(owner, name)
+    return glb, owner
+
+
+def _conform_code(filename, path, code, use_cache=False):
+    # Like FunctionDefinition.recode: the code objects of closures are
+    # replaced along with the function's
+    try:
+        old = codereg.find_code(*path, filename=filename)
+    except KeyError:
+        return []
+    fns = codereg.get_functions(old, use_cache=use_cache)
+    if old is not code:
+        conform(old, code, use_cache=use_cache)
+    for co in code.co_consts:
+        if isinstance(co, CodeType) and not co.co_name.startswith("<"):
+            _conform_code(filename, (*path, co.co_name), co, use_cache=True)
+    return fns
+
+
+def _apply_operation(op, registry):
+    if op.kind == "conform":
+        fns = _conform_code(op.filename, op.path, op.code)
+        if op.defaults is not None or op.kwdefaults is not None:
+            for fn in fns:
+                fn.__defaults__ = op.defaults
+                fn.__kwdefaults__ = op.kwdefaults
+
+    elif op.kind == "exec":
+        if op.module_name not in sys.modules:
+            return
+        glb, owner = _find_owner(op.module_name, op.path)
+        lcl = None if owner is None else attrproxy(owner)
+        exec(op.code, glb, lcl)
+        obj = (lcl or glb).get(op.name, None) if op.name else None
+        if hasattr(obj, "__qualname__"):
+            obj.__qualname__ = ".".join((*op.path, op.name))
+        codereg.assimilate(op.code.replace(co_name=""), (op.filename, *op.path))
+
+    elif op.kind == "delete":
+        if op.module_name not in sys.modules:
+            return
+        # Like a deletion in a merge, the code of a deleted function is
+        # conformed to None, to notify the objects that follow it
+        try:
+            code = codereg.find_code(*op.path, op.name, filename=op.filename)
+        except KeyError:
+            pass
+        else:
+            conform(code, None)
+        glb, owner = _find_owner(op.module_name, op.path)
+        if owner is None:
+            glb.pop(op.name, None)
+        elif op.name in vars(owner):
+            delattr(owner, op.name)
+
+    elif op.kind == "refresh":
+        if (cf := registry.get(op.filename)) is not None:
+            cf.refresh()
+
+    else:
+        raise ValueError(f"Unknown patch operation: {op.kind}")
+
+
+def _functions(cf):
+    # Functions that are not closures, by path, with their current code
+    return {
+        defn.codepath()[1:]: defn.get_object()
+        for defn in cf.root.walk()
+        if isinstance(defn, FunctionDefinition)
+        and not isinstance(defn.parent, FunctionDefinition)
+    }
+
+
+def _span(defn):
+    return (defn.stashed.lineno, defn.stashed.end_lineno)
+
+
+class BundleRecorder:
+    """Record the changes made to a CodeFile into a PatchBundle.
+
+    The recorder is used as a context manager around merge or refresh:
+
+        with BundleRecorder(codefile) as recorder:
+            codefile.refresh()
+        bundle = recorder.bundle
+    """
+
+    def __init__(self, codefile):
+        self.codefile = codefile
+        self.bundle = None
+        self._before = None
+        self._pending = None
+
+    def start(self):
+        self._before = _functions(self.codefile)
+        self._pending = []
+        self.codefile.activity.register(self._on_activity)
+
+    def finish(self):
+        """Stop recording and return the bundle of the recorded changes."""
+        self.codefile.activity.remove(self._on_activity)
+        ops = []
+        for op, defn in self._pending:
+            if op.kind == "delete":
+                if op.name in {c.name for c in defn.parent.children}:
+                    # Another definition of the name remains
+                    continue
+            else:
+                op.span = _span(defn)
+                op.source = defn.codestring
+            ops.append(op)
+
+        # Functions that were moved to other lines are recoded without
+        # emitting any event
+        sent = {op.path: op.code for op in ops if op.kind == "conform"}
+        for defn in self.codefile.root.walk():
+            if isinstance(defn, FunctionDefinition) and not isinstance(
+                defn.parent, FunctionDefinition
+            ):
+                path = defn.codepath()[1:]
+                code = defn.get_object()
+                old = self._before.get(path, None)
+                if (
+                    old is not None
+                    and code is not old
+                    and code is not sent.get(path)
+                ):
+                    ops.append(
+                        self._operation(
+                            "conform", path=path, code=code, span=_span(defn)
+                        )
+                    )
+
+        self.bundle = PatchBundle(ops)
+        return self.bundle
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, typ, exc, tb):
+        self.finish()
+
+    def _operation(self, kind, **kwargs):
+        return PatchOperation(
+            kind=kind,
+            filename=self.codefile.filename,
+            module_name=self.codefile.module_name,
+            **kwargs,
+        )
+
+    def _on_activity(self, event):
+        if isinstance(event, UpdateOperation):
+            defn = event.defn
+            if isinstance(defn, FunctionDefinition):
+                code = defn.get_object()
+                fns = codereg.get_functions(code, use_cache=True)
+                op = self._operation(
+                    "conform",
+                    path=defn.codepath()[1:],
+                    code=code,
+                    defaults=fns[0].__defaults__ if fns else None,
+                    kwdefaults=fns[0].__kwdefaults__ if fns else None,
+                )
+                self._pending.append((op, defn))
+
+        elif isinstance(event, (AddOperation, DeleteOperation)):
+            defn = event.defn
+            # Definitions are only added or deleted in modules and classes
+            if isinstance(defn.parent, ModuleCode):
+                path = ()
+            else:
+                path = defn.parent.codepath()[1:]
+
+            if isinstance(event, AddOperation):
+                node = ast.Module(body=[defn.node], type_ignores=[])
+                code = _compile_with_flags(
+                    node,
+                    mode="exec",
+                    filename=defn.filename,
+                    glb=defn.get_globals(),
+                ).replace(co_name="<adjust>")
+                # Only definitions get a __qualname__
+                is_def = isinstance(defn, (FunctionDefinition, ClassDefinition))
+                op = self._operation(
+                    "exec",
+                    path=path,
+                    name=defn.name if is_def else None,
+                    code=code,
+                )
+                self._pending.append((op, defn))
+
+            elif defn.name:
+                # Whether the name is still defined is only known once the
+                # merge is over
+                op = self._operation("delete", path=path, name=defn.name)
+                self._pending.append((op, defn))
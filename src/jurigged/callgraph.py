@@ -0,0 +1,200 @@
+import ast
+from types import ModuleType
+
+from .codetools import (
+    ClassDefinition,
+    CodeFileOperation,
+    Definition,
+    FunctionDefinition,
+    LineDefinition,
+    ModuleCode,
+)
+from .parse import variables
+
+
+def _line_variables(node):
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        names = {
+            alias.asname or alias.name.split(".")[0]
+            for alias in node.names
+            if alias.name != "*"
+        }
+        return names, set()
+    vs = variables(node, {})
+    return vs.assigned, vs.free
+
+
+def _object_key(value):
+    if isinstance(value, ModuleType):
+        return value.__name__
+    try:
+        module = getattr(value, "__module__", None)
+        qualname = getattr(value, "__qualname__", None)
+    except Exception:
+        # Arbitrary objects may raise anything in __getattr__
+        return None
+    if (
+        isinstance(module, str)
+        and isinstance(qualname, str)
+        and "<locals>" not in qualname
+    ):
+        return f"{module}.{qualname}"
+    return None
+
+
+def _changed_keys(defn):
+    keys = set()
+    if isinstance(defn, LineDefinition):
+        if defn.node is None or defn.parent is None:
+            return keys
+        if isinstance(defn.parent, ModuleCode):
+            modpath = defn.parent.dotpath()
+            assigned, _ = _line_variables(defn.node)
+            keys.update(f"{modpath}.{name}" for name in assigned)
+        defn = defn.parent
+    elif isinstance(defn, FunctionDefinition):
+        # Closures are replaced along with the function
+        keys.update(
+            d.dotpath()
+            for d in defn.walk()
+            if isinstance(d, (FunctionDefinition, ClassDefinition))
+        )
+    keys.update(d.dotpath() for d in defn.hierarchy())
+    return keys
+
+
+class CallGraph:
+    """Static index of the dependencies between definitions.
+
+    Functions and classes are identified by their dotpath, e.g.
+    ``module.Class.method``, and module-level statements by the global names
+    they assign, e.g. ``module.CONSTANT``. A definition depends on the
+    global names it reads, resolved to the module-level definitions of its
+    own module or, for imported names, to the object they refer to.
+
+    Names read through attributes, e.g. ``self.method()``, are not seen, so
+    the index is an approximation that callers should use accordingly.
+
+    The index is built lazily over the files of the registry, and a file is
+    indexed again on the first query after it changes. Since operations are
+    emitted while a file is being merged, queries should be made once the
+    merge is complete.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.files = {}
+        self._dirty = set()
+        self._dependents = None
+        registry.activity.register(self._on_activity)
+
+    def _on_activity(self, event):
+        if isinstance(event, CodeFileOperation):
+            self._dirty.add(event.codefile.filename)
+
+    def _index_file(self, cf):
+        root = cf.root
+        modpath = root.dotpath()
+        glb = root.get_globals() or {}
+        graph = {}
+        provided = {}
+
+        for child in root.children:
+            if isinstance(child, (FunctionDefinition, ClassDefinition)):
+                provided[child.name] = child.dotpath()
+            elif isinstance(child, LineDefinition) and child.node is not None:
+                for name in _line_variables(child.node)[0]:
+                    provided[name] = f"{modpath}.{name}"
+
+        def resolve(names):
+            deps = set()
+            for name in names:
+                if name in provided:
+                    deps.add(provided[name])
+                elif name in glb and (key := _object_key(glb[name])):
+                    deps.add(key)
+            return deps
+
+        for defn in root.walk():
+            if isinstance(defn, (FunctionDefinition, ClassDefinition)):
+                if defn.variables is not None:
+                    graph.setdefault(defn.dotpath(), set()).update(
+                        resolve(defn.variables.free)
+                    )
+            elif (
+                isinstance(defn, LineDefinition)
+                and defn.node is not None
+                and defn.parent is root
+            ):
+                assigned, free = _line_variables(defn.node)
+                is_import = isinstance(defn.node, (ast.Import, ast.ImportFrom))
+                for name in assigned:
+                    deps = graph.setdefault(f"{modpath}.{name}", set())
+                    if is_import:
+                        if key := _object_key(glb.get(name)):
+                            deps.add(key)
+                    else:
+                        deps.update(resolve(free))
+
+        return graph
+
+    def _refresh(self):
+        filenames = [*self.registry.precache, *self.registry.cache]
+        for filename in dict.fromkeys(filenames):
+            if filename in self.files and filename not in self._dirty:
+                continue
+            cf = self.registry.get(filename)
+            if cf is not None:
+                self.files[filename] = self._index_file(cf)
+                self._dependents = None
+            self._dirty.discard(filename)
+
+        if self._dependents is None:
+            self._dependents = {}
+            for graph in self.files.values():
+                for key, deps in graph.items():
+                    for dep in deps:
+                        self._dependents.setdefault(dep, set()).add(key)
+
+    def dependencies(self, key):
+        """Return the keys that key directly depends on."""
+        self._refresh()
+        for graph in self.files.values():
+            if key in graph:
+                return set(graph[key])
+        return set()
+
+    def dependents(self, key):
+        """Return the keys that directly depend on key."""
+        self._refresh()
+        return set(self._dependents.get(key, ()))
+
+    def affected(self, *changes):
+        """Return the keys of the definitions affected by the changes.
+
+        Arguments:
+            changes: Operations emitted by a CodeFile (UpdateOperation,
+                AddOperation, DeleteOperation), Definitions, or keys.
+
+        Returns:
+            The set of the keys of the changed definitions, their
+            enclosing definitions, and everything that transitively
+            depends on them.
+        """
+        self._refresh()
+        keys = set()
+        for change in changes:
+            if isinstance(change, CodeFileOperation):
+                change = change.defn
+            if isinstance(change, Definition):
+                keys.update(_changed_keys(change))
+            else:
+                keys.add(change)
+
+        todo = list(keys)
+        while todo:
+            for dep in self._dependents.get(todo.pop(), ()):
+                if dep not in keys:
+                    keys.add(dep)
+                    todo.append(dep)
+        return keys
@@ -9,13 +9,14 @@ from collections import Counter
 from contextlib import contextmanager, suppress
 from contextvars import ContextVar
 from dataclasses import dataclass, field, replace as dc_replace
+from itertools import accumulate
 from types import CodeType, ModuleType
 from typing import List, Optional, Union
 
 from codefind import ConformException, code_registry as codereg, conform
 from ovld import ovld, recurse
 
-from .parse import Variables, variables
+from .parse import Variables, fill_closures, variables
 from .utils import EventSource, shift_lineno
 
 current_info = ContextVar("current_info", default=None)
@@ -91,23 +92,37 @@ class Info:
 
     replace = dc_replace
 
-    def get_segment(self, ext):
-        lineno = ext.lineno - 1
-        col_offset = ext.col_offset
-        end_lineno = ext.end_lineno - 1
-        end_col_offset = ext.end_col_offset
+    def __post_init__(self):
+        # Character offset of the start of each line in the source
+        self.line_offsets = list(accumulate(map(len, self.lines), initial=0))
+        # AST column offsets are byte offsets, which only differ from
+        # character offsets on lines that contain non-ASCII characters
+        self.byte_maps = {
+            i: _byte_to_char_map(line)
+            for i, line in enumerate(self.lines)
+            if not line.isascii()
+        }
+
+    def get_offset(self, lineno, col_offset):
+        """Get the character offset in the source of a lineno/byte offset."""
+        lineno -= 1
+        if (byte_map := self.byte_maps.get(lineno)) is not None:
+            col_offset = byte_map[col_offset]
+        return self.line_offsets[lineno] + col_offset
 
-        lines = self.lines
-        if end_lineno == lineno:
-            return lines[lineno].encode()[col_offset:end_col_offset].decode()
+    def get_segment(self, ext):
+        start = self.get_offset(ext.lineno, ext.col_offset)
+        end = self.get_offset(ext.end_lineno, ext.end_col_offset)
+        return self.source[start:end]
 
-        first = lines[lineno].encode()[col_offset:].decode()
-        last = lines[end_lineno].encode()[:end_col_offset].decode()
-        lines = lines[lineno + 1 : end_lineno]
 
-        lines.insert(0, first)
-        lines.append(last)
-        return "".join(lines)
+def _byte_to_char_map(line):
+    # Map each byte offset in the UTF-8 encoding of line to a char offset
+    mapping = []
+    for i, c in enumerate(line):
+        mapping.extend([i] * len(c.encode()))
+    mapping.append(len(line))
+    return mapping
 
 
 @contextmanager
@@ -191,6 +206,8 @@ class Definition:
 
     def __post_init__(self):
         self._code = None
+        self._dotpath = None
+        self._codepath = None
         if self.filename is None:
             self.filename = get_info().filename
 
@@ -202,6 +219,20 @@ class Definition:
         self.parent = parent
         for p in self.hierarchy(skip=1):
             p._code = None
+        self.invalidate_paths()
+
+    def rename(self, name):
+        self.name = name
+        self.invalidate_paths()
+
+    def invalidate_paths(self):
+        # Paths are computed from the parent's cached path, so if this
+        # definition has no cached path, none of its descendants do either.
+        if self._dotpath is None and self._codepath is None:
+            return
+        for defn in self.walk():
+            defn._dotpath = None
+            defn._codepath = None
 
     def hierarchy(self, skip=0):
         if skip <= 0:
@@ -210,15 +241,26 @@ class Definition:
             yield from self.parent.hierarchy(skip - 1)
 
     def dotpath(self):
-        chain = list(self.hierarchy())
-        return ".".join(x.name or "<line>" for x in reversed(chain))
+        if self._dotpath is None:
+            name = self.name or "<line>"
+            if self.parent is None:
+                self._dotpath = name
+            else:
+                self._dotpath = f"{self.parent.dotpath()}.{name}"
+        return self._dotpath
 
     def codepath(self, skip=0):
-        chain = list(self.hierarchy(skip=skip))
-        return tuple(
-            (x.filename if i == 0 else x.name) or "<line>"
-            for i, x in enumerate(reversed(chain))
-        )
+        if skip > 0:
+            return self.parent.codepath(skip - 1) if self.parent else ()
+        if self._codepath is None:
+            if self.parent is None:
+                self._codepath = (self.filename or "<line>",)
+            else:
+                self._codepath = (
+                    *self.parent.codepath(),
+                    self.name or "<line>",
+                )
+        return self._codepath
 
     def get_globals(self):
         return self.parent and self.parent.get_globals()
@@ -371,15 +413,6 @@ class GroupDefinition(Definition):
     # Hierarchy #
     #############
 
-    def set_parent(self, parent):
-        super().set_parent(parent)
-        if self.variables is not None:
-            closable = set()
-            for p in self.hierarchy(skip=1):
-                if p.variables:
-                    closable |= p.variables.assigned
-            self.variables.closure = self.variables.free & closable
-
     def header(self):
         return "".join(
             [
@@ -741,7 +774,7 @@ class FunctionDefinition(GroupDefinition):
         if controller("pre-update", corr):
             # Reevaluate this function
             glb = self.get_globals()
-            new_obj = self.reevaluate(corr.new.node, glb)
+            new_obj = self.reevaluate(corr.new, glb)
             new_code = new_obj.__code__
 
             self.recode(new_code, recode_current=False)
@@ -772,7 +805,8 @@ class FunctionDefinition(GroupDefinition):
                 self._codeobj = codereg.codes[pth]
         return self._codeobj
 
-    def reevaluate(self, new_node, glb):
+    def reevaluate(self, new, glb):
+        new_node = new.node
         ext = new_node.extent
         closure = False
         lcl = {}
@@ -789,12 +823,12 @@ class FunctionDefinition(GroupDefinition):
             end_col_offset=new_node.end_col_offset,
         )
         previous = lcl.get(self.name, None)
-        if self.variables.closure:
+        if new.variables.closure:
             # Because reevaluate is typically not run on closures, this code
             # path is essentially only entered for functions that use super(),
             # since they are implicit closures on __class__
             closure = True
-            names = tuple(sorted(self.variables.closure))
+            names = tuple(sorted(new.variables.closure))
             wrap = ast.copy_location(
                 ast.FunctionDef(
                     name="##create_closure",
@@ -847,6 +881,7 @@ class FunctionDefinition(GroupDefinition):
             )
         conform(old_obj, new_obj)
         self._codeobj = new_obj.__code__
+        self.variables = new.variables
         return new_obj
 
 
@@ -882,40 +917,22 @@ def _collapse_to_end(ext):
     )
 
 
-def extend_to_line(node):
-    return Extent(
-        lineno=node.lineno,
-        col_offset=0,
+def fill_real_extent(node):
+    """Set the extent of a statement, including its decorators if any.
+
+    Only the statements that become definitions need an extent, so this
+    does not recurse into the node's children.
+    """
+    if decorators := getattr(node, "decorator_list", None):
+        lineno, col_offset = decorators[0].lineno, 0
+    else:
+        lineno, col_offset = node.lineno, node.col_offset
+    node.extent = Extent(
+        lineno=lineno,
+        col_offset=col_offset,
         end_lineno=node.end_lineno,
         end_col_offset=node.end_col_offset,
     )
-
-
-def fill_real_extent(node):
-    extents = [
-        ext for n in ast.iter_child_nodes(node) if (ext := fill_real_extent(n))
-    ]
-    if hasattr(node, "decorator_list"):
-        for deco in node.decorator_list:
-            extents.append(extend_to_line(deco))
-
-    if hasattr(node, "lineno"):
-        extents.append(node)
-
-        lineno, col_offset = min(
-            (ext.lineno, ext.col_offset) for ext in extents
-        )
-        end_lineno, end_col_offset = max(
-            (ext.end_lineno, ext.end_col_offset) for ext in extents
-        )
-        node.extent = Extent(
-            lineno=lineno,
-            col_offset=col_offset,
-            end_lineno=end_lineno,
-            end_col_offset=end_col_offset,
-        )
-    else:
-        node.extent = None
     return node.extent
 
 
@@ -970,7 +987,7 @@ def distribute(between, defn1, defn2, cls=LineDefinition):
 def collect_definitions(nodes: list):
     if not nodes:
         return []
-    defns = [(node.extent, recurse(node)) for node in nodes]
+    defns = [(fill_real_extent(node), recurse(node)) for node in nodes]
     results = []
     for (node1, defn1), (node2, defn2) in zip(defns[:-1], defns[1:]):
         between = delta(node1, node2)
@@ -1042,13 +1059,15 @@ def collect_definitions(node: ast.ClassDef):
 def collect_definitions(node: ast.Module):
     info = get_info()
     begin_node = Extent(lineno=1, col_offset=0, end_lineno=1, end_col_offset=0)
+    end_col_offset = len(info.lines[-1].encode())
     end_node = Extent(
         lineno=len(info.lines),
-        col_offset=len(info.lines[-1]),
+        col_offset=end_col_offset,
         end_lineno=len(info.lines),
-        end_col_offset=len(info.lines[-1]),
+        end_col_offset=end_col_offset,
     )
 
+    node.extent = None
     cg = ModuleCode(
         node=node, name=info.module_name, children=recurse(node.body)
     )
@@ -1081,6 +1100,7 @@ class CodeFile:
         tree = ast.parse(self.saved)
         varinfo = {}
         variables(tree, varinfo)
+        fill_closures(self.saved, varinfo, filename=self.filename)
         with use_info(
             filename=self.filename,
             module_name=module_name,
@@ -1088,7 +1108,6 @@ class CodeFile:
             lines=splitlines(self.saved),
             varinfo=varinfo,
         ):
-            fill_real_extent(tree)
             self.root = collect_definitions(tree)
         self.root.stash()
         self.dirty = False
@@ -1167,8 +1186,12 @@ class CodeFile:
             cf = CodeFile(
                 self.filename, source=new_source, module_name=self.module_name
             )
-            self.merge(cf, order="new")
-            self.root.stash()
+            self.update(cf)
+
+    def update(self, other):
+        """Replace the definitions with those of other, a newer version."""
+        self.merge(other, order="new")
+        self.root.stash()
 
 
 @dataclass
@@ -0,0 +1,184 @@
+"""Share the work of applying changes between processes.
+
+In a prefork server, every worker would otherwise watch the same files and
+parse them and compute the same changes on every save. Instead, one process
+runs a Coordinator next to its Watcher and, for each change, sends a
+PatchBundle with the compiled code to the worker processes over a Unix
+socket. The workers run a Subscriber, which applies the bundle without
+reading or parsing anything.
+
+Each message is a PatchBundle, as serialized by PatchBundle.dumps, preceded
+by its length as a 4-byte big-endian integer. Since dumps checks the
+version of Python and of the bundle format, this is the only framing the
+protocol needs.
+"""
+
+import os
+import socket
+import struct
+import threading
+
+from .bundle import BundleRecorder, PatchBundle, PatchOperation
+from .register import registry as default_registry
+
+_header = struct.Struct("!I")
+
+
+def encode_bundle(bundle):
+    data = bundle.dumps()
+    return _header.pack(len(data)) + data
+
+
+def send_bundle(sock, bundle):
+    sock.sendall(encode_bundle(bundle))
+
+
+def _recv_exactly(sock, n):
+    chunks = []
+    while n:
+        chunk = sock.recv(n)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_bundle(sock):
+    """Receive a PatchBundle, or None if the connection was closed."""
+    header = _recv_exactly(sock, _header.size)
+    if header is None:
+        return None
+    (size,) = _header.unpack(header)
+    data = _recv_exactly(sock, size)
+    return None if data is None else PatchBundle.loads(data)
+
+
+class Coordinator:
+    """Send the changes found by a Watcher to Subscribers in other processes.
+
+    The changes are computed once, in this process, and the resulting code
+    is sent to every Subscriber connected to the Unix socket at address.
+
+    Arguments:
+        watcher: The Watcher to get changes from.
+        address: The path to the Unix socket to listen on.
+    """
+
+    def __init__(self, watcher, address):
+        self.watcher = watcher
+        self.registry = watcher.registry
+        self.address = address
+        self.clients = []
+        self.sock = None
+        self.thread = None
+        self._lock = threading.Lock()
+        self._recorders = {}
+        watcher.prerun.register(self._on_prerun)
+        watcher.postrun.register(self._on_postrun)
+
+    def start(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.address)
+        self.sock.listen()
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.sock is not None:
+            # Closing the socket alone does not interrupt accept()
+            self.sock.shutdown(socket.SHUT_RDWR)
+            self.sock.close()
+            self.sock = None
+            self.thread.join()
+            os.unlink(self.address)
+        with self._lock:
+            for client in self.clients:
+                client.close()
+            self.clients.clear()
+
+    def _accept(self):
+        sock = self.sock
+        while True:
+            try:
+                client, _ = sock.accept()
+            except OSError:
+                # The socket was shut down by stop()
+                return
+            with self._lock:
+                self.clients.append(client)
+
+    def broadcast(self, bundle):
+        """Send the bundle to all Subscribers, dropping disconnected ones."""
+        data = encode_bundle(bundle)
+        with self._lock:
+            for client in list(self.clients):
+                try:
+                    client.sendall(data)
+                except OSError:
+                    client.close()
+                    self.clients.remove(client)
+
+    def _on_prerun(self, path, cf):
+        if (previous := self._recorders.pop(path, None)) is not None:
+            # The last refresh failed before postrun
+            previous.finish()
+        if cf is not None:
+            self._recorders[path] = recorder = BundleRecorder(cf)
+            recorder.start()
+
+    def _on_postrun(self, path, cf):
+        bundle = self._recorders.pop(path).finish()
+        if not bundle.operations:
+            return
+        try:
+            self.broadcast(bundle)
+        except ValueError:
+            # Something could not be marshalled
+            refresh = PatchOperation(kind="refresh", filename=path)
+            self.broadcast(PatchBundle([refresh]))
+
+
+class Subscriber:
+    """Apply the bundles sent by a Coordinator.
+
+    Arguments:
+        address: The path to the Coordinator's Unix socket.
+        registry: The registry to log errors to and to refresh files with,
+            when a change cannot be sent as code.
+    """
+
+    def __init__(self, address, registry=default_registry):
+        self.address = address
+        self.registry = registry
+        self.applied = 0
+        self.sock = None
+        self.thread = None
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.address)
+
+    def serve(self):
+        """Apply bundles until the Coordinator closes the connection."""
+        while (bundle := recv_bundle(self.sock)) is not None:
+            self.registry.apply_bundle(bundle)
+            self.applied += 1
+        self.sock.close()
+
+    def start(self):
+        self.connect()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+
+def subscribe(address, registry=default_registry):
+    """Start applying the bundles of the Coordinator at address.
+
+    This should be called in each worker process, after it is forked.
+    """
+    subscriber = Subscriber(address, registry=registry)
+    subscriber.start()
+    return subscriber
@@ -0,0 +1,279 @@
+"""Fork server for programs run through jurigged.
+
+The server process imports the dependencies of the program once, then forks
+a child to run it. When the program must be restarted, e.g. because a change
+could not be applied live, a new child is forked from the warm server instead
+of starting a new interpreter and importing everything again.
+"""
+
+import ast
+import importlib
+import importlib.util
+import logging
+import os
+import signal
+import sys
+import time
+import traceback
+from collections import deque
+from importlib.machinery import PathFinder
+
+from codefind import ConformException
+
+from .poller import _signature
+
+log = logging.getLogger(__name__)
+
+# EX_TEMPFAIL: the child asks to be run again
+RESTART_EXITCODE = 75
+
+# How often to check the files for changes after a restarted child failed
+DEFAULT_WAIT_INTERVAL = 0.1
+
+# The ForkServer that forked the current process, if any
+current_server = None
+
+
+def _find_spec(name):
+    """Find the spec of a module without executing any of its parents."""
+    if name in sys.modules:
+        return getattr(sys.modules[name], "__spec__", None)
+    top, *parts = name.split(".")
+    spec = importlib.util.find_spec(top)
+    for part in parts:
+        if spec is None or not spec.submodule_search_locations:
+            return None
+        spec = PathFinder.find_spec(
+            f"{spec.name}.{part}", spec.submodule_search_locations
+        )
+    return spec
+
+
+def _toplevel_imports(tree, package):
+    """Yield the names of the modules imported when tree is executed.
+
+    Imports inside functions are not executed at import time, so they are
+    not included.
+    """
+    if isinstance(tree, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+        return
+    elif isinstance(tree, ast.Import):
+        for alias in tree.names:
+            yield alias.name
+    elif isinstance(tree, ast.ImportFrom):
+        if tree.level:
+            if not package:
+                return
+            base = importlib.util.resolve_name(
+                "." * tree.level + (tree.module or ""), package
+            )
+        else:
+            base = tree.module
+        yield base
+        for alias in tree.names:
+            # The imported names may be submodules
+            if alias.name != "*":
+                yield f"{base}.{alias.name}"
+    else:
+        for child in ast.iter_child_nodes(tree):
+            yield from _toplevel_imports(child, package)
+
+
+def preload(filename, watched, package="", scanned=None):
+    """Import the dependencies of the file, except the watched ones.
+
+    The source of filename is scanned for imports, recursively through the
+    watched modules it imports, and every module that is not watched is
+    imported. Watched modules are not imported, because they may change
+    before the next fork.
+
+    Arguments:
+        filename: The path to the entry point.
+        watched: A filter on filenames, true for the watched files.
+        package: The package filename belongs to, to resolve relative imports.
+        scanned: A list to append the filenames of the scanned files to.
+
+    Returns:
+        The list of names of the modules that were imported.
+    """
+    imported = []
+    seen = set()
+    todo = deque([(filename, package)])
+    while todo:
+        filename, package = todo.popleft()
+        if scanned is not None:
+            scanned.append(filename)
+        try:
+            with open(filename, encoding="utf8") as f:
+                tree = ast.parse(f.read(), filename)
+        except (OSError, SyntaxError, UnicodeDecodeError):
+            continue
+        for name in _toplevel_imports(tree, package):
+            if name in seen:
+                continue
+            seen.add(name)
+            spec = _find_spec(name)
+            if spec is None:
+                continue
+            elif spec.has_location and watched(spec.origin):
+                pkg = name if spec.submodule_search_locations else spec.parent
+                todo.append((spec.origin, pkg))
+            elif name not in sys.modules:
+                try:
+                    importlib.import_module(name)
+                except Exception as exc:
+                    log.debug(f"Could not preload {name}: {exc}")
+                else:
+                    imported.append(name)
+    return imported
+
+
+def _exit(code):  # pragma: no cover
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
+
+
+def restart():
+    """Restart the program in a new child of the fork server."""
+    if current_server is None:
+        raise Exception("restart() can only be called under a fork server")
+    _exit(RESTART_EXITCODE)
+
+
+def needs_restart(exc):
+    """Whether exc means that a change cannot be applied live.
+
+    This is the case for a ConformException, e.g. when the free variables
+    of a closure change, and for the TypeError Python raises when a class
+    cannot take the layout of its new version. Other errors, e.g. a typo in
+    a module-level statement, are only logged, as they are without a fork
+    server.
+    """
+    return isinstance(exc, ConformException) or (
+        isinstance(exc, TypeError) and "layout differs" in str(exc)
+    )
+
+
+def restart_on_error(logger):
+    """Wrap a jurigged logger to restart when a change cannot be applied."""
+
+    def log(event):
+        logger(event)
+        if isinstance(event, Exception) and needs_restart(event):
+            restart()
+
+    return log
+
+
+class ForkServer:
+    """Run a function in forked children, forking again on restart.
+
+    A child requests a restart by calling restart(), which exits with
+    RESTART_EXITCODE. Sending SIGHUP to the server also restarts the child.
+
+    When a restarted child fails, e.g. because the change that caused the
+    restart broke the program, the server does not exit. It waits until one
+    of the files changes, or until it receives SIGHUP, and forks again.
+
+    Arguments:
+        main: The function to run in each child.
+        files: The files to wait on after a restarted child fails.
+        interval: How often to check the files, in seconds.
+    """
+
+    def __init__(self, main, files=(), interval=DEFAULT_WAIT_INTERVAL):
+        self.main = main
+        self.files = list(files)
+        self.interval = interval
+        self.pid = None
+        self.restarts = 0
+        self._hup = False
+
+    def _on_hup(self, signum, frame):
+        self._hup = True
+        if self.pid is not None:
+            os.kill(self.pid, signal.SIGTERM)
+
+    def _child(self):  # pragma: no cover
+        # Coverage data is lost on os._exit, so this is not measured
+        global current_server
+        current_server = self
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        code = 0
+        try:
+            self.main()
+        except KeyboardInterrupt:
+            traceback.print_exc()
+            code = 128 + signal.SIGINT
+        except SystemExit as exc:
+            if exc.code is None:
+                code = 0
+            elif isinstance(exc.code, int):
+                code = exc.code
+            else:
+                print(exc.code, file=sys.stderr)
+                code = 1
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            _exit(code)
+
+    def _signatures(self):
+        return [_signature(f) for f in self.files]
+
+    def _wait(self, signatures):
+        # The signatures are taken before the child is forked, so that a
+        # file saved while the child was failing is not missed
+        print("Waiting for a change to restart the program...", file=sys.stderr)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        try:
+            while not self._hup and self._signatures() == signatures:
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            return False
+        finally:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+        return True
+
+    def serve(self):
+        """Run main until it exits without requesting a restart.
+
+        Returns:
+            The exit code of the last child.
+        """
+        # Interrupts are delivered to the child, which shares the terminal
+        old_int = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        old_hup = signal.signal(signal.SIGHUP, self._on_hup)
+        try:
+            while True:
+                self._hup = False
+                signatures = self._signatures()
+                sys.stdout.flush()
+                sys.stderr.flush()
+                self.pid = os.fork()
+                if self.pid == 0:  # pragma: no cover
+                    self._child()
+                if self._hup:  # pragma: no cover
+                    # SIGHUP arrived before the pid was known
+                    os.kill(self.pid, signal.SIGTERM)
+                _, status = os.waitpid(self.pid, 0)
+                self.pid = None
+                code = os.waitstatus_to_exitcode(status)
+                if self._hup or code == RESTART_EXITCODE:
+                    self.restarts += 1
+                elif self.restarts and code == 1:
+                    # The program ran before, so it may run again once fixed
+                    if not self._wait(signatures):
+                        return 128 + signal.SIGINT
+                    self.restarts += 1
+                elif code < 0:
+                    # Killed by a signal, report it like a shell would
+                    return 128 - code
+                else:
+                    return code
+        finally:
+            signal.signal(signal.SIGINT, old_int)
+            signal.signal(signal.SIGHUP, old_hup)
@@ -0,0 +1,221 @@
+"""Lightweight file observer that uses Linux's inotify directly.
+
+It implements the subset of watchdog's Observer interface that Watcher uses,
+with a single thread that reads the events of all watched directories in
+batches and dispatches them with one dictionary lookup per event.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+from dataclasses import dataclass
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# Writing a file in place, or replacing it like some editors do
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+
+log = logging.getLogger(__name__)
+
+_event_header = struct.Struct("iIII")
+_read_size = 64 * 1024
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+    except OSError:
+        # e.g. static or unusual builds where libc cannot be loaded this way
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint32,
+    ]
+    return libc
+
+
+_libc = _load_libc()
+
+
+def available():
+    """Whether inotify can be used on this system."""
+    return _libc is not None
+
+
+def _check(result):
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return result
+
+
+def parse_events(data):
+    """Yield (wd, mask, name) for each event in data read from inotify."""
+    offset = 0
+    size = _event_header.size
+    while offset < len(data):
+        wd, mask, _, length = _event_header.unpack_from(data, offset)
+        offset += size
+        name = data[offset : offset + length].rstrip(b"\0")
+        offset += length
+        yield wd, mask, os.fsdecode(name)
+
+
+@dataclass
+class FileModifiedEvent:
+    src_path: str
+
+
+class InotifyObserver:
+    """Dispatch inotify events to watchdog-style handlers.
+
+    Only ``on_modified`` is called on the handlers, with an event that has
+    a ``src_path``, and only for files that were scheduled through
+    ``schedule(handler, path, filename=...)``, or for any file in path if
+    no filename is given.
+    """
+
+    def __init__(self):
+        if not available():
+            raise OSError("inotify is not available on this system")
+        self.fd = _check(_libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+        # Pipe to wake up the thread when stopping
+        self._wake_r, self._wake_w = os.pipe()
+        self._lock = threading.Lock()
+        self._dirs = {}
+        self._wds = {}
+        self._handlers = {}
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, handler, path, filename=None):
+        path = os.path.normpath(path)
+        with self._lock:
+            if path not in self._dirs:
+                wd = _check(
+                    _libc.inotify_add_watch(
+                        self.fd, os.fsencode(path), WATCH_MASK
+                    )
+                )
+                self._dirs[path] = wd
+                self._wds[wd] = path
+            key = path if filename is None else os.path.normpath(filename)
+            self._handlers.setdefault(key, []).append(handler)
+
+    def _notify(self, handlers, filename):
+        event = FileModifiedEvent(filename)
+        for handler in handlers:
+            try:
+                handler.on_modified(event)
+            except FileNotFoundError:
+                # The file was deleted or moved since the event
+                pass
+            except Exception:
+                # Keep the thread alive for the other events
+                log.exception(f"Error while handling a change to {filename}")
+
+    def _overflow(self):
+        # Events were lost, so every scheduled file may have changed
+        with self._lock:
+            keys = list(self._handlers.items())
+        for key, handlers in keys:
+            if key in self._dirs:
+                try:
+                    names = os.listdir(key)
+                except OSError:
+                    continue
+                for name in names:
+                    filename = os.path.join(key, name)
+                    if os.path.isfile(filename):
+                        self._notify(handlers, filename)
+            else:
+                self._notify(handlers, key)
+
+    def dispatch(self, data):
+        """Dispatch a batch of raw events, as read from inotify.
+
+        If the kernel's queue overflowed, all the scheduled files are
+        dispatched, since the changes to any of them may have been lost.
+        """
+        overflow = False
+        for wd, mask, name in parse_events(data):
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            elif mask & IN_IGNORED:
+                # The directory was deleted
+                with self._lock:
+                    path = self._wds.pop(wd, None)
+                    self._dirs.pop(path, None)
+                continue
+            directory = self._wds.get(wd)
+            if directory is None or not name:
+                continue
+            filename = os.path.join(directory, name)
+            handlers = self._handlers.get(filename) or self._handlers.get(
+                directory, ()
+            )
+            self._notify(handlers, filename)
+        if overflow:
+            self._overflow()
+
+    def _close(self):
+        os.close(self.fd)
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        poller.register(self._wake_r, select.POLLIN)
+        while True:
+            ready = {fd for fd, _ in poller.poll()}
+            if self._wake_r in ready:
+                break
+            try:
+                data = os.read(self.fd, _read_size)
+            except BlockingIOError:  # pragma: no cover
+                continue
+            self.dispatch(data)
+        self._close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._thread is None:
+            self._close()
+        else:
+            os.write(self._wake_w, b"x")
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import code
 import importlib
 import logging
@@ -13,9 +14,9 @@ import blessed
 from ovld import ovld
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
-from watchdog.observers.polling import PollingObserverVFS
 
-from . import codetools, runpy
+from . import codetools, forkserver, inotify, runpy, vcs
+from .poller import StatObserver
 from .register import registry
 from .utils import EventSource, glob_filter, or_filter
 from .version import version
@@ -79,33 +80,114 @@ def conservative_logger(event):
 
 
 class Watcher:
-    def __init__(self, registry, debounce=DEFAULT_DEBOUNCE, poll=False):
+    def __init__(
+        self,
+        registry,
+        debounce=DEFAULT_DEBOUNCE,
+        poll=False,
+        safepoint=None,
+        backend="watchdog",
+        poll_budget=None,
+        vcs_guard=True,
+        poll_idle=None,
+    ):
         if poll:
-            self.observer = PollingObserverVFS(
-                stat=os.stat, listdir=os.scandir, polling_interval=poll
+            self.observer = StatObserver(
+                poll, budget=poll_budget, idle_interval=poll_idle
             )
-        else:
+        elif backend == "inotify":
+            self.observer = inotify.InotifyObserver()
+        elif backend == "watchdog":
             self.observer = Observer()
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
         self.registry = registry
         self.registry.precache_activity.register(self.on_prepare)
         self.debounce = debounce
         self.poll = poll
+        self.safepoint = safepoint
+        if vcs_guard is True:
+            vcs_guard = vcs.VCSGuard()
+        self.vcs_guard = vcs_guard or None
+        self.loop = None
         self.prerun = EventSource()
         self.postrun = EventSource()
 
+    def attach_loop(self, loop=None):
+        """Apply changes in an asyncio event loop.
+
+        The observer thread only forwards file events to the loop, so that
+        the debounce uses the loop's timers and changes are applied between
+        the loop's callbacks, never while a task is running.
+
+        Arguments:
+            loop: The event loop to use, by default the running loop.
+        """
+        self.loop = loop or asyncio.get_running_loop()
+
     def on_prepare(self, module_name, filename):
         JuriggedHandler(self, filename).schedule(self.observer)
         self.registry.log(WatchOperation(filename))
 
-    def refresh(self, path):
-        cf = self.registry.get(path)
+    def _run(self, path, cf, update):
         try:
             self.prerun.emit(path, cf)
-            cf.refresh()
+            update()
             self.postrun.emit(path, cf)
         except Exception as exc:
             self.registry.log(exc)
 
+    def _call_later(self, delay, fn):
+        if self.loop is not None:
+            self.loop.call_later(delay, fn)
+        else:
+            timer = threading.Timer(delay, fn)
+            timer.daemon = True
+            timer.start()
+
+    def _wait_for_vcs(self, gitdir):
+        filenames = self.vcs_guard.release(gitdir)
+        if filenames is None:
+            self._call_later(
+                self.vcs_guard.interval, lambda: self._wait_for_vcs(gitdir)
+            )
+            return
+        self.registry.log(vcs.BatchOperation(gitdir, filenames))
+        for path in filenames:
+            self._refresh(path)
+
+    def refresh(self, path):
+        if self.vcs_guard is not None and (
+            deferred := self.vcs_guard.defer(path)
+        ):
+            # Git is writing to the repository, reload everything it changed
+            # once it is done
+            gitdir, first = deferred
+            if first:
+                self._call_later(
+                    self.vcs_guard.interval,
+                    lambda: self._wait_for_vcs(gitdir),
+                )
+            return
+        self._refresh(path)
+
+    def _refresh(self, path):
+        cf = self.registry.get(path)
+        if self.safepoint is None:
+            self._run(path, cf, cf.refresh)
+            return
+        # Parse now, but only apply the changes at the next safe point
+        try:
+            new = codetools.CodeFile(
+                path, source=cf.read_source(), module_name=cf.module_name
+            )
+        except Exception as exc:
+            self.registry.log(exc)
+        else:
+            self.safepoint.defer(
+                lambda: self._run(path, cf, lambda: cf.update(new))
+            )
+
     def start(self):
         self.observer.start()
 
@@ -128,6 +210,18 @@ class JuriggedHandler(FileSystemEventHandler):
         self.watcher.refresh(self.filename)
         self.timer = None
 
+    def _schedule(self):
+        loop = self.watcher.loop
+        if self.timer is not None:
+            self.timer.cancel()
+        if not self.watcher.debounce:
+            self._refresh()
+        elif loop is not None:
+            self.timer = loop.call_later(self.watcher.debounce, self._refresh)
+        else:
+            self.timer = threading.Timer(self.watcher.debounce, self._refresh)
+            self.timer.start()
+
     def on_modified(self, event):
         if event.src_path == self.normalized_filename:
             mtime = os.path.getmtime(event.src_path)
@@ -135,15 +229,14 @@ class JuriggedHandler(FileSystemEventHandler):
             # even though the mtime is the same
             if mtime != self.mtime:
                 self.mtime = mtime
-                if self.watcher.debounce:
-                    if self.timer is not None:
-                        self.timer.cancel()
-                    self.timer = threading.Timer(
-                        self.watcher.debounce, self._refresh
-                    )
-                    self.timer.start()
+                if (loop := self.watcher.loop) is None:
+                    self._schedule()
                 else:
-                    self._refresh()
+                    try:
+                        loop.call_soon_threadsafe(self._schedule)
+                    except RuntimeError:
+                        # The loop is closed
+                        pass
 
     on_created = on_modified
 
@@ -151,7 +244,12 @@ class JuriggedHandler(FileSystemEventHandler):
         # Watch the directory, because when watching a file, the watcher stops when
         # it is deleted and will not pick back up if the file is recreated. This happens
         # when some editors save.
-        observer.schedule(self, os.path.dirname(self.filename))
+        directory = os.path.dirname(self.filename)
+        if isinstance(observer, (inotify.InotifyObserver, StatObserver)):
+            # Events are matched to the filename directly
+            observer.schedule(self, directory, filename=self.filename)
+        else:
+            observer.schedule(self, directory)
 
 
 @ovld
@@ -176,19 +274,64 @@ def watch(
     autostart=True,
     debounce=DEFAULT_DEBOUNCE,
     poll=False,
+    safepoint=None,
+    backend="watchdog",
+    poll_budget=None,
+    vcs_guard=True,
+    background_log=False,
+    poll_idle=None,
 ):
     registry.auto_register(filter=to_filter(pattern))
-    registry.set_logger(logger)
+    registry.set_logger(logger, background=background_log)
     watcher = Watcher(
         registry,
         debounce=debounce,
         poll=poll,
+        safepoint=safepoint,
+        backend=backend,
+        poll_budget=poll_budget,
+        vcs_guard=vcs_guard,
+        poll_idle=poll_idle,
     )
     if autostart:
         watcher.start()
     return watcher
 
 
+async def awatch(
+    pattern="./*.py",
+    logger=default_logger,
+    registry=registry,
+    debounce=DEFAULT_DEBOUNCE,
+    poll=False,
+    backend="watchdog",
+    poll_budget=None,
+    vcs_guard=True,
+    background_log=False,
+    poll_idle=None,
+):
+    """Like watch, but changes are applied in the running event loop.
+
+    See Watcher.attach_loop.
+    """
+    watcher = watch(
+        pattern=pattern,
+        logger=logger,
+        registry=registry,
+        autostart=False,
+        debounce=debounce,
+        poll=poll,
+        backend=backend,
+        poll_budget=poll_budget,
+        vcs_guard=vcs_guard,
+        background_log=background_log,
+        poll_idle=poll_idle,
+    )
+    watcher.attach_loop()
+    watcher.start()
+    return watcher
+
+
 def _loop_module():  # pragma: no cover
     try:
         from . import loop
@@ -244,6 +387,19 @@ def find_runner(opts, pattern, prepare=None):  # pragma: no cover
         return mod, None
 
 
+def find_entry(opts):  # pragma: no cover
+    if opts.module:
+        module_name = opts.module[0].split(":", 1)[0]
+        spec = forkserver._find_spec(module_name)
+        if spec is not None and spec.submodule_search_locations:
+            spec = forkserver._find_spec(f"{module_name}.__main__")
+        return spec.origin if spec is not None and spec.has_location else None
+    elif opts.script:
+        return os.path.abspath(opts.script)
+    else:
+        return None
+
+
 def cli():  # pragma: no cover
     sys.path.insert(0, os.path.abspath(os.curdir))
 
@@ -277,6 +433,25 @@ def cli():  # pragma: no cover
         type=float,
         help="Poll for changes using the given interval",
     )
+    parser.add_argument(
+        "--poll-budget",
+        type=int,
+        help="Maximum number of files to check on each --poll interval",
+    )
+    parser.add_argument(
+        "--poll-idle",
+        type=float,
+        help=(
+            "Interval that --poll slows down to while nothing changes"
+            " (default: no slowdown)"
+        ),
+    )
+    parser.add_argument(
+        "--watch-backend",
+        choices=("watchdog", "inotify"),
+        default="watchdog",
+        help="How to watch for changes (inotify is Linux only)",
+    )
     parser.add_argument(
         "-m",
         dest="module",
@@ -294,10 +469,15 @@ def cli():  # pragma: no cover
     parser.add_argument(
         "--loop-interface",
         type=str,
-        choices=("rich", "basic"),
+        choices=("rich", "basic", "rich-fork", "basic-fork", "bench"),
         default="rich",
         help="Interface to use for --loop",
     )
+    parser.add_argument(
+        "--loop-profile",
+        action="store_true",
+        help="Profile each run of --loop and show the top functions",
+    )
     parser.add_argument(
         "--xloop",
         "-x",
@@ -305,6 +485,14 @@ def cli():  # pragma: no cover
         type=str,
         help="Name of the function(s) to loop on if they raise an error",
     )
+    parser.add_argument(
+        "--fork-server",
+        action="store_true",
+        help=(
+            "Import dependencies once and run the program in a forked child,"
+            " which is forked again when a change cannot be applied live"
+        ),
+    )
     parser.add_argument(
         "--verbose",
         "-v",
@@ -327,10 +515,11 @@ def cli():  # pragma: no cover
         "logger": default_logger if opts.verbose else conservative_logger,
         "debounce": opts.debounce or DEFAULT_DEBOUNCE,
         "poll": opts.poll,
+        "backend": opts.watch_backend,
+        "poll_budget": opts.poll_budget,
+        "poll_idle": opts.poll_idle,
     }
 
-    banner = ""
-
     if opts.version:
         print(version)
         sys.exit()
@@ -361,23 +550,43 @@ def cli():  # pragma: no cover
 
             for ref in opts.loop or []:
                 redirect_code(
-                    _getcode(ref), loopmod.loop(interface=opts.loop_interface)
+                    _getcode(ref),
+                    loopmod.loop(
+                        interface=opts.loop_interface,
+                        profile=opts.loop_profile,
+                    ),
                 )
 
             for ref in opts.xloop or []:
                 redirect_code(
-                    _getcode(ref), loopmod.xloop(interface=opts.loop_interface)
+                    _getcode(ref),
+                    loopmod.xloop(
+                        interface=opts.loop_interface,
+                        profile=opts.loop_profile,
+                    ),
                 )
 
-    mod, run = find_runner(opts, pattern, prepare=prepare)
-    watch(**watch_args)
+    def main():
+        mod, run = find_runner(opts, pattern, prepare=prepare)
+        watch(**watch_args)
 
-    if run is None:
-        banner = None
-        opts.interactive = True
+        if run is None:
+            banner = None
+            opts.interactive = True
+        else:
+            banner = ""
+            run()
+
+        if opts.interactive:
+            code.interact(banner=banner, local=vars(mod), exitmsg="")
+
+    if opts.fork_server:
+        watch_args["logger"] = forkserver.restart_on_error(watch_args["logger"])
+        # The files the program imports at startup, to wait on if the
+        # program fails after a restart
+        files = []
+        if entry := find_entry(opts):
+            forkserver.preload(entry, pattern, scanned=files)
+        sys.exit(forkserver.ForkServer(main, files=files).serve())
     else:
-        banner = ""
-        run()
-
-    if opts.interactive:
-        code.interact(banner=banner, local=vars(mod), exitmsg="")
+        main()
@@ -4,8 +4,14 @@ from types import SimpleNamespace
 
 from giving import give, given
 
-from .basic import BasicDeveloopRunner
-from .develoop import Develoop, DeveloopRunner, RedirectDeveloopRunner
+from ..memo import memoize
+from .basic import BasicDeveloopRunner, BasicForkDeveloopRunner
+from .develoop import (
+    Develoop,
+    DeveloopRunner,
+    ForkDeveloopRunner,
+    RedirectDeveloopRunner,
+)
 
 
 def keyword_decorator(deco):
@@ -27,7 +33,7 @@ def keyword_decorator(deco):
 
 
 @keyword_decorator
-def loop(fn, interface=None, only_on_error=False):
+def loop(fn, interface=None, only_on_error=False, **options):
     if interface is None:
         try:
             import rich  # noqa
@@ -40,12 +46,24 @@ def loop(fn, interface=None, only_on_error=False):
         from .richloop import RichDeveloopRunner
 
         interface = RichDeveloopRunner
+    elif interface == "rich-fork":
+        from .richloop import RichForkDeveloopRunner
+
+        interface = RichForkDeveloopRunner
     elif interface == "basic":
         interface = BasicDeveloopRunner
+    elif interface == "basic-fork":
+        interface = BasicForkDeveloopRunner
+    elif interface == "bench":
+        from .bench import BenchDeveloopRunner
+
+        interface = BenchDeveloopRunner
     elif isinstance(interface, str):
         raise Exception(f"Unknown develoop interface: '{interface}'")
 
-    return Develoop(fn, on_error=only_on_error, runner_class=interface)
+    return Develoop(
+        fn, on_error=only_on_error, runner_class=interface, **options
+    )
 
 
 loop_on_error = functools.partial(loop, only_on_error=True)
@@ -55,6 +73,7 @@ __ = SimpleNamespace(
     loop=loop,
     loop_on_error=loop_on_error,
     xloop=xloop,
+    memoize=memoize,
     give=give,
     given=given,
 )
@@ -66,10 +85,12 @@ def inject():
 
 __all__ = [
     "BasicDeveloopRunner",
+    "BasicForkDeveloopRunner",
     "loop",
     "loop_on_error",
     "xloop",
     "Develoop",
     "DeveloopRunner",
+    "ForkDeveloopRunner",
     "RedirectDeveloopRunner",
 ]
@@ -7,7 +7,12 @@ import tty
 from contextlib import contextmanager
 from functools import partial
 
-from .develoop import Abort, DeveloopRunner
+from .develoop import (
+    Abort,
+    DeveloopRunner,
+    ForkDeveloopRunner,
+    profile_deltas,
+)
 
 ANSI_ESCAPE = re.compile(r"\x1b\[[;\d]*[A-Za-z]")
 ANSI_ESCAPE_INNER = re.compile(r"[\x1b\[;\d]")
@@ -58,8 +63,8 @@ def read_chars():
 
 
 class BasicDeveloopRunner(DeveloopRunner):
-    def __init__(self, fn, args, kwargs):
-        super().__init__(fn, args, kwargs)
+    def __init__(self, fn, args, kwargs, profile=False):
+        super().__init__(fn, args, kwargs, profile=profile)
         self._status = "running"
         self._walltime = 0
 
@@ -121,6 +126,28 @@ class BasicDeveloopRunner(DeveloopRunner):
         def _(walltime):
             self._walltime = walltime
 
+        @_on("#profile")
+        def _(rows):
+            # profile_history does not contain this profile yet
+            previous = (
+                self.profile_history[-1] if self.profile_history else None
+            )
+            print(self._pad("PROFILE", 50))
+            print(
+                f"{'total':>8} {'change':>8} {'own':>8} {'calls':>7}  function"
+            )
+            for label, calls, own, total, delta in profile_deltas(
+                rows, previous
+            ):
+                print(
+                    f"{readable_duration(total):>8} {readable_delta(delta):>8}"
+                    f" {readable_duration(own):>8} {calls:>7}  {label}"
+                )
+
+
+class BasicForkDeveloopRunner(ForkDeveloopRunner, BasicDeveloopRunner):
+    pass
+
 
 def readable_duration(t):
     if t < 0.001:
@@ -140,3 +167,12 @@ def readable_duration(t):
         else:
             h = t // 3600
             return f"{h:.0f}h{m:.0f}m{s:.0f}s"
+
+
+def readable_delta(d):
+    if d is None:
+        return ""
+    elif abs(d) < 0.001:
+        return "~"
+    else:
+        return ("+" if d > 0 else "-") + readable_duration(abs(d))
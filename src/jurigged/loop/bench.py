@@ -0,0 +1,180 @@
+import math
+import statistics
+import time
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass
+
+from .basic import BasicDeveloopRunner
+from .develoop import givex
+
+DEFAULT_BUDGET = 1.0
+DEFAULT_MIN_RUNS = 5
+SIGNIFICANCE = 0.05
+# Smaller changes in the median are reported as noise, since with enough
+# runs, machine drift alone becomes statistically significant
+MIN_CHANGE = 0.02
+
+
+@dataclass
+class BenchStats:
+    times: list
+    memory: int
+
+    @property
+    def runs(self):
+        return len(self.times)
+
+    @property
+    def mean(self):
+        return statistics.fmean(self.times)
+
+    @property
+    def median(self):
+        return statistics.median(self.times)
+
+    @property
+    def stdev(self):
+        return statistics.stdev(self.times) if self.runs > 1 else 0.0
+
+
+def mann_whitney(xs, ys):
+    """Return the two-sided p-value of the Mann-Whitney U test.
+
+    Uses the normal approximation with a correction for ties, which is
+    reasonable from about 8 samples on each side. Returns None if either
+    sample has fewer than 2 elements.
+    """
+    n1, n2 = len(xs), len(ys)
+    if n1 < 2 or n2 < 2:
+        return None
+    n = n1 + n2
+    combined = sorted([(x, 0) for x in xs] + [(y, 1) for y in ys])
+    rank_sum = 0.0
+    ties = 0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        # Tied values share the average of their ranks (1-based)
+        rank = (i + j) / 2 + 1
+        rank_sum += rank * sum(1 for _, side in combined[i : j + 1] if not side)
+        t = j - i + 1
+        ties += t**3 - t
+        i = j + 1
+    u = rank_sum - n1 * (n1 + 1) / 2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = max(abs(u - n1 * n2 / 2) - 0.5, 0) / sigma
+    return 2 * (1 - statistics.NormalDist().cdf(z))
+
+
+def precise_duration(t):
+    # Three significant digits, with units down to nanoseconds
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if t >= scale:
+            return f"{t / scale:.3g}{unit}"
+    return f"{t / 1e-9:.3g}ns"
+
+
+def readable_size(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+
+
+def compare(new, old):
+    """Describe how new compares to old, as a string."""
+    p = mann_whitney(new.times, old.times)
+    change = new.median / old.median - 1 if old.median else 0.0
+    pstr = "" if p is None else f" (p={p:.3f})"
+    if p is None or p >= SIGNIFICANCE or abs(change) < MIN_CHANGE:
+        return f"no significant change{pstr}"
+    elif change < 0:
+        return f"faster by {-change:.1%}{pstr}"
+    else:
+        return f"slower by {change:.1%}{pstr}"
+
+
+class BenchDeveloopRunner(BasicDeveloopRunner):
+    """Develoop interface that benchmarks the function on each iteration.
+
+    The function is first run once to measure the memory it allocates, then
+    it is timed either repeat times or, if repeat is None, for as many runs
+    as fit in budget seconds (at least DEFAULT_MIN_RUNS). The timings are
+    compared to those of the previous iteration, i.e. the previous version
+    of the code.
+    """
+
+    def __init__(
+        self,
+        fn,
+        args,
+        kwargs,
+        repeat=None,
+        budget=DEFAULT_BUDGET,
+        profile=False,
+    ):
+        if repeat is not None and repeat < 1:
+            raise ValueError(f"repeat must be at least 1, not {repeat}")
+        super().__init__(fn, args, kwargs, profile=profile)
+        self.repeat = repeat
+        self.budget = budget
+        self.bench_history = deque(maxlen=2)
+
+    def _keep_going(self, times, end):
+        if self.repeat is not None:
+            return len(times) < self.repeat
+        return len(times) < DEFAULT_MIN_RUNS or time.perf_counter() < end
+
+    def call(self):
+        # Warmup run, which also measures memory
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        try:
+            result = super().call()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+
+        times = []
+        end = time.perf_counter() + self.budget
+        while self._keep_going(times, end):
+            t0 = time.perf_counter()
+            result = self.fn(*self.args, **self.kwargs)
+            times.append(time.perf_counter() - t0)
+
+        givex(bench=BenchStats(times=times, memory=peak - baseline))
+        return result
+
+    def _report(self, stats):
+        print(self._pad("BENCH", 50))
+        print(
+            f"runs: {stats.runs}"
+            f"   mean: {precise_duration(stats.mean)}"
+            f" ± {precise_duration(stats.stdev)}"
+            f"   median: {precise_duration(stats.median)}"
+            f"   min: {precise_duration(min(stats.times))}"
+        )
+        print(f"memory: {readable_size(stats.memory)} peak")
+        if self.bench_history:
+            num, previous = self.bench_history[-1]
+            print(f"vs #{num}: {compare(stats, previous)}")
+
+    def register_updates(self, gv):
+        super().register_updates(gv)
+
+        def _on(key):
+            return gv.getitem(key, strict=False).subscribe
+
+        @_on("#bench")
+        def _(stats):
+            self._report(stats)
+            self.bench_history.append((self.num, stats))
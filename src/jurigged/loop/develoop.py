@@ -1,13 +1,21 @@
+import cProfile
 import ctypes
 import linecache
+import os
+import pickle
+import signal
 import sys
 import threading
 import time
+import traceback
+from collections import defaultdict, deque
 from contextlib import contextmanager, redirect_stderr, redirect_stdout
 from queue import Queue
 from types import FunctionType
 from typing import Union
 
+import giving
+import reactivex
 from executing import Source
 from giving import SourceProxy, give, given
 from ovld import ovld
@@ -87,6 +95,82 @@ class Abort(Exception):
     pass
 
 
+DEFAULT_PROFILE_TOP = 20
+DEFAULT_PROFILE_HISTORY = 100
+
+# The functions defined in these directories run the develoop and send the
+# data the function gives, so they are left out of the profiles
+PROFILE_EXCLUDE = tuple(
+    os.path.dirname(mod.__file__) + os.sep
+    for mod in (sys.modules[__name__], giving, reactivex)
+)
+
+
+def code_label(code):
+    """Return a label for a code object, preferably its definition's path.
+
+    The registry is consulted so that a function edited through jurigged is
+    labelled with its definition even though its code object changed.
+    """
+    _, defn = registry.get_at(code.co_filename, code.co_firstlineno)
+    if defn is not None:
+        return defn.dotpath()
+    name = getattr(code, "co_qualname", code.co_name)
+    filename = os.path.basename(code.co_filename)
+    return f"{name} ({filename}:{code.co_firstlineno})"
+
+
+def _excluded_codes(entries):
+    # The code of the functions in PROFILE_EXCLUDE, and of the functions,
+    # e.g. pickle.dumps, that are only called from excluded functions
+    callers = defaultdict(set)
+    for entry in entries:
+        for sub in entry.calls or ():
+            callers[sub.code].add(entry.code)
+    excluded = {
+        entry.code
+        for entry in entries
+        if not isinstance(entry.code, str)
+        and entry.code.co_filename.startswith(PROFILE_EXCLUDE)
+    }
+    while True:
+        more = {
+            entry.code
+            for entry in entries
+            if entry.code not in excluded
+            and callers[entry.code]
+            and callers[entry.code] <= excluded
+        }
+        if not more:
+            return excluded
+        excluded |= more
+
+
+def profile_summary(prof, top=DEFAULT_PROFILE_TOP):
+    """Summarize a cProfile.Profile as (label, calls, own, total) rows.
+
+    The rows are sorted by total (cumulative) time, and only the top ones
+    are kept. The functions of the develoop and of giving, see
+    PROFILE_EXCLUDE, are left out, as well as the functions only they call.
+    """
+    entries = sorted(prof.getstats(), key=lambda e: e.totaltime, reverse=True)
+    excluded = _excluded_codes(entries)
+    rows = []
+    for entry in entries:
+        if entry.code in excluded:
+            continue
+        elif isinstance(entry.code, str):
+            if "_lsprof.Profiler" in entry.code:
+                continue
+            label = entry.code
+        else:
+            label = code_label(entry.code)
+        rows.append((label, entry.callcount, entry.inlinetime, entry.totaltime))
+        if len(rows) >= top:
+            break
+    return rows
+
+
 def kill_thread(thread, exctype=Abort):
     ctypes.pythonapi.PyThreadState_SetAsyncExc(
         ctypes.c_long(thread.ident), ctypes.py_object(exctype)
@@ -103,12 +187,34 @@ def watching_changes():
         registry.activity.remove(src._push)
 
 
+def profile_deltas(rows, previous=None):
+    """Add to each profile row the change in total time since previous.
+
+    The change is None for the functions that are not in the previous
+    profile, or for all of them if there is no previous profile.
+    """
+    before = {label: total for label, _, _, total in previous or ()}
+    return [
+        (
+            label,
+            calls,
+            own,
+            total,
+            total - before[label] if label in before else None,
+        )
+        for label, calls, own, total in rows
+    ]
+
+
 class DeveloopRunner:
-    def __init__(self, fn, args, kwargs):
+    def __init__(self, fn, args, kwargs, profile=False):
         self.fn = fn
         self.args = args
         self.kwargs = kwargs
         self.num = 0
+        self.profile = profile
+        # Profiles of the previous iterations, most recent last
+        self.profile_history = deque(maxlen=DEFAULT_PROFILE_HISTORY)
         self._q = Queue()
 
     def setcommand(self, cmd):
@@ -144,6 +250,15 @@ class DeveloopRunner:
     def register_updates(self, gv):
         raise NotImplementedError()
 
+    def call(self):
+        if not self.profile:
+            return self.fn(*self.args, **self.kwargs)
+        prof = cProfile.Profile()
+        try:
+            return prof.runcall(self.fn, *self.args, **self.kwargs)
+        finally:
+            givex(profile=profile_summary(prof))
+
     def run(self):
         self.num += 1
         outcome = [None, None]  # [result, error]
@@ -152,8 +267,9 @@ class DeveloopRunner:
             gv["?#result"] >> itemsetter(outcome, 0)
             gv["?#error"] >> itemsetter(outcome, 1)
             self.register_updates(gv)
+            gv["?#profile"] >> self.profile_history.append
             try:
-                givex(result=self.fn(*self.args, **self.kwargs), status="done")
+                givex(result=self.call(), status="done")
             except Abort:
                 givex(status="aborted")
                 raise
@@ -211,17 +327,141 @@ class RedirectDeveloopRunner(DeveloopRunner):
             yield
 
 
+class RemoteTraceback(Exception):
+    """Holds the formatted traceback of an error raised in a child process."""
+
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+class RemoteError(Exception):
+    """Stands for an error that could not be sent back from a child process."""
+
+
+def _roundtrips(x):
+    try:
+        pickle.loads(pickle.dumps(x))
+        return True
+    except Exception:
+        return False
+
+
+def _picklable(data):
+    if _roundtrips(data):
+        return data
+    return {
+        k: v if _roundtrips(v) else f"<unpicklable {pstr(v)}>"
+        for k, v in data.items()
+    }
+
+
+class ForkDeveloopRunner(DeveloopRunner):
+    """Runs each iteration in a forked child process.
+
+    The child inherits the already imported and patched state of the parent.
+    Everything it gives, including the result or error, is sent back to the
+    parent through a pipe, and re-given there. Aborting the iteration kills
+    the child, which works even if it is stuck in native code.
+
+    This is meant to be combined with a runner that defines the interface,
+    e.g. RichForkDeveloopRunner or BasicForkDeveloopRunner.
+    """
+
+    def __init__(self, *args, **kwargs):
+        if not hasattr(os, "fork"):  # pragma: no cover
+            raise Exception("ForkDeveloopRunner requires os.fork")
+        super().__init__(*args, **kwargs)
+        self._child_pid = None
+
+    def command(self, name, aborts=False):
+        def perform(_=None):
+            if aborts and (pid := self._child_pid) is not None:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            self.setcommand(name)
+
+        return perform
+
+    def _child(self, w):
+        try:
+            with os.fdopen(w, "wb") as out, given() as gv:
+
+                @gv.subscribe
+                def _(data):
+                    pickle.dump(_picklable(data), out)
+                    out.flush()
+
+                with self.wrap_run():
+                    t0 = time.time()
+                    try:
+                        givex(result=self.call(), status="done")
+                    except Exception as error:
+                        tb = traceback.format_exception(
+                            type(error), error, error.__traceback__
+                        )
+                        if not _roundtrips(error):
+                            error = RemoteError(
+                                f"{type(error).__name__}: {error}"
+                            )
+                        givex(
+                            error=error, traceback="".join(tb), status="error"
+                        )
+                    givex(walltime=time.time() - t0)
+        finally:
+            # Never return to the caller's stack in the child process
+            os._exit(0)
+
+    def run(self):
+        self.num += 1
+        outcome = [None, None]  # [result, error]
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            os.close(r)
+            self._child(w)
+        os.close(w)
+        self._child_pid = pid
+        with given() as gv, os.fdopen(r, "rb") as inp:
+            gv["?#result"] >> itemsetter(outcome, 0)
+            gv["?#error"] >> itemsetter(outcome, 1)
+            self.register_updates(gv)
+            gv["?#profile"] >> self.profile_history.append
+            while True:
+                try:
+                    data = pickle.load(inp)
+                except (EOFError, pickle.UnpicklingError):
+                    # The child is done or was killed
+                    break
+                if tb := data.pop("#traceback", None):
+                    # Exceptions lose their __cause__ when pickled
+                    data["#error"].__cause__ = RemoteTraceback(tb)
+                give(**data)
+            _, status = os.waitpid(pid, 0)
+            self._child_pid = None
+            if os.WIFSIGNALED(status):
+                givex(status="aborted")
+        return outcome
+
+
 class Develoop:
-    def __init__(self, fn, on_error, runner_class):
+    def __init__(self, fn, on_error, runner_class, **options):
         self.fn = fn
         self.on_error = on_error
         self.runner_class = runner_class
+        # Options for the runner, e.g. profile=True
+        self.options = options
 
     def __get__(self, obj, cls):
         return type(self)(
             self.fn.__get__(obj, cls),
             on_error=self.on_error,
             runner_class=self.runner_class,
+            **self.options,
         )
 
     def __call__(self, *args, **kwargs):
@@ -232,4 +472,5 @@ class Develoop:
             except Exception as _exc:
                 exc = _exc
 
-        return self.runner_class(self.fn, args, kwargs).loop(from_error=exc)
+        runner = self.runner_class(self.fn, args, kwargs, **self.options)
+        return runner.loop(from_error=exc)
@@ -1,14 +1,21 @@
+import os
 import re
 import sys
+import tempfile
+import threading
+import time
+import weakref
 from collections import deque
 from contextlib import contextmanager
-from dataclasses import dataclass
+from functools import lru_cache
+from itertools import count
+from typing import NamedTuple
 
 import reactivex as rx
 from giving import ObservableProxy
 from pygments import token
 from rich._loop import loop_last
-from rich.cells import cell_len
+from rich.cells import cell_len, get_character_cell_size
 from rich.console import Console, Group
 from rich.constrain import Constrain
 from rich.highlighter import ReprHighlighter
@@ -23,10 +30,26 @@ from rich.text import Text
 from rich.theme import Theme
 from rich.traceback import Traceback
 
-from .basic import ANSI_ESCAPE, cbreak, read_chars, readable_duration
-from .develoop import RedirectDeveloopRunner, itemappender, kill_thread
+from .basic import (
+    ANSI_ESCAPE,
+    cbreak,
+    read_chars,
+    readable_delta,
+    readable_duration,
+)
+from .develoop import (
+    ForkDeveloopRunner,
+    RedirectDeveloopRunner,
+    itemappender,
+    kill_thread,
+    profile_deltas,
+)
 
 REAL_STDOUT = sys.stdout
+# Same as ANSI_ESCAPE, but the escapes are kept when splitting
+ANSI_ESCAPE_SPLIT = re.compile(f"({ANSI_ESCAPE.pattern})")
+DEFAULT_SCROLLBACK = 10_000
+DEFAULT_MAX_FPS = 30
 TEMP_CONSOLE = Console(color_system="standard")
 
 
@@ -96,15 +119,20 @@ class TracebackNoFrame(Traceback):
                     )
 
 
+@lru_cache(maxsize=4096)
+def raw_cell_len(text):
+    """Number of cells taken by text, ignoring ANSI escapes."""
+    return cell_len(ANSI_ESCAPE.sub("", text))
+
+
 class RawSegment(Segment):
     @property
     def cell_length(self):
         assert not self.control
-        return cell_len(re.sub(ANSI_ESCAPE, "", self.text))
+        return raw_cell_len(self.text)
 
 
-@dataclass
-class Line:
+class Line(NamedTuple):
     text: str = ""
     length: int = 0
 
@@ -112,86 +140,183 @@ class Line:
         return bool(self.text)
 
 
+def _fit(text, avail):
+    """Return how many characters of text fit in avail cells, and their width."""
+    if text.isascii():
+        n = min(len(text), avail)
+        return n, n
+    if (width := cell_len(text)) <= avail:
+        return len(text), width
+    width = 0
+    for i, c in enumerate(text):
+        w = get_character_cell_size(c)
+        if width + w > avail:
+            return i, width
+        width += w
+    return len(text), width
+
+
 def breakline(line, limit=80, initial=Line()):
+    """Wrap line to limit cells, keeping ANSI escapes out of the count.
+
+    The first line continues initial, a Line that may already be partially
+    filled.
+    """
     if not line:
         yield initial
         return
 
-    parts = [
-        (x, i % 2 == 1)
-        for i, x in enumerate(re.split(pattern=ANSI_ESCAPE, string=line))
-    ]
-    current_line = initial.text
-    avail = limit - initial.length
-    work = deque(parts)
-    while work:
-        part, escape = work.popleft()
-        if escape:
-            current_line += part
-        else:
-            if not avail:
-                ok, extra = "", part
-            else:
-                ok, extra = part[:avail], part[avail:]
-            avail -= len(ok)
-            current_line += ok
-            if extra:
-                work.appendleft((extra, False))
-                yield Line(current_line, limit - avail)
-                current_line = ""
-                avail = limit
-    if current_line:
-        yield Line(current_line, limit - avail)
+    parts = [initial.text]
+    length = initial.length
+    # The split alternates between text and escape sequences
+    for i, part in enumerate(ANSI_ESCAPE_SPLIT.split(line)):
+        if i % 2:
+            parts.append(part)
+            continue
+        while part:
+            n, width = _fit(part, limit - length)
+            if n == 0 and length == 0:
+                # Too wide to fit even on an empty line, e.g. a wide
+                # character with limit=1, so we let it overflow
+                n, width = 1, get_character_cell_size(part[0])
+            if n:
+                parts.append(part[:n])
+                length += width
+                part = part[n:]
+            if part:
+                yield Line("".join(parts), length)
+                parts = []
+                length = 0
+    if text := "".join(parts):
+        yield Line(text, length)
 
 
 class TerminalLines:
-    def __init__(self, title, border="white", border_highlight="bold yellow"):
+    """Scrollable pane of wrapped lines, keeping at most scrollback lines.
+
+    If spill is True, all text added to the pane is also written to a
+    temporary file, so that the full output remains available after the
+    oldest lines are dropped. The file keeps the output of all the runs.
+    It is kept after the program exits, so that it can be read once the
+    session is over, and only close() deletes it.
+    """
+
+    def __init__(
+        self,
+        title,
+        border="white",
+        border_highlight="bold yellow",
+        scrollback=DEFAULT_SCROLLBACK,
+        spill=False,
+    ):
+        if scrollback < 1:
+            raise ValueError(f"scrollback must be at least 1, not {scrollback}")
         self.title = title
         self.border = border
         self.border_highlight = border_highlight
+        self.scrollback = scrollback
+        # Held by the threads that write to the pane, and while it is rendered
+        self.lock = threading.RLock()
+        self.dirty = True
+        self.rendered = None
+        self.rendered_key = None
         self.height = 0
         self.width = 80
         self.window_size = 1
+        self.spill_file = (
+            tempfile.NamedTemporaryFile(
+                mode="w",
+                prefix=f"jurigged-{title}-",
+                suffix=".log",
+                delete=False,
+            )
+            if spill
+            else None
+        )
+        # Flush the file when the pane is collected, or at exit
+        self._finalizer = (
+            weakref.finalize(self, self.spill_file.close) if spill else None
+        )
         self.clear()
 
     def set_at_end(self):
         self.at_end = self.start >= (len(self) - self.window_size)
 
-    def add(self, text):
-        line1, *lines = text.split("\n")
-        self.lines[-1:] = breakline(
-            line1, limit=self.width, initial=self.lines[-1]
-        )
+    def _push(self, lines):
         for line in lines:
-            self.lines += breakline(line, limit=self.width)
+            if len(self.lines) == self.scrollback:
+                # The deque will drop the first line to make room
+                self.dropped += 1
+                self.start = max(0, self.start - 1)
+            self.lines.append(line)
+
+    def add(self, text):
+        with self.lock:
+            if self.spill_file is not None:
+                self.spill_file.write(text)
+            line1, *lines = text.split("\n")
+            self._push(
+                breakline(line1, limit=self.width, initial=self.lines.pop())
+            )
+            for line in lines:
+                self._push(breakline(line, limit=self.width))
+            self.dirty = True
         return self
 
     def clear(self):
-        self.lines = [Line()]
-        self.start = 0
-        self.at_end = True
+        with self.lock:
+            self.lines = deque([Line()], maxlen=self.scrollback)
+            self.dropped = 0
+            self.start = 0
+            self.at_end = True
+            self.dirty = True
+            if self.spill_file is not None and self.spill_file.tell():
+                # Keep the output of the previous runs
+                self.spill_file.write("\n--- rerun ---\n")
+
+    def close(self):
+        """Delete the spill file, if any."""
+        if self._finalizer is not None and self._finalizer.alive:
+            self._finalizer()
+            os.unlink(self.spill_file.name)
 
     def shift(self, n, mode):
-        if mode == "line":
-            self.start = max(0, self.start + n)
-        elif mode == "screen":
-            self.start = max(0, self.start + n * self.window_size)
-        elif mode == "whole":
-            self.start = max(0, self.start + n * len(self))
-        self.set_at_end()
+        with self.lock:
+            if mode == "line":
+                self.start = max(0, self.start + n)
+            elif mode == "screen":
+                self.start = max(0, self.start + n * self.window_size)
+            elif mode == "whole":
+                self.start = max(0, self.start + n * len(self))
+            self.set_at_end()
+            self.dirty = True
+
+    def subtitle(self):
+        if not self.dropped:
+            return None
+        elif self.spill_file is not None:
+            return f"{self.dropped} lines dropped, see {self.spill_file.name}"
+        else:
+            return f"{self.dropped} lines dropped"
 
     def __len__(self):
         # We don't count the last line if it is empty
         return len(self.lines) - 1 + bool(self.lines[-1])
 
     def __rich_console__(self, console, options):
+        if self.spill_file is not None:
+            self.spill_file.flush()
+        n = len(self)
+        window = max(0, self.window_size)
         if self.at_end:
-            self.start = len(self)
-        self.start = max(0, min(self.start, len(self) - self.window_size))
-        for i, line in enumerate(self.lines[self.start : len(self)]):
-            yield RawSegment(line.text)
-            if i < len(self) - 1:
+            self.start = n
+        self.start = max(0, min(self.start, n - window))
+        # Only render the visible window. Indexing a deque is fast near
+        # either end, which is where the window usually is.
+        for i in range(self.start, min(n, self.start + window)):
+            if i > self.start:
                 yield Segment.line()
+            yield RawSegment(self.lines[i].text)
 
     __iadd__ = add
 
@@ -206,6 +331,10 @@ class StackedTerminalLines:
         self.width = width
         self.focus = None
 
+    @property
+    def dirty(self):
+        return any(b.dirty for b in self.boxes)
+
     def __getitem__(self, item):
         return self.box_map[item]
 
@@ -252,23 +381,48 @@ class StackedTerminalLines:
         for b in boxes:
             b.window_size = b.height - 2
 
+    def render_box(self, console, options, box, focused):
+        # Reuse the segments rendered in the previous frame unless the box
+        # changed or must be laid out differently. The box is locked while it
+        # is rendered, so that the writes of other threads are not lost.
+        key = (options.max_width, box.height, focused)
+        with box.lock:
+            if not box.dirty and box.rendered_key == key:
+                return box.rendered
+            box.dirty = False
+            if focused:
+                title = f"[bold]{box.title}"
+                style = box.border_highlight
+            else:
+                title = box.title
+                style = box.border
+            panel = Panel(
+                box,
+                title=title,
+                subtitle=box.subtitle(),
+                height=box.height,
+                border_style=style,
+            )
+            box.rendered = console.render_lines(panel, options, new_lines=True)
+            box.rendered_key = key
+            return box.rendered
+
     def __rich_console__(self, console, options):
         self.distribute_heights()
         for i, box in enumerate(self.boxes):
             if box.height:
-                if i == self.focus:
-                    title = f"[bold]{box.title}"
-                    style = box.border_highlight
-                else:
-                    title = box.title
-                    style = box.border
-                yield Panel(
-                    box, title=title, height=box.height, border_style=style
-                )
+                for line in self.render_box(
+                    console, options, box, i == self.focus
+                ):
+                    yield from line
+            else:
+                # Nothing to show
+                with box.lock:
+                    box.dirty = False
 
 
 class Dash:
-    def __init__(self, *parts):
+    def __init__(self, *parts, max_fps=DEFAULT_MAX_FPS):
         self.console = Console(color_system="standard", file=REAL_STDOUT)
         self.lv = Live(
             auto_refresh=False,
@@ -280,13 +434,31 @@ class Dash:
         self.stack = StackedTerminalLines(
             parts, self.lv.console.height - 2, width=self.lv.console.width - 4
         )
-        self.header = Text("<header>")
-        self.footer = Text("<footer>")
+        self.frame_interval = 1 / max_fps
+        self._last_frame = 0
+        self._timer = None
+        self._lock = threading.RLock()
+        self.clear()
 
     def clear(self):
         self.stack.clear()
         self.header = Text("<header>")
         self.footer = Text("<footer>")
+        self._header_source = None
+        self._footer_source = None
+        self.dirty = True
+
+    def set_header(self, source):
+        if source != self._header_source:
+            self._header_source = source
+            self.header = markup(source)
+            self.dirty = True
+
+    def set_footer(self, source):
+        if source != self._footer_source:
+            self._footer_source = source
+            self.footer = markup(source)
+            self.dirty = True
 
     def shifter(self, n, mode):
         def shift(_=None):
@@ -300,26 +472,57 @@ class Dash:
                 self.stack.move_focus(n)
             else:
                 raise Exception(f"Unknown mode: {mode}")
+            self.dirty = True
             self.update()
 
         return shift
 
+    def _deferred_update(self):
+        with self._lock:
+            self._timer = None
+        self.update()
+
     def update(self):
-        self.lv.update(
-            Group(self.header, self.stack, self.footer), refresh=True
-        )
+        with self._lock:
+            if not self.dirty and not self.stack.dirty:
+                return
+            # Cap the frame rate, but make sure the last update is drawn
+            delay = self._last_frame + self.frame_interval - time.monotonic()
+            if delay > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(delay, self._deferred_update)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._last_frame = time.monotonic()
+            self.dirty = False
+            self.lv.update(
+                Group(self.header, self.stack, self.footer), refresh=True
+            )
 
     def run(self):
         return self.lv
 
 
 class RichDeveloopRunner(RedirectDeveloopRunner):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.dash = Dash(
-            TerminalLines(title="stdout"),
+    def __init__(
+        self,
+        fn,
+        args,
+        kwargs,
+        scrollback=DEFAULT_SCROLLBACK,
+        spill=False,
+        profile=False,
+    ):
+        super().__init__(fn, args, kwargs, profile=profile)
+        panes = [
+            TerminalLines(title="stdout", scrollback=scrollback, spill=spill),
             TerminalLines(
-                title="stderr", border="red", border_highlight="bold red"
+                title="stderr",
+                border="red",
+                border_highlight="bold red",
+                scrollback=scrollback,
+                spill=spill,
             ),
             TerminalLines(title="given"),
             TerminalLines(
@@ -328,7 +531,16 @@ class RichDeveloopRunner(RedirectDeveloopRunner):
             TerminalLines(
                 title="result", border="cyan", border_highlight="bold cyan"
             ),
-        )
+        ]
+        if profile:
+            panes.append(
+                TerminalLines(
+                    title="profile",
+                    border="yellow",
+                    border_highlight="bold yellow",
+                )
+            )
+        self.dash = Dash(*panes)
 
     def _update(self):
         wall = (
@@ -342,22 +554,77 @@ class RichDeveloopRunner(RedirectDeveloopRunner):
             and "[bold](a)[/bold]bort",
             "[bold](q)[/bold]uit",
         ]
-        self.dash.header = markup(f"Looping on: [bold]{self.signature()}")
-        self.dash.footer = markup(" | ".join(x for x in footer if x))
-
-        if self._gvn:
-            self.dash.stack["given"].clear()
-            table = Table.grid(padding=(0, 3, 0, 0))
-            table.add_column("key", style="bold green")
-            table.add_column("value")
-            for k, v in self._gvn.items():
-                table.add_row(k, Pretty(v))
-            with TEMP_CONSOLE.capture() as cap:
-                TEMP_CONSOLE.print(table)
-            self.dash.stack["given"].add(cap.get())
+        self.dash.set_header(f"Looping on: [bold]{self.signature()}")
+        self.dash.set_footer(" | ".join(x for x in footer if x))
+
+        if self._gvn_changed:
+            self._gvn_changed = False
+            self._render_given(self.dash.stack["given"])
 
         self.dash.update()
 
+    def _render_given(self, pane):
+        # Each row is rendered separately with a fixed key width and the
+        # width of the pane, so that the rows that did not change since the
+        # last frame can be reused. When the only changes are new variables,
+        # their rows are appended to the pane instead of redrawing it.
+        # The rows are cached with the number of the give they show, which
+        # changes even if the same object is given again after a mutation.
+        gvn = dict(self._gvn)
+        layout = (max(len(k) for k in gvn), pane.width)
+        keywidth, width = layout
+        if layout != self._gvn_layout:
+            self._gvn_layout = layout
+            self._gvn_rows.clear()
+        rows = self._gvn_rows
+        append = all(
+            k in rows and rows[k][0] == gvn[k][0] for k in self._gvn_shown
+        )
+        parts = []
+        for k, (num, v) in gvn.items():
+            if (cached := rows.get(k)) is None or cached[0] != num:
+                table = Table.grid(padding=(0, 3, 0, 0))
+                table.add_column("key", style="bold green", width=keywidth)
+                table.add_column("value")
+                table.add_row(k, Pretty(v))
+                with TEMP_CONSOLE.capture() as cap:
+                    TEMP_CONSOLE.print(table, width=width)
+                cached = rows[k] = (num, cap.get())
+            parts.append(cached[1])
+        if append:
+            pane.add("".join(parts[len(self._gvn_shown) :]))
+        else:
+            pane.clear()
+            pane.add("".join(parts))
+        self._gvn_shown = list(gvn)
+
+    def _render_profile(self, rows):
+        # profile_history does not contain this profile yet
+        previous = self.profile_history[-1] if self.profile_history else None
+        table = Table.grid(padding=(0, 2, 0, 0))
+        table.add_column("total", justify="right", style="bold")
+        table.add_column("change", justify="right")
+        table.add_column("own", justify="right")
+        table.add_column("calls", justify="right")
+        table.add_column("function", style="bold green")
+        table.add_row(
+            "total", "change", "own", "calls", "function", style="dim"
+        )
+        for label, calls, own, total, delta in profile_deltas(rows, previous):
+            change = readable_delta(delta)
+            if delta is not None and abs(delta) >= 0.001:
+                change = Text(change, style="red" if delta > 0 else "green")
+            table.add_row(
+                readable_duration(total),
+                change,
+                readable_duration(own),
+                str(calls),
+                label,
+            )
+        with TEMP_CONSOLE.capture() as cap:
+            TEMP_CONSOLE.print(table)
+        return cap.get()
+
     @contextmanager
     def wrap_loop(self):
         with self.dash.run(), cbreak():
@@ -405,6 +672,11 @@ class RichDeveloopRunner(RedirectDeveloopRunner):
         self._status = "running"
         self._walltime = 0
         self._gvn = {}
+        self._gvn_rows = {}
+        self._gvn_layout = None
+        self._gvn_shown = []
+        self._gvn_count = count()
+        self._gvn_changed = False
 
         # Append stdout/stderr incrementally
         gv["?#stdout"] >> itemappender(self.dash.stack, "stdout")
@@ -442,16 +714,19 @@ class RichDeveloopRunner(RedirectDeveloopRunner):
         def _(walltime):
             self._walltime = walltime
 
+        @_on("#profile")
+        def _(rows):
+            self.dash.stack["profile"].add(self._render_profile(rows))
+
         # Fill given table
         @gv.subscribe
         def _(d):
-            self._gvn.update(
-                {
-                    k: v
-                    for k, v in d.items()
-                    if not k.startswith("#") and not k.startswith("$")
-                }
-            )
+            for k, v in d.items():
+                if not k.startswith("#") and not k.startswith("$"):
+                    # The new number makes the cached row stale, without
+                    # touching the cache, which the render thread writes to
+                    self._gvn[k] = (next(self._gvn_count), v)
+                    self._gvn_changed = True
 
         # TODO: this may be a bit wasteful
         # Debounce is used to ignore events if they are followed by another
@@ -463,3 +738,7 @@ class RichDeveloopRunner(RedirectDeveloopRunner):
         )
 
         self._update()
+
+
+class RichForkDeveloopRunner(ForkDeveloopRunner, RichDeveloopRunner):
+    pass
@@ -0,0 +1,153 @@
+import functools
+import weakref
+from collections import deque
+from types import FunctionType, MethodType, ModuleType
+
+from .register import registry as default_registry
+
+_missing = object()
+
+
+def _code_names(code):
+    names = list(code.co_names)
+    for ct in code.co_consts:
+        if hasattr(ct, "co_names"):
+            names += _code_names(ct)
+    return names
+
+
+def _unwrap(obj):
+    while True:
+        if isinstance(obj, Memoized):
+            obj = obj.fn
+        elif isinstance(obj, MethodType):
+            obj = obj.__func__
+        elif isinstance(obj, FunctionType) and hasattr(obj, "__wrapped__"):
+            obj = obj.__wrapped__
+        else:
+            return obj
+
+
+def dependencies(fn, registry=default_registry):
+    """Return what the result of fn may depend on.
+
+    The result is a list of (holder, name, value) triples, for the code of
+    fn and of the functions it transitively refers to, and for the globals,
+    closure variables and module or class attributes these functions refer
+    to by name. Only functions defined in files known to the registry are
+    followed, since jurigged cannot change the others.
+    """
+    root = _unwrap(fn)
+    deps = []
+    seen = set()
+    todo = deque([root])
+    watched = (registry.precache, registry.cache)
+
+    while todo:
+        f = _unwrap(todo.popleft())
+        if not isinstance(f, FunctionType) or f in seen:
+            continue
+        seen.add(f)
+        code = f.__code__
+        if f is not root and not any(
+            code.co_filename in files for files in watched
+        ):
+            continue
+        deps.append((f, "__code__", code))
+        names = _code_names(code)
+
+        for name in names:
+            value = f.__globals__.get(name, _missing)
+            deps.append((f.__globals__, name, value))
+            if isinstance(value, (type, ModuleType)):
+                for attr in names:
+                    attrvalue = value.__dict__.get(attr, _missing)
+                    deps.append((value, attr, attrvalue))
+                    todo.append(attrvalue)
+            else:
+                todo.append(value)
+
+        for cell in f.__closure__ or ():
+            try:
+                value = cell.cell_contents
+            except ValueError:
+                value = _missing
+            deps.append((cell, "cell_contents", value))
+            todo.append(value)
+
+    return deps
+
+
+def _same(deps1, deps2):
+    return len(deps1) == len(deps2) and all(
+        h1 is h2 and n1 == n2 and v1 is v2
+        for (h1, n1, v1), (h2, n2, v2) in zip(deps1, deps2)
+    )
+
+
+def _stale_marker(ref):
+    def listener(*args, **kwargs):
+        if (memo := ref()) is not None:
+            memo._stale = True
+
+    return listener
+
+
+class Memoized:
+    """Cache the results of a function until its code or dependencies change.
+
+    Results are keyed on the arguments, which must be hashable; calls with
+    unhashable arguments are not cached. The cache is emptied when the
+    registry reports a change to the code of the function, to the code of a
+    function it calls, or to a global they refer to.
+    """
+
+    def __init__(self, fn, registry=default_registry):
+        self.fn = fn
+        self.registry = registry
+        self.cache = {}
+        self._deps = []
+        self._stale = True
+        functools.update_wrapper(self, fn)
+        # The listener only holds a weak reference, so that the registry
+        # does not keep the cache alive, and it is removed with the cache
+        listener = _stale_marker(weakref.ref(self))
+        registry.activity.register(listener)
+        weakref.finalize(self, registry.activity.remove, listener)
+
+    def clear(self):
+        self.cache.clear()
+
+    def __get__(self, obj, cls):
+        return self if obj is None else MethodType(self, obj)
+
+    def __call__(self, *args, **kwargs):
+        if self._stale:
+            self._stale = False
+            deps = dependencies(self.fn, self.registry)
+            if not _same(deps, self._deps):
+                self.cache.clear()
+            self._deps = deps
+
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable arguments
+            return self.fn(*args, **kwargs)
+        result = self.cache[key] = self.fn(*args, **kwargs)
+        return result
+
+
+def memoize(fn=None, *, registry=default_registry):
+    """Memoize fn across code changes.
+
+    The cached results of fn are kept until jurigged changes fn, a function
+    it calls, or a global they use, so that reruns only recompute what
+    changed. Can be used as @memoize or @memoize(registry=...).
+    """
+    if fn is None:
+        return lambda fn: Memoized(fn, registry=registry)
+    return Memoized(fn, registry=registry)
@@ -1,8 +1,7 @@
 import ast
+import symtable
 from dataclasses import dataclass, field, replace as dc_replace
 
-from ovld import ovld, recurse
-
 
 @dataclass
 class Variables:
@@ -23,65 +22,123 @@ class Variables:
         )
 
 
-@ovld
-def variables(seq: list, mapping):
-    fvs = Variables()
-    for node in seq:
-        fvs = fvs | recurse(node, mapping)
-    return fvs
-
-
-@ovld
-def variables(node: (ast.FunctionDef, ast.AsyncFunctionDef), mapping):
-    fvs = (
-        recurse(node.body, mapping)
-        | recurse(node.args.args, mapping)
-        | recurse(node.args.posonlyargs, mapping)
-        | recurse(node.args.kwonlyargs, mapping)
-        | recurse(node.args.kwarg, mapping)
-        | recurse(node.args.vararg, mapping)
-    )
-    mapping[node] = fvs
-    outer = (
-        recurse(node.decorator_list, mapping)
-        | recurse(node.args.defaults, mapping)
-        | recurse(node.args.kw_defaults, mapping)
-    )
-    return outer | Variables(assigned={node.name}, read=fvs.free)
-
-
-@ovld
-def variables(node: ast.ClassDef, mapping):
-    fvs = recurse(node.body, mapping) | Variables(assigned={"__class__"})
-    mapping[node] = fvs
-    outer = recurse(node.decorator_list, mapping)
-    return outer | Variables(assigned={node.name}, read=fvs.free)
-
-
-@ovld
-def variables(node: ast.arg, mapping):
-    return Variables(assigned={node.arg})
-
-
-@ovld
-def variables(node: ast.Name, mapping):
-    if isinstance(node.ctx, ast.Load):
-        read = {node.id}
-        if node.id == "super":
-            read.add("__class__")
-        return Variables(read=read)
-    elif isinstance(node.ctx, ast.Store):
-        return Variables(assigned={node.id})
-    else:
-        return Variables(read={node.id})
-
-
-@ovld
-def variables(node: ast.AST, mapping):
-    return recurse(list(ast.iter_child_nodes(node)), mapping)
-
-
-@ovld  # pragma: no cover
-def variables(thing: object, mapping):
-    # Just in case
-    return Variables()
+class VariablesCollector(ast.NodeVisitor):
+    """Collect assigned and read variables in a single pass.
+
+    Names are accumulated in place into the Variables of the innermost
+    function or class being visited. The Variables of each function and
+    class are stored in ``mapping``, keyed by node.
+    """
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.current = Variables()
+        self._dispatch = {}
+
+    def visit(self, node):
+        # Same as NodeVisitor.visit, but the method lookup is cached by type
+        cls = type(node)
+        method = self._dispatch.get(cls)
+        if method is None:
+            method = getattr(self, f"visit_{cls.__name__}", self.generic_visit)
+            self._dispatch[cls] = method
+        method(node)
+
+    def generic_visit(self, node):
+        for child in ast.iter_child_nodes(node):
+            self.visit(child)
+
+    def _visit_all(self, nodes):
+        for node in nodes:
+            if node is not None:
+                self.visit(node)
+
+    def _visit_scope(self, node, nodes, assigned=()):
+        outer, self.current = self.current, Variables(assigned=set(assigned))
+        self._visit_all(nodes)
+        inner, self.current = self.current, outer
+        self.mapping[node] = inner
+        return inner
+
+    def visit_FunctionDef(self, node):
+        args = node.args
+        inner = self._visit_scope(
+            node,
+            [
+                *node.body,
+                *args.args,
+                *args.posonlyargs,
+                *args.kwonlyargs,
+                args.kwarg,
+                args.vararg,
+            ],
+        )
+        self._visit_all(node.decorator_list)
+        self._visit_all(args.defaults)
+        self._visit_all(args.kw_defaults)
+        self.current.assigned.add(node.name)
+        self.current.read.update(inner.free)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        inner = self._visit_scope(node, node.body, assigned=("__class__",))
+        self._visit_all(node.decorator_list)
+        self.current.assigned.add(node.name)
+        self.current.read.update(inner.free)
+
+    def visit_arg(self, node):
+        self.current.assigned.add(node.arg)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Store):
+            self.current.assigned.add(node.id)
+        else:
+            read = self.current.read
+            read.add(node.id)
+            if node.id == "super" and isinstance(node.ctx, ast.Load):
+                read.add("__class__")
+
+
+def variables(node, mapping):
+    """Return the Variables of node.
+
+    The Variables of every function and class definition inside node are
+    also stored in mapping.
+    """
+    collector = VariablesCollector(mapping)
+    collector._visit_all(node if isinstance(node, list) else [node])
+    return collector.current
+
+
+def free_variables(source, filename="<unknown>"):
+    """Return the exact free variables of every function in source.
+
+    The result maps (name, lineno) to the list of the free variable sets
+    of the functions with that name and line number, in source order.
+    """
+    results = {}
+
+    def visit(table):
+        if table.get_type() == "function":
+            key = (table.get_name(), table.get_lineno())
+            results.setdefault(key, []).append(set(table.get_frees()))
+        for child in table.get_children():
+            visit(child)
+
+    visit(symtable.symtable(source, filename, "exec"))
+    return results
+
+
+def fill_closures(source, mapping, filename="<unknown>"):
+    """Set the closure of each function's Variables in mapping.
+
+    The closure is the set of free variables as determined by the
+    compiler's own symbol table analysis, which accounts for global and
+    nonlocal declarations, class scopes, comprehensions, type parameters,
+    and so on.
+    """
+    frees = free_variables(source, filename)
+    for node in sorted(mapping, key=lambda n: (n.lineno, n.col_offset)):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            mapping[node].closure = frees[node.name, node.lineno].pop(0)
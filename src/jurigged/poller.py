@@ -0,0 +1,127 @@
+"""File observer that polls the watched files with os.stat.
+
+Unlike watchdog's polling observer, which takes a snapshot of every entry of
+every watched directory on each interval, it only stats the files that were
+scheduled, which are the files in the registry. It implements the same subset
+of watchdog's Observer interface as InotifyObserver.
+"""
+
+import os
+import threading
+
+from .inotify import FileModifiedEvent
+
+
+def _signature(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class StatObserver:
+    """Poll files with os.stat and call on_modified on their handlers.
+
+    Arguments:
+        interval: The interval between polls, in seconds, when files have
+            changed recently.
+        budget: The maximum number of files to stat on each poll, or None to
+            stat all of them. Files are polled in turns when there are more.
+        idle_interval: The interval the polls slow down to when nothing
+            changes. The interval doubles on every poll without changes until
+            it reaches idle_interval. Defaults to interval, i.e. the polls
+            do not slow down.
+
+    With n files, a change is noticed within ceil(n / budget) polls, which
+    is ceil(n / budget) * idle_interval seconds at worst, after a pause.
+    """
+
+    def __init__(self, interval, budget=None, idle_interval=None):
+        self.interval = interval
+        self.budget = budget
+        self.idle_interval = (
+            interval if idle_interval is None else idle_interval
+        )
+        self.current_interval = interval
+        self._lock = threading.Lock()
+        self._files = {}
+        self._order = []
+        self._cursor = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def schedule(self, handler, path, filename=None):
+        """Call handler.on_modified when filename changes.
+
+        The path argument is accepted for compatibility with watchdog's
+        observers, but only files are polled, so filename is required.
+        """
+        if filename is None:
+            raise TypeError("StatObserver can only watch files")
+        filename = os.path.normpath(filename)
+        with self._lock:
+            if filename not in self._files:
+                self._files[filename] = [_signature(filename), []]
+                self._order.append(filename)
+            self._files[filename][1].append(handler)
+
+    def _batch(self):
+        with self._lock:
+            n = len(self._order)
+            if self.budget is None or self.budget >= n:
+                return list(self._order)
+            start = self._cursor % n
+            batch = self._order[start : start + self.budget]
+            batch += self._order[: self.budget - len(batch)]
+            self._cursor = start + self.budget
+            return batch
+
+    def poll(self):
+        """Stat the next batch of files and dispatch the changes.
+
+        Returns whether any file changed.
+        """
+        changed = False
+        for filename in self._batch():
+            entry = self._files[filename]
+            sig = _signature(filename)
+            if sig == entry[0]:
+                continue
+            entry[0] = sig
+            if sig is None:
+                # The file was deleted; it is reported if it comes back
+                continue
+            changed = True
+            event = FileModifiedEvent(filename)
+            for handler in entry[1]:
+                try:
+                    handler.on_modified(event)
+                except FileNotFoundError:
+                    # The file was deleted since it was polled
+                    pass
+        if changed:
+            self.current_interval = self.interval
+        else:
+            self.current_interval = min(
+                self.current_interval * 2, self.idle_interval
+            )
+        return changed
+
+    def _run(self):
+        while not self._stopped.wait(self.current_interval):
+            self.poll()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
@@ -3,24 +3,121 @@ import textwrap
 from ast import _splitlines_no_ff as splitlines
 from contextlib import contextmanager
 from itertools import count
-
-from .codetools import CodeFile, CodeFileOperation, LineDefinition, ModuleCode
+from types import FunctionType
+
+from .codetools import (
+    ClassDefinition,
+    CodeFile,
+    CodeFileOperation,
+    FunctionDefinition,
+    LineDefinition,
+    ModuleCode,
+)
 from .register import registry
 from .utils import EventSource
 
 _count = count(1)
 
+# Virtual files that are in linecache, oldest first, with the CodeFile they
+# patch, if any
+_virtual_files = {}
+_released = 0
+
+MAX_VIRTUAL_FILES = 1000
+
 
 class OutOfSyncException(Exception):
     pass
 
 
-def virtual_file(name, contents):
+def virtual_file(name, contents, codefile=None):
+    """Put contents in linecache under a new filename and return it.
+
+    With codefile, code compiled with the filename is found in codefile by
+    the registry, and the file is released by collect_virtual_files once no
+    function in codefile uses it anymore. At most MAX_VIRTUAL_FILES are kept,
+    and the oldest are released first.
+    """
     filename = f"<{name}#{next(_count)}>"
     linecache.cache[filename] = (None, None, splitlines(contents), filename)
+    _virtual_files[filename] = codefile
+    if codefile is not None:
+        registry.cache[filename] = codefile
+    if len(_virtual_files) > MAX_VIRTUAL_FILES:
+        collect_virtual_files()
+        while len(_virtual_files) > MAX_VIRTUAL_FILES:
+            release_virtual_file(next(iter(_virtual_files)))
     return filename
 
 
+def release_virtual_file(filename):
+    global _released
+    codefile = _virtual_files.pop(filename)
+    linecache.cache.pop(filename, None)
+    if codefile is not None and registry.cache.get(filename) is codefile:
+        del registry.cache[filename]
+    _released += 1
+
+
+def _functions_in(value):
+    # The functions a module or class attribute holds directly
+    if isinstance(value, (staticmethod, classmethod)):
+        value = value.__func__
+    if isinstance(value, property):
+        return [f for f in (value.fget, value.fset, value.fdel) if f]
+    return [value] if isinstance(value, FunctionType) else []
+
+
+def _used_filenames(cf):
+    # The files of the code of the functions defined in cf, and of the
+    # functions held by its module and classes. The latter include the
+    # lambdas and closures created by module-level statements and class
+    # bodies, which have no definition of their own.
+    used = set()
+    for defn in cf.root.walk():
+        if isinstance(defn, FunctionDefinition):
+            if (co := defn.get_object()) is not None:
+                used.add(co.co_filename)
+        elif isinstance(defn, (ModuleCode, ClassDefinition)):
+            if (obj := defn.get_object()) is not None:
+                ns = obj if isinstance(obj, dict) else vars(obj)
+                for value in list(ns.values()):
+                    for fn in _functions_in(value):
+                        used.add(fn.__code__.co_filename)
+    return used
+
+
+def collect_virtual_files(codefile=None):
+    """Release the virtual files that no function uses anymore.
+
+    Only the files that patch codefile are checked, or all the files that
+    patch a CodeFile if codefile is None.
+    """
+    owners = {
+        id(cf): cf
+        for cf in _virtual_files.values()
+        if cf is not None and (codefile is None or cf is codefile)
+    }
+    used = set().union(*map(_used_filenames, owners.values()))
+    for filename, cf in list(_virtual_files.items()):
+        if id(cf) in owners and filename not in used:
+            release_virtual_file(filename)
+
+
+def virtual_file_stats():
+    """Return the number of virtual files held, their total number of lines,
+    and the number that were released so far."""
+    return {
+        "files": len(_virtual_files),
+        "lines": sum(
+            len(linecache.cache[f][2])
+            for f in _virtual_files
+            if f in linecache.cache
+        ),
+        "released": _released,
+    }
+
+
 class Recoder:
     def __init__(self, name, codefile, deletable=False, focus=None):
         self.name = name
@@ -48,13 +145,12 @@ class Recoder:
     def _patching(self, new_code):
         new_code = new_code.strip()
 
-        filename = virtual_file(self.name, new_code)
+        filename = virtual_file(self.name, new_code, codefile=self.codefile)
         cf = CodeFile(
             filename=filename,
             source=new_code,
             module_name=self.codefile.module_name,
         )
-        registry.cache[filename] = self.codefile
 
         yield cf
 
@@ -63,6 +159,8 @@ class Recoder:
             cf, allow_deletions=self.deletable and self.focus and [self.focus]
         )
         self.watched = [*same, *changes, *additions]
+        # Release the files of previous patches that were entirely replaced
+        collect_virtual_files(self.codefile)
         self.set_status("live")
         self._current_patch = new_code
         self._listening = True
@@ -7,6 +7,8 @@ from types import CodeType, FunctionType, ModuleType
 
 from ovld import OvldMC, ovld
 
+from .bundle import PatchBundle
+from .callgraph import CallGraph
 from .codetools import CodeFile, FunctionDefinition
 from .utils import EventSource, glob_filter
 
@@ -21,11 +23,37 @@ class Registry(metaclass=OvldMC):
         self.precache = {}
         # Cache of CodeFile (lazy)
         self.cache = {}
-        self.precache_activity = EventSource(save_history=True)
+        # Watchers that start later are told about each file once
+        self.precache_activity = EventSource(
+            save_history=True,
+            history_key=lambda module_name, filename: filename,
+        )
         self.activity = EventSource()
         self._log = None
-
-    def set_logger(self, log):
+        self.log_events = None
+        self._callgraph = None
+
+    @property
+    def callgraph(self):
+        """Index of the dependencies between definitions, built lazily."""
+        if self._callgraph is None:
+            self._callgraph = CallGraph(self)
+        return self._callgraph
+
+    def set_logger(self, log, background=False):
+        """Set the function that is called with changes and errors.
+
+        With background=True, it is called in a background thread, so that
+        a slow logger does not delay reloads.
+        """
+        if self.log_events is not None:
+            self.log_events.stop()
+        if background:
+            self.log_events = EventSource(background=True)
+            self.log_events.register(log)
+            log = self.log_events.emit
+        else:
+            self.log_events = None
         self._log = log
 
     def log(self, *args, **kwargs):
@@ -126,6 +154,23 @@ class Registry(metaclass=OvldMC):
 
         return add_sniffer(prep)
 
+    @ovld
+    def apply_bundle(self, bundle: PatchBundle):
+        """Apply the changes in a PatchBundle, without reading any source.
+
+        Operations on modules that are not imported are skipped, and errors
+        are sent to the logger.
+        """
+        bundle.apply(self)
+
+    @ovld
+    def apply_bundle(self, data: bytes):
+        self.apply_bundle(PatchBundle.loads(data))
+
+    @ovld
+    def apply_bundle(self, filename: str):
+        self.apply_bundle(PatchBundle.load(filename))
+
     @ovld
     def find(self, module: ModuleType):
         self.prepare(module.__name__, module.__file__)
@@ -1,6 +1,11 @@
 import ast
+import inspect
 import io
 import types
+import warnings
+import weakref
+
+from codefind import code_registry as codereg
 
 
 def split_script(script):  # pragma: no cover
@@ -49,22 +54,137 @@ def split_script(script):  # pragma: no cover
     )
 
 
+_target = "____jurigged_target"
+
 redirector = """
-def {name}(*args, **kwargs):
-    return ____jurigged_wrapped_{name}(*args, **kwargs)
+def ____jurigged_make_redirector():
+    {freevars} = None
+
+    def {name}({params}):
+        if False:
+            {freevars}
+        return "{target}"({args})
+
+    return {name}
+"""
+
+# Used instead when there are no free variables to reference
+redirector_plain = """
+def {name}({params}):
+    return "{target}"({args})
 """
 
+# Functions redirected by redirect(), mapped to the stack of their
+# _Redirections
+_redirected = weakref.WeakKeyDictionary()
 
-def redirector_code(name):
-    """Return a code object that calls a global with a certain name.
 
-    That code object is meant to be patched onto an existing function so that it
-    can redirect to something else.
+def redirector_code(code, target):
+    """Return a code object with the signature of code that calls target.
+
+    The parameters are passed through as they are, without repacking unless
+    code itself takes *args or **kwargs. The code object has the same free
+    variables as code, so that it can be patched onto any function that
+    uses code.
+
+    target is embedded in the constants of the code object, which makes the
+    call as direct as possible. It is written as a string literal in the
+    generated source, which is then replaced by the actual target.
     """
+    nargs = code.co_argcount
+    nposonly = code.co_posonlyargcount
+    names = code.co_varnames
+    pos = names[:nargs]
+    kwonly = names[nargs : nargs + code.co_kwonlyargcount]
+    rest = iter(names[nargs + len(kwonly) :])
+    varargs = next(rest) if code.co_flags & inspect.CO_VARARGS else None
+    varkw = next(rest) if code.co_flags & inspect.CO_VARKEYWORDS else None
+
+    params = [*pos[:nposonly], *(["/"] if nposonly else []), *pos[nposonly:]]
+    args = list(pos)
+    if varargs:
+        params.append(f"*{varargs}")
+        args.append(f"*{varargs}")
+    elif kwonly:
+        params.append("*")
+    params += kwonly
+    args += [f"{k}={k}" for k in kwonly]
+    if varkw:
+        params.append(f"**{varkw}")
+        args.append(f"**{varkw}")
+
+    template = redirector if code.co_freevars else redirector_plain
+    source = template.format(
+        name=code.co_name,
+        params=", ".join(params),
+        args=", ".join(args),
+        freevars=" = ".join(code.co_freevars),
+        target=_target,
+    )
     glb = {}
-    exec(redirector.format(name=name), glb)
-    fn = glb[name]
-    return fn.__code__
+    with warnings.catch_warnings():
+        # Calling a string literal warns that it is not callable
+        warnings.simplefilter("ignore", SyntaxWarning)
+        exec(compile(source, "<redirect>", "exec"), glb)
+    if code.co_freevars:
+        new_code = glb["____jurigged_make_redirector"]().__code__
+    else:
+        new_code = glb[code.co_name].__code__
+    consts = tuple(target if c == _target else c for c in new_code.co_consts)
+    names = {"co_name": code.co_name}
+    if hasattr(code, "co_qualname"):  # pragma: no cover
+        names["co_qualname"] = code.co_qualname
+    return new_code.replace(
+        co_consts=consts,
+        co_filename=code.co_filename,
+        co_firstlineno=code.co_firstlineno,
+        **names,
+    )
+
+
+class _Redirection:
+    """Keep the trampoline of a redirected function in sync with its code.
+
+    codefind finds this object through the code object it holds (hence the
+    __slots__) and calls __conform__ when jurigged changes that code, so that
+    the trampoline gets the new signature and defaults.
+    """
+
+    __slots__ = ("code", "saved", "target", "trampoline", "active")
+
+    def __init__(self, saved, target):
+        self.code = saved.__code__
+        self.saved = saved
+        self.target = target
+        self.trampoline = redirector_code(self.code, target)
+        self.active = True
+
+    def __conform__(self, new):
+        if not self.active or new is None:
+            return
+        if isinstance(new, types.FunctionType):
+            defaults, kwdefaults = new.__defaults__, new.__kwdefaults__
+            new = new.__code__
+        else:
+            defaults = self.saved.__defaults__
+            kwdefaults = self.saved.__kwdefaults__
+        self.code = new
+        codereg.functions[new].add(self)
+        old, self.trampoline = (
+            self.trampoline,
+            redirector_code(new, self.target),
+        )
+        # Conforming the old trampoline updates the function it is on, or
+        # the Redirection of a redirect that was stacked over this one
+        fn = types.FunctionType(
+            self.trampoline,
+            {},
+            new.co_name,
+            defaults,
+            tuple(types.CellType() for _ in new.co_freevars) or None,
+        )
+        fn.__kwdefaults__ = kwdefaults
+        codereg.conform(old, fn)
 
 
 def redirect(orig, transform):
@@ -72,7 +192,8 @@ def redirect(orig, transform):
 
     The __code__ pointer of the function will be patched to redirect to a decorated
     version of the function. That way, all existing pointers for the function will
-    use the decorated version.
+    use the decorated version. The redirection follows the changes jurigged makes
+    to the function, and it can be undone with unredirect.
     """
     saved = types.FunctionType(
         orig.__code__,
@@ -81,10 +202,32 @@ def redirect(orig, transform):
         orig.__defaults__,
         orig.__closure__,
     )
-    name = orig.__name__
-    new_code = redirector_code(name)
-    orig.__code__ = new_code
-    orig.__globals__[f"____jurigged_wrapped_{name}"] = transform(saved)
+    saved.__kwdefaults__ = orig.__kwdefaults__
+    redirection = _Redirection(saved, transform(saved))
+    fns = codereg.functions[saved.__code__]
+    fns.discard(orig)
+    fns.update((saved, redirection))
+    orig.__code__ = redirection.trampoline
+    _redirected.setdefault(orig, []).append(redirection)
+
+
+def unredirect(fn):
+    """Undo the last redirect of fn.
+
+    The function gets back the code it had before, or its new version if it
+    was changed by jurigged in the meantime.
+    """
+    stack = _redirected.get(fn)
+    if not stack:
+        raise Exception(f"{fn} is not redirected.")
+    redirection = stack.pop()
+    if not stack:
+        del _redirected[fn]
+    redirection.active = False
+    saved = redirection.saved
+    fn.__code__ = saved.__code__
+    fn.__defaults__ = saved.__defaults__
+    fn.__kwdefaults__ = saved.__kwdefaults__
 
 
 def redirect_code(code, transform):
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Number of wait times to keep
+MAX_WAITS = 1000
+
+
+class SafePoint:
+    """Defer changes until the application is not handling requests.
+
+    Changes are computed when they are found, but applied later: if auto is
+    True, as soon as no ``request()`` block is running, otherwise only when
+    ``checkpoint()`` is called. In auto mode, new requests wait for pending
+    changes to be applied, so that a steady stream of requests cannot delay
+    them forever.
+
+    Attributes:
+        waits: The number of seconds each of the last changes waited for.
+        applied: The number of changes that were applied.
+    """
+
+    def __init__(self, auto=True):
+        self.auto = auto
+        self.waits = deque(maxlen=MAX_WAITS)
+        self.applied = 0
+        self._cond = threading.Condition()
+        self._active = 0
+        self._pending = deque()
+        # Depth of the request() blocks of each thread
+        self._local = threading.local()
+
+    @property
+    def pending(self):
+        """The number of changes waiting to be applied."""
+        return len(self._pending)
+
+    @property
+    def max_wait(self):
+        return max(self.waits, default=0.0)
+
+    def _apply(self):
+        # The lock must be held
+        while self._pending:
+            queued, fn = self._pending.popleft()
+            self.waits.append(time.perf_counter() - queued)
+            self.applied += 1
+            try:
+                fn()
+            except Exception:
+                # Do not fail the request, nor hold back the other changes
+                log.exception("Error while applying a deferred change")
+        self._cond.notify_all()
+
+    def defer(self, fn):
+        """Call fn at the next safe point."""
+        with self._cond:
+            self._pending.append((time.perf_counter(), fn))
+            if self.auto and not self._active:
+                self._apply()
+
+    def checkpoint(self):
+        """Apply pending changes once no request() block is running.
+
+        This must not be called from inside a request() block.
+        """
+        with self._cond:
+            while self._active:
+                self._cond.wait()
+            self._apply()
+
+    @contextmanager
+    def request(self):
+        """Mark a block during which changes must not be applied.
+
+        Blocks can be nested. A nested block does not wait for pending
+        changes, since they cannot be applied before the outer block ends.
+        """
+        depth = getattr(self._local, "depth", 0)
+        with self._cond:
+            while self.auto and self._pending and not depth:
+                self._cond.wait()
+            self._active += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            with self._cond:
+                self._active -= 1
+                if not self._active:
+                    if self.auto:
+                        self._apply()
+                    else:
+                        self._cond.notify_all()
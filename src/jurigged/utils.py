@@ -1,27 +1,146 @@
+import atexit
 import fnmatch
+import itertools
+import logging
 import os
+import queue
+import threading
+import time
 import types
+from dataclasses import dataclass
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class ListenerStats:
+    calls: int = 0
+    errors: int = 0
+    time: float = 0.0
 
 
 class EventSource(list):
-    def __init__(self, *, save_history=False):
+    """List of listeners to call with the arguments of emit.
+
+    Arguments:
+        save_history: Whether to save the arguments of each emit, to call
+            listeners that register later with them.
+        history_key: Function of the arguments of emit. Only the arguments
+            of the last emit with a given key are saved.
+        history_size: Maximum number of emits to save. The oldest are
+            dropped first.
+        background: Whether to call the listeners in a background thread,
+            in the order of the emits. The thread is started on the first
+            emit and is stopped by stop(), or at exit. An exception in a
+            listener is passed to on_error and does not prevent the others
+            from being called, and the calls, errors and time of each
+            listener are counted in the stats dictionary.
+        on_error: Function called with the listener and the exception when
+            a listener fails in the background. By default, the exception
+            is logged.
+    """
+
+    def __init__(
+        self,
+        *,
+        save_history=False,
+        history_key=None,
+        history_size=None,
+        background=False,
+        on_error=None,
+    ):
         if save_history:
-            self._history = []
+            self._history = {}
         else:
             self._history = None
+        self._history_key = history_key
+        self._history_size = history_size
+        self._count = itertools.count()
+        self.background = background
+        self.on_error = on_error
+        self.stats = {}
+        self._queue = None
+        self._thread = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
 
     def register(self, listener, apply_history=True):
         if self._history and apply_history:
-            for args, kwargs in self._history:
+            for args, kwargs in list(self._history.values()):
                 listener(*args, **kwargs)
         self.append(listener)
         return listener
 
     def emit(self, *args, **kwargs):
-        for listener in self:
-            listener(*args, **kwargs)
+        if self.background:
+            self._enqueue(args, kwargs)
+        else:
+            for listener in self:
+                listener(*args, **kwargs)
         if self._history is not None:
-            self._history.append((args, kwargs))
+            if self._history_key is None:
+                key = next(self._count)
+            else:
+                key = self._history_key(*args, **kwargs)
+                # Move the key to the end, as the most recent
+                self._history.pop(key, None)
+            self._history[key] = (args, kwargs)
+            if (
+                self._history_size is not None
+                and len(self._history) > self._history_size
+            ):
+                del self._history[next(iter(self._history))]
+
+    def join(self):
+        """Wait until the listeners were called for every emit so far."""
+        if self._queue is not None and self._worker_pid == os.getpid():
+            self._queue.join()
+
+    def stop(self):
+        """Call the listeners for the pending emits and stop the thread."""
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                return
+            self._queue.put(None)
+            self._thread.join()
+            self._queue = self._thread = self._worker_pid = None
+            atexit.unregister(self.stop)
+
+    def _enqueue(self, args, kwargs):
+        if self._worker_pid != os.getpid():
+            with self._lock:
+                # Start the worker, or restart it in a forked process,
+                # which does not inherit the thread
+                if self._worker_pid != os.getpid():
+                    self._queue = queue.Queue()
+                    self._worker_pid = os.getpid()
+                    self._thread = threading.Thread(
+                        target=self._work, args=(self._queue,), daemon=True
+                    )
+                    self._thread.start()
+                    # Do not lose the pending emits at exit
+                    atexit.register(self.stop)
+        self._queue.put((args, kwargs))
+
+    def _work(self, q):
+        while (item := q.get()) is not None:
+            args, kwargs = item
+            for listener in list(self):
+                stats = self.stats.setdefault(listener, ListenerStats())
+                start = time.perf_counter()
+                try:
+                    listener(*args, **kwargs)
+                except Exception as exc:
+                    stats.errors += 1
+                    if self.on_error is None:
+                        log.error(
+                            "Error in listener %r", listener, exc_info=exc
+                        )
+                    else:
+                        self.on_error(listener, exc)
+                stats.calls += 1
+                stats.time += time.perf_counter() - start
+            q.task_done()
 
 
 def glob_filter(pattern):
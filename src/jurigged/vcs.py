@@ -0,0 +1,138 @@
+"""Detect git operations, to reload the files they change in one batch.
+
+When git checks out a branch, merges or rebases, it rewrites many files
+while it holds the index lock. Reloading each file as soon as it changes
+would apply a partially written tree, so the Watcher defers the changes made
+while a repository is busy and applies them together once git is done.
+
+A rebase, cherry-pick or revert of several commits takes the locks once per
+commit, and releases them in between. While the state directory of such an
+operation exists, the repository stays busy for a short while after the
+locks are released, so that the commits are reloaded as one batch. When the
+operation stops, e.g. on a conflict, the locks are not taken again, and the
+changes are reloaded once that delay is over.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+# Files that exist while git is writing to the working tree
+GIT_LOCKS = ("index.lock", "HEAD.lock")
+# Directories that exist while git is applying a sequence of commits
+GIT_SEQUENCES = ("rebase-merge", "rebase-apply", "sequencer")
+
+DEFAULT_INTERVAL = 0.05
+# A lock left behind by a git process that crashed should not pause
+# reloads forever
+DEFAULT_TIMEOUT = 30
+# How long a sequence of commits keeps the repository busy after the locks
+# are released, which must be longer than the time between two commits
+DEFAULT_SETTLE = 0.5
+
+
+@dataclass
+class BatchOperation:
+    gitdir: str
+    filenames: list
+
+    def __str__(self):
+        return f"Reload {len(self.filenames)} file(s) changed by git"
+
+
+def find_git_dir(directory):
+    """Return the git directory of the repository directory is in, or None.
+
+    A .git file, as found in worktrees and submodules, is followed to the
+    directory it points to.
+    """
+    while True:
+        dotgit = os.path.join(directory, ".git")
+        if os.path.isdir(dotgit):
+            return dotgit
+        if os.path.isfile(dotgit):
+            with open(dotgit) as f:
+                contents = f.read().strip()
+            if contents.startswith("gitdir:"):
+                gitdir = contents[len("gitdir:") :].strip()
+                return os.path.normpath(os.path.join(directory, gitdir))
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+class VCSGuard:
+    """Hold back the changes to files in repositories git is writing to.
+
+    Arguments:
+        interval: How often to check whether git is done, in seconds.
+        timeout: How long to wait for git, in seconds, after which the
+            changes are applied anyway.
+        settle: How long a rebase, cherry-pick or revert in progress keeps
+            the repository busy after git releases its locks, in seconds.
+    """
+
+    def __init__(
+        self,
+        interval=DEFAULT_INTERVAL,
+        timeout=DEFAULT_TIMEOUT,
+        settle=DEFAULT_SETTLE,
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.settle = settle
+        self._gitdirs = {}
+        self._pending = {}
+        self._locked = {}
+        self._lock = threading.Lock()
+
+    def gitdir(self, filename):
+        directory = os.path.dirname(os.path.abspath(filename))
+        if directory not in self._gitdirs:
+            self._gitdirs[directory] = find_git_dir(directory)
+        return self._gitdirs[directory]
+
+    def busy(self, gitdir):
+        """Whether git is writing to the repository of gitdir."""
+        now = time.monotonic()
+        if any(os.path.exists(os.path.join(gitdir, x)) for x in GIT_LOCKS):
+            self._locked[gitdir] = now
+            return True
+        since = self._locked.get(gitdir)
+        return (
+            since is not None
+            and now - since < self.settle
+            and any(
+                os.path.isdir(os.path.join(gitdir, x)) for x in GIT_SEQUENCES
+            )
+        )
+
+    def defer(self, filename):
+        """Defer filename if git is writing to its repository.
+
+        Returns None if filename should be reloaded now. Otherwise, returns
+        a (gitdir, first) tuple, where first is True for the first file
+        deferred for gitdir, for which release(gitdir) should be polled.
+        """
+        gitdir = self.gitdir(filename)
+        if gitdir is None:
+            return None
+        with self._lock:
+            if gitdir in self._pending:
+                self._pending[gitdir][1][filename] = None
+                return gitdir, False
+            if not self.busy(gitdir):
+                return None
+            self._pending[gitdir] = (time.monotonic(), {filename: None})
+            return gitdir, True
+
+    def release(self, gitdir):
+        """Return the files deferred for gitdir once git is done, else None."""
+        with self._lock:
+            since, filenames = self._pending[gitdir]
+            if self.busy(gitdir) and time.monotonic() - since < self.timeout:
+                return None
+            del self._pending[gitdir]
+            return list(filenames)
@@ -88,6 +88,42 @@ class TemporaryModule:
         return __import__(mname)
 
 
+class LiveModule:
+    """Import a snippet as a new module, prepared in a registry for edits."""
+
+    def __init__(self, snippet, registry=None):
+        from jurigged.register import Registry
+
+        self.tmod = TemporaryModule()
+        self.name, self.path = self.tmod.transfer(snippet)
+        self.module = __import__(self.name)
+        self.registry = Registry() if registry is None else registry
+        self.registry.prepare(self.name, self.path)
+
+    def write(self, old, new):
+        """Replace the first occurrence of old in the module's file."""
+        with open(self.path) as f:
+            src = f.read()
+        assert old in src
+        self.tmod.write(f"{self.name}.py", src.replace(old, new, 1))
+
+    def edit(self, old, new):
+        """Replace old in the module's file and refresh the module."""
+        self.write(old, new)
+        self.registry.get(self.path).refresh()
+
+
+def wait_until(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end, "Timed out"
+        time.sleep(0.01)
+
+
+def op_kinds(bundle):
+    return [(op.kind, op.path) for op in bundle.operations]
+
+
 def catalogue(root):
     cat = {}
     for entry in root.walk():
@@ -0,0 +1,8 @@
+sound = "global"
+
+
+class Lemur:
+    sound = "class"
+
+    def call(self):
+        return sound + "!"
@@ -0,0 +1,27 @@
+calls = []
+SCALE = 2
+
+
+def helper(n):
+    return list(range(n))
+
+
+def load(n):
+    calls.append("load")
+    return helper(n)
+
+
+def process(n):
+    calls.append("process")
+    return [x * SCALE + Thing.BONUS for x in load(n)]
+
+
+class Thing:
+    BONUS = 0
+
+    def __init__(self, factor):
+        self.factor = factor
+
+    def compute(self, n):
+        calls.append("compute")
+        return n * self.factor
@@ -0,0 +1,24 @@
+SCALE = 2
+
+
+def f(x):
+    return x * SCALE
+
+
+def g(x, y=1):
+    return x + y
+
+
+def adder(x):
+    def add(y):
+        return x + y
+
+    return add
+
+
+class Thing:
+    def compute(self):
+        return 1
+
+    def other(self):
+        return 2
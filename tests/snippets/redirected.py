@@ -0,0 +1,13 @@
+def f(x, y=1):
+    return x + y
+
+
+def adder(x):
+    def add(y):
+        return x + y
+
+    return add
+
+
+def g(x):
+    return x
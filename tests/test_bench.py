@@ -0,0 +1,83 @@
+import pytest
+
+from jurigged.loop.bench import (
+    MIN_CHANGE,
+    SIGNIFICANCE,
+    BenchDeveloopRunner,
+    BenchStats,
+    compare,
+    mann_whitney,
+)
+
+
+def _f():
+    return 1
+
+
+@pytest.mark.parametrize("repeat", [0, -1])
+def test_repeat_invalid(repeat):
+    with pytest.raises(ValueError, match="repeat must be at least 1"):
+        BenchDeveloopRunner(_f, (), {}, repeat=repeat)
+
+
+@pytest.mark.parametrize("repeat", [None, 1, 10])
+def test_repeat_valid(repeat):
+    runner = BenchDeveloopRunner(_f, (), {}, repeat=repeat)
+    assert runner.repeat == repeat
+
+
+def test_mann_whitney_identical():
+    xs = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]
+    assert mann_whitney(xs, list(xs)) == pytest.approx(1.0, abs=0.01)
+
+
+def test_mann_whitney_separated():
+    xs = [1.0 + i * 0.01 for i in range(10)]
+    ys = [2.0 + i * 0.01 for i in range(10)]
+    assert mann_whitney(xs, ys) < SIGNIFICANCE
+    assert mann_whitney(ys, xs) == pytest.approx(mann_whitney(xs, ys))
+
+
+def test_mann_whitney_ties():
+    # Only ties: the variance is zero
+    assert mann_whitney([1.0] * 5, [1.0] * 5) == 1.0
+
+
+def test_mann_whitney_few_samples():
+    assert mann_whitney([1.0], [1.0, 2.0]) is None
+    assert mann_whitney([1.0, 2.0], []) is None
+
+
+def _stats(times):
+    return BenchStats(times=times, memory=0)
+
+
+def test_compare():
+    old = _stats([1.0 + i * 0.001 for i in range(10)])
+    faster = _stats([t / 2 for t in old.times])
+    slower = _stats([t * 1.5 for t in old.times])
+    assert compare(faster, old) == "faster by 50.0% (p=0.000)"
+    assert compare(slower, old) == "slower by 50.0% (p=0.000)"
+
+
+def test_compare_not_significant():
+    old = _stats([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    new = _stats([1.5, 2.5, 3.5, 4.5, 5.5, 6.5])
+    # The medians differ by more than MIN_CHANGE, but p >= SIGNIFICANCE
+    assert new.median / old.median - 1 > MIN_CHANGE
+    assert compare(new, old).startswith("no significant change (p=")
+
+
+def test_compare_small_change():
+    old = _stats([1.0 + i * 1e-6 for i in range(20)])
+    new = _stats([1.01 + i * 1e-6 for i in range(20)])
+    # Significant, but smaller than MIN_CHANGE
+    assert mann_whitney(new.times, old.times) < SIGNIFICANCE
+    assert compare(new, old).startswith("no significant change (p=")
+
+
+def test_compare_few_samples():
+    assert compare(_stats([1.0]), _stats([2.0])) == "no significant change"
+    assert compare(_stats([0.0, 0.0]), _stats([0.0, 0.0])).startswith(
+        "no significant change"
+    )
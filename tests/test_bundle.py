@@ -0,0 +1,279 @@
+import pytest
+
+from jurigged.bundle import BundleRecorder, PatchBundle, PatchOperation
+from jurigged.register import Registry
+
+from .common import LiveModule, op_kinds
+
+
+@pytest.fixture
+def recorded():
+    lm = LiveModule("patchable")
+    cf = lm.registry.get(lm.path)
+
+    def edit(old, new):
+        lm.write(old, new)
+        with BundleRecorder(cf) as recorder:
+            cf.refresh()
+        return recorder.bundle
+
+    return lm.module, edit
+
+
+def test_record_update(recorded):
+    mod, edit = recorded
+    bundle = edit("return x + y", "return x + y + 10")
+    assert op_kinds(bundle) == [("conform", ("g",))]
+    (op,) = bundle.operations
+    assert op.defaults == (1,)
+    assert op.module_name == mod.__name__
+    assert op.span == (8, 9)
+    assert op.source == "def g(x, y=1):\n    return x + y + 10"
+    assert op.code is mod.g.__code__
+    assert str(bundle) == f"conform {mod.__name__}.g @L8"
+
+
+def test_record_moved_functions(recorded):
+    mod, edit = recorded
+    bundle = edit("return x * SCALE", "return x * SCALE * 2\n    # one more")
+    # The functions after f move down, so their code changes too
+    assert op_kinds(bundle) == [
+        ("conform", ("f",)),
+        ("conform", ("g",)),
+        ("conform", ("adder",)),
+        ("conform", ("Thing", "compute")),
+        ("conform", ("Thing", "other")),
+    ]
+    assert [op.defaults for op in bundle.operations[1:]] == [None] * 4
+    assert bundle.operations[1].span == (9, 10)
+    assert mod.g.__code__.co_firstlineno == 9
+
+
+def test_record_lines(recorded):
+    mod, edit = recorded
+    bundle = edit("SCALE = 2", "SCALE = 3\nEXTRA = 1")
+    assert op_kinds(bundle)[:2] == [("exec", ()), ("exec", ())]
+    assert [op.name for op in bundle.operations[:2]] == [None, None]
+    assert [op.source for op in bundle.operations[:2]] == [
+        "SCALE = 3",
+        "EXTRA = 1",
+    ]
+
+
+def test_record_add_delete(recorded):
+    mod, edit = recorded
+    bundle = edit(
+        "    def other(self):\n        return 2\n",
+        "    def new(self):\n        return 3\n",
+    )
+    assert op_kinds(bundle) == [("exec", ("Thing",)), ("delete", ("Thing",))]
+    assert bundle.operations[0].name == "new"
+    assert bundle.operations[1].name == "other"
+
+    # Deleting one of two definitions of f does not delete f
+    edit("class Thing:", "def f(x):\n    return 0\n\n\nclass Thing:")
+    bundle = edit("def f(x):\n    return 0\n\n\n", "")
+    assert "delete" not in [op.kind for op in bundle.operations]
+
+
+def test_record_errors(recorded):
+    mod, edit = recorded
+    bundle = edit("SCALE = 2", "SCALE = 1 / 0")
+    assert bundle.operations == []
+
+
+def test_dumps_loads(recorded, tmp_path):
+    mod, edit = recorded
+    bundle = edit("return x + y", "return x + y + 10")
+    assert PatchBundle.loads(bundle.dumps()) == bundle
+    bundle.save(tmp_path / "bundle")
+    assert PatchBundle.load(tmp_path / "bundle") == bundle
+
+
+def test_dumps_unmarshallable(recorded):
+    mod, edit = recorded
+    bundle = edit("def g(x, y=1):", "def g(x, y=object()):")
+    with pytest.raises(ValueError):
+        bundle.dumps()
+
+
+def test_loads_other_version(monkeypatch):
+    data = PatchBundle([]).dumps()
+    monkeypatch.setattr("jurigged.bundle.BUNDLE_FORMAT", 0)
+    with pytest.raises(ValueError, match="another version"):
+        PatchBundle.loads(data)
+
+
+def _compile(mod, src, name, *path):
+    code = compile(src, mod.__file__, "exec")
+    for part in (name, *path):
+        code = next(
+            co for co in code.co_consts if getattr(co, "co_name", None) == part
+        )
+    return code
+
+
+def test_apply_bundle():
+    lm = LiveModule("patchable")
+    mod, name, path = lm.module, lm.name, lm.path
+    add = mod.adder(1)
+    thing = mod.Thing()
+    events = []
+    reg = Registry()
+    reg.set_logger(events.append)
+
+    def op(kind, **kwargs):
+        kwargs = {"filename": path, "module_name": name, **kwargs}
+        return PatchOperation(kind=kind, **kwargs)
+
+    ops = [
+        op(
+            "conform",
+            path=("g",),
+            code=_compile(mod, "def g(x, y=5): return x * y", "g"),
+            defaults=(5,),
+        ),
+        op(
+            "conform",
+            path=("adder",),
+            code=_compile(
+                mod,
+                "def adder(x):\n    def add(y): return x - y\n    return add",
+                "adder",
+            ),
+        ),
+        op(
+            "conform",
+            path=("Thing", "compute"),
+            code=_compile(
+                mod,
+                "class Thing:\n    def compute(self): return 10",
+                "Thing",
+                "compute",
+            ),
+        ),
+        op(
+            "exec",
+            name="h",
+            code=compile("def h():\n    return 7\n", path, "exec"),
+        ),
+        op(
+            "exec",
+            path=("Thing",),
+            name="more",
+            code=compile("def more(self):\n    return 8\n", path, "exec"),
+        ),
+        op("exec", code=compile("SCALE = 3", path, "exec")),
+        op(
+            "exec",
+            path=("Thing",),
+            name="Inner",
+            code=compile("class Inner:\n    pass\n", path, "exec"),
+        ),
+        op(
+            "exec",
+            path=("Thing", "Inner"),
+            code=compile("X = 1", path, "exec"),
+        ),
+        op("delete", name="f"),
+        op("delete", path=("Thing",), name="other"),
+        op("delete", path=("Thing",), name="nonexistent"),
+        op("conform", path=("nonexistent",)),
+        op("exec", module_name="nonexistent_module"),
+        op("delete", module_name="nonexistent_module", name="x"),
+        op("refresh", filename="/nonexistent.py"),
+        op("exec", path=("Nonexistent",)),
+        op("what"),
+    ]
+    reg.apply_bundle(PatchBundle(ops))
+
+    assert mod.g(2) == 10
+    assert add(10) == -9
+    assert thing.compute() == 10
+    assert mod.h() == 7
+    assert mod.h.__qualname__ == "h"
+    assert thing.more() == 8
+    assert mod.Thing.more.__qualname__ == "Thing.more"
+    assert mod.SCALE == 3
+    assert mod.Thing.Inner.X == 1
+    assert not hasattr(mod, "f")
+    assert not hasattr(thing, "other")
+    assert [type(e) for e in events] == [KeyError, ValueError]
+
+    # The added function can be patched in turn
+    bundle = PatchBundle(
+        [
+            op(
+                "conform",
+                path=("h",),
+                code=_compile(mod, "def h(): return 70", "h"),
+            )
+        ]
+    )
+    reg.apply_bundle(bundle.dumps())
+    assert mod.h() == 70
+
+
+class _Follower:
+    __slots__ = ("code", "conformed")
+
+    def __init__(self, code):
+        self.code = code
+        self.conformed = []
+
+    def __conform__(self, new):
+        self.conformed.append(new)
+
+
+def test_apply_bundle_delete():
+    lm = LiveModule("patchable")
+    mod, path = lm.module, lm.path
+    lm.registry.get(path)
+    follow_f = _Follower(mod.f.__code__)
+    follow_other = _Follower(mod.Thing.other.__code__)
+    follow_g = _Follower(mod.g.__code__)
+
+    def delete(*path, name):
+        return PatchOperation(
+            "delete", lm.path, module_name=lm.name, path=path, name=name
+        )
+
+    lm.registry.apply_bundle(
+        PatchBundle(
+            [
+                delete(name="f"),
+                delete("Thing", name="other"),
+                delete(name="SCALE"),
+            ]
+        )
+    )
+    assert not hasattr(mod, "f")
+    assert not hasattr(mod.Thing, "other")
+    assert not hasattr(mod, "SCALE")
+    assert follow_f.conformed == [None]
+    assert follow_other.conformed == [None]
+    assert follow_g.conformed == []
+
+
+def test_apply_bundle_file(tmp_path):
+    lm = LiveModule("patchable")
+    mod, path = lm.module, lm.path
+    code = compile("SCALE = 10", path, "exec")
+    bundle = PatchBundle(
+        [
+            PatchOperation(
+                kind="exec", filename=path, module_name=mod.__name__, code=code
+            )
+        ]
+    )
+    bundle.save(tmp_path / "bundle")
+    Registry().apply_bundle(str(tmp_path / "bundle"))
+    assert mod.f(1) == 10
+
+
+def test_apply_bundle_refresh():
+    lm = LiveModule("patchable")
+    lm.registry.get(lm.path)
+    lm.write("x * SCALE", "x * SCALE + 1")
+    lm.registry.apply_bundle(PatchBundle([PatchOperation("refresh", lm.path)]))
+    assert lm.module.f(2) == 5
@@ -0,0 +1,167 @@
+from itertools import count
+
+import pytest
+
+from jurigged.callgraph import _object_key
+from jurigged.register import Registry
+
+from .common import TemporaryModule
+
+helpers_source = """
+import os
+
+SCALE = 2
+DOUBLE = SCALE * 2
+
+
+def helper(n):
+    return list(range(n))
+
+
+def load(n):
+    return helper(n)
+
+
+def unrelated():
+    return os.getcwd()
+
+
+class Thing:
+    BONUS = 0
+
+    def compute(self, n):
+        return n * self.BONUS
+"""
+
+main_source = """
+from {H} import load, Thing
+import {H} as hp
+from os.path import *
+
+
+def process(n):
+    return [x * hp.SCALE for x in load(n)]
+
+
+def make():
+    return Thing()
+
+
+def name():
+    return join(__name__, "x")
+
+
+def outer():
+    def inner():
+        return process(1)
+
+    return inner
+"""
+
+counter = count()
+
+
+@pytest.fixture
+def graph():
+    tmod = TemporaryModule()
+    n = next(counter)
+    H, M = f"cg_helpers_{n}", f"cg_main_{n}"
+    paths = {
+        H: tmod.write(f"{H}.py", helpers_source),
+        M: tmod.write(f"{M}.py", main_source.format(H=H)),
+    }
+    __import__(M)
+    reg = Registry()
+    for name, path in paths.items():
+        reg.prepare(name, path)
+
+    def edit(name, old, new):
+        with open(paths[name]) as f:
+            src = f.read()
+        assert old in src
+        tmod.write(f"{name}.py", src.replace(old, new))
+        ops = []
+        reg.activity.register(ops.append)
+        reg.get(paths[name]).refresh()
+        reg.activity.remove(ops.append)
+        return ops
+
+    return reg.callgraph, H, M, edit
+
+
+def test_dependencies(graph):
+    cg, H, M, _ = graph
+    assert cg.dependencies(f"{H}.load") == {f"{H}.helper"}
+    assert cg.dependencies(f"{H}.DOUBLE") == {f"{H}.SCALE"}
+    assert cg.dependencies(f"{H}.unrelated") == {f"{H}.os"}
+    assert cg.dependencies(f"{H}.Thing.compute") == set()
+    assert cg.dependencies(f"{M}.load") == {f"{H}.load"}
+    assert cg.dependencies(f"{M}.hp") == {H}
+    assert cg.dependencies(f"{M}.process") == {f"{M}.load", f"{M}.hp"}
+    assert cg.dependencies(f"{M}.outer.inner") == {f"{M}.process"}
+    assert cg.dependencies(f"{M}.name") == {"posixpath.join"}
+    assert cg.dependencies("nonexistent") == set()
+    assert cg.dependents(f"{H}.Thing") == {f"{M}.Thing"}
+
+
+def test_affected(graph):
+    cg, H, M, _ = graph
+    assert cg.affected(f"{H}.helper") == {
+        f"{H}.helper",
+        f"{H}.load",
+        f"{M}.load",
+        f"{M}.process",
+        f"{M}.outer",
+        f"{M}.outer.inner",
+    }
+    assert cg.affected(f"{H}.Thing") == {
+        f"{H}.Thing",
+        f"{M}.Thing",
+        f"{M}.make",
+    }
+
+
+def test_affected_by_whitespace(graph):
+    cg, H, M, _ = graph
+    root = cg.registry.get(next(iter(cg.registry.precache))).root
+    blank = [d for d in root.children if d.node is None]
+    assert blank
+    assert cg.affected(*blank) == set()
+
+
+def test_affected_by_update(graph):
+    cg, H, M, edit = graph
+    ops = edit(M, "return Thing()", "return Thing(), 1")
+    assert cg.affected(*ops) == {M, f"{M}.make"}
+    ops = edit(M, "return process(1)", "return process(2)")
+    assert cg.affected(*ops) == {M, f"{M}.outer", f"{M}.outer.inner"}
+
+
+def test_affected_by_line(graph):
+    cg, H, M, edit = graph
+    ops = edit(H, "SCALE = 2", "SCALE = 3")
+    affected = cg.affected(*ops)
+    assert {f"{H}.SCALE", f"{H}.DOUBLE", H, f"{M}.hp"} <= affected
+    assert f"{M}.process" in affected
+    assert f"{M}.make" not in affected
+    # Changes to definitions nested in a class
+    ops = edit(H, "BONUS = 0", "BONUS = 1")
+    assert {f"{H}.Thing", f"{M}.make"} <= cg.affected(*ops)
+
+
+def test_reindex(graph):
+    cg, H, M, edit = graph
+    assert f"{H}.unrelated" not in cg.affected(f"{H}.helper")
+    edit(H, "return os.getcwd()", "return os.getcwd(), helper(1)")
+    assert f"{H}.unrelated" in cg.affected(f"{H}.helper")
+
+
+def test_object_key():
+    class Unfriendly:
+        def __getattr__(self, attr):
+            raise RuntimeError("no")
+
+    assert _object_key(Unfriendly()) is None
+    assert _object_key(1) is None
+    assert _object_key(pytest) == "pytest"
+    assert _object_key(Registry) == "jurigged.register.Registry"
@@ -113,6 +113,11 @@ def kilroy(tmod):
     return CodeCollection(tmod, "kilroy")
 
 
+@pytest.fixture
+def lemur(tmod):
+    return CodeCollection(tmod, "lemur")
+
+
 def test_collect(apple_code):
     cat = {
         f"{k[0]}@{k[2]}" if isinstance(k, tuple) else k: obj
@@ -152,6 +157,32 @@ def test_collect(apple_code):
     }
 
 
+def test_non_ascii_source():
+    source = 'def f():\n    return "é"  # ü\n\n\ny = "café"  # ü\n'
+    cf = CodeFile("nonascii.py", "nonascii", source=source)
+    cat = catalogue(cf.root)
+    assert cf.root.codestring == source
+    assert cat["nonascii.f"].codestring == 'def f():\n    return "é"'
+
+
+def test_paths(apple_code):
+    cat = catalogue(apple_code.root)
+    cortland = cat["tests.snippets.apple.Orchard.cortland"]
+    orchard = cat["tests.snippets.apple.Orchard"]
+    assert cortland.codepath() == (apple.__file__, "Orchard", "cortland")
+    assert cortland.codepath(skip=1) == (apple.__file__, "Orchard")
+    assert cortland.codepath(skip=5) == ()
+    assert cortland.dotpath() is cortland.dotpath()
+
+    orchard.rename("Verger")
+    assert cortland.dotpath() == "tests.snippets.apple.Verger.cortland"
+    assert cortland.codepath() == (apple.__file__, "Verger", "cortland")
+
+    cortland.set_parent(apple_code.root)
+    assert cortland.dotpath() == "tests.snippets.apple.cortland"
+    assert cortland.codepath() == (apple.__file__, "cortland")
+
+
 def test_merge(ballon):
     radius = 10
     cir = ballon.module.FlatCircle(radius)
@@ -398,6 +429,15 @@ def test_add_class_statement(glamour):
     assert glamour.module.Scarf(5).hello() == "hello!"
 
 
+def test_class_scope_is_not_closure(lemur):
+    call = lemur.module.Lemur.call
+    assert call(None) == "global"
+    lemur.main.merge(lemur.cf.mod)
+    # The function is updated in place rather than replaced
+    assert lemur.module.Lemur.call is call
+    assert call(None) == "global!"
+
+
 def test_bad_statement(iguana):
     # This tests that one bad statement will not interfere with the rest of the
     # changes.
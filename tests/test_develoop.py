@@ -0,0 +1,207 @@
+import cProfile
+import os
+import pickle
+import time
+from contextlib import nullcontext
+
+from giving import give, given
+
+from jurigged.loop import basic
+from jurigged.loop.basic import BasicForkDeveloopRunner
+from jurigged.loop.develoop import (
+    ForkDeveloopRunner,
+    RedirectDeveloopRunner,
+    RemoteError,
+    RemoteTraceback,
+    code_label,
+    profile_deltas,
+    profile_summary,
+)
+from jurigged.register import registry
+
+from .common import LiveModule
+
+
+def _work(n):
+    return sum(i * i for i in range(n))
+
+
+def _looped():
+    give(x=_work(1000))
+    return 1
+
+
+def _profile(fn):
+    prof = cProfile.Profile()
+    with given() as gv:
+        # Like ForkDeveloopRunner, send what is given through pickle
+        gv.subscribe(lambda data: pickle.loads(pickle.dumps(data)))
+        prof.runcall(fn)
+    return profile_summary(prof)
+
+
+def test_profile_summary():
+    rows = _profile(_looped)
+    labels = [label for label, _, _, _ in rows]
+    assert labels[0].startswith("_looped (test_develoop.py:")
+    assert any(label.startswith("_work ") for label in labels)
+    # The develoop, giving and the functions only they call are left out
+    assert not any("giving" in label or "pickle" in label for label in labels)
+    assert not any("lambda" in label for label in labels)
+    assert not any("_lsprof" in label for label in labels)
+    totals = [total for _, _, _, total in rows]
+    assert totals == sorted(totals, reverse=True)
+    label, calls, own, total = rows[0]
+    assert calls == 1
+    assert 0 <= own <= total
+
+
+def test_profile_summary_top():
+    prof = cProfile.Profile()
+    prof.runcall(lambda: [_work(i) for i in range(10)])
+    assert len(profile_summary(prof, top=2)) == 2
+
+
+def test_profile_summary_builtins():
+    prof = cProfile.Profile()
+    prof.runcall(sorted, [3, 1, 2])
+    assert [label for label, *_ in profile_summary(prof)] == [
+        "<built-in method builtins.sorted>"
+    ]
+
+
+def test_profile_deltas():
+    previous = [("f", 1, 0.1, 0.5), ("g", 2, 0.2, 0.2)]
+    rows = [("f", 1, 0.1, 0.3), ("h", 1, 0.1, 0.1)]
+    assert profile_deltas(rows) == [
+        ("f", 1, 0.1, 0.3, None),
+        ("h", 1, 0.1, 0.1, None),
+    ]
+    deltas = profile_deltas(rows, previous)
+    assert deltas[0][:4] == ("f", 1, 0.1, 0.3)
+    assert abs(deltas[0][4] - -0.2) < 1e-9
+    assert deltas[1] == ("h", 1, 0.1, 0.1, None)
+
+
+def test_code_label():
+    code = _work.__code__
+    assert code_label(code) == f"_work (test_develoop.py:{code.co_firstlineno})"
+
+    lm = LiveModule("patchable", registry=registry)
+    assert code_label(lm.module.g.__code__) == f"{lm.name}.g"
+    assert code_label(lm.module.Thing.compute.__code__) == (
+        f"{lm.name}.Thing.compute"
+    )
+    # Edited functions keep their label
+    lm.edit("return x + y", "return x + y + 1")
+    assert code_label(lm.module.g.__code__) == f"{lm.name}.g"
+
+
+class _Recorder(ForkDeveloopRunner, RedirectDeveloopRunner):
+    """Fork runner that records what the child gives."""
+
+    def register_updates(self, gv):
+        self.given = []
+        gv.subscribe(self.given.append)
+
+    def values(self, key):
+        return [d[key] for d in self.given if key in d]
+
+
+def _child_work(x, y=1):
+    print("hello", os.getpid())
+    give(z=x + y)
+    return x * y
+
+
+def test_fork_result():
+    runner = _Recorder(_child_work, (3,), {"y": 4})
+    assert runner.run() == [12, None]
+    assert runner.num == 1
+    assert runner.values("z") == [7]
+    assert runner.values("#status") == ["done"]
+    # The output was written in the child, and sent to the parent
+    hello, pid = "".join(runner.values("#stdout")).split()
+    assert hello == "hello"
+    assert int(pid) != os.getpid()
+
+
+def _child_fail():
+    raise ValueError("oh no")
+
+
+def test_fork_error():
+    runner = _Recorder(_child_fail, (), {})
+    result, error = runner.run()
+    assert result is None
+    assert isinstance(error, ValueError)
+    assert isinstance(error.__cause__, RemoteTraceback)
+    assert "_child_fail" in str(error.__cause__)
+    assert "oh no" in str(error.__cause__)
+    assert runner.values("#status") == ["error"]
+
+
+class _Unpicklable(Exception):
+    def __reduce__(self):
+        raise TypeError("no")
+
+
+def _child_fail_unpicklable():
+    give(fn=lambda: None)
+    raise _Unpicklable("cannot send")
+
+
+def test_fork_unpicklable():
+    runner = _Recorder(_child_fail_unpicklable, (), {})
+    _, error = runner.run()
+    assert isinstance(error, RemoteError)
+    assert str(error) == "_Unpicklable: cannot send"
+    assert runner.values("fn") == [
+        "<unpicklable <function _child_fail_unpicklable.<locals>.<lambda>>>"
+    ]
+
+
+def _child_stuck():
+    give(ready=True)
+    time.sleep(10)
+
+
+class _Aborter(_Recorder):
+    def register_updates(self, gv):
+        super().register_updates(gv)
+        gv["?ready"] >> self.command("abort", aborts=True)
+
+
+def test_fork_abort():
+    runner = _Aborter(_child_stuck, (), {})
+    t0 = time.time()
+    assert runner.run() == [None, None]
+    assert time.time() - t0 < 5
+    assert runner.values("#status") == ["aborted"]
+    assert runner._child_pid is None
+    assert runner._q.get_nowait() == "abort"
+    # Killing a child that is already gone does nothing
+    runner._child_pid = os.getpid() + 10**6
+    runner.command("abort", aborts=True)()
+
+
+def test_fork_profile():
+    runner = _Recorder(_looped, (), {}, profile=True)
+    assert runner.run() == [1, None]
+    (rows,) = runner.values("#profile")
+    labels = [label for label, *_ in rows]
+    assert labels[0].startswith("_looped ")
+    assert not any("pickl" in label for label in labels)
+    assert list(runner.profile_history) == [rows]
+
+
+def test_basic_fork(monkeypatch, capsys):
+    monkeypatch.setattr(basic, "cbreak", nullcontext)
+    monkeypatch.setattr(basic, "read_chars", lambda: iter([{"char": "c"}]))
+    runner = BasicForkDeveloopRunner(_child_work, (2,), {})
+    assert runner.run() == [2, None]
+    assert runner._q.get_nowait() == "cont"
+    out = capsys.readouterr().out
+    assert "#1: _child_work(2)" in out
+    assert "#1: RESULT" in out
+    assert "z:\x1b[0m 3" in out
@@ -0,0 +1,174 @@
+import os
+import socket
+
+import pytest
+
+from jurigged.bundle import PatchBundle, PatchOperation
+from jurigged.fanout import (
+    Coordinator,
+    Subscriber,
+    recv_bundle,
+    send_bundle,
+    subscribe,
+)
+from jurigged.live import Watcher
+
+from .common import LiveModule, op_kinds, wait_until
+
+
+@pytest.fixture
+def fanned(tmp_path):
+    lm = LiveModule("patchable")
+    watcher = Watcher(lm.registry)
+    coord = Coordinator(watcher, str(tmp_path / "sock"))
+    coord.start()
+
+    def edit(old, new):
+        lm.write(old, new)
+        watcher.refresh(lm.path)
+
+    yield lm.module, coord, edit
+    coord.stop()
+
+
+def _client(coord):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(coord.address)
+    wait_until(lambda: coord.clients)
+    return sock
+
+
+def test_coordinator(fanned):
+    mod, coord, edit = fanned
+    sock = _client(coord)
+    edit("return x + y", "return x + y + 10")
+    bundle = recv_bundle(sock)
+    assert op_kinds(bundle) == [("conform", ("g",))]
+    assert bundle.operations[0].defaults == (1,)
+    assert mod.g(1) == 12
+    sock.close()
+
+
+def test_coordinator_unmarshallable(fanned):
+    mod, coord, edit = fanned
+    sock = _client(coord)
+    edit("def g(x, y=1):", "def g(x, y=object()):")
+    bundle = recv_bundle(sock)
+    assert bundle == PatchBundle([PatchOperation("refresh", mod.__file__)])
+    sock.close()
+
+
+def test_coordinator_no_change(fanned):
+    mod, coord, edit = fanned
+    sock = _client(coord)
+    edit("SCALE = 2", "SCALE = 2  ")
+    edit("return x + y", "return x - y")
+    assert op_kinds(recv_bundle(sock)) == [("conform", ("g",))]
+    sock.close()
+
+
+def test_coordinator_drops_closed_clients(fanned):
+    mod, coord, edit = fanned
+    sock = _client(coord)
+    sock.close()
+    edit("return x + y", "return x - y")
+    edit("return x - y", "return x * y")
+    assert coord.clients == []
+
+
+def test_coordinator_ignores_errors(fanned):
+    mod, coord, edit = fanned
+    sock = _client(coord)
+    edit("return x + y", "return x +")
+    edit("SCALE = 2", "SCALE = 1 / 0")
+    edit("return x +", "return x * y")
+    assert mod.g(3, 4) == 12
+    # Nothing is sent for the failed changes
+    assert op_kinds(recv_bundle(sock)) == [("conform", ("g",))]
+    sock.close()
+
+
+def test_coordinator_ignores_other_changes(fanned):
+    mod, coord, edit = fanned
+    cf = coord.registry.get(mod.__file__)
+    with open(mod.__file__) as f:
+        src = f.read()
+    with open(mod.__file__, "w") as f:
+        f.write(src.replace("x + y", "x - y"))
+    cf.refresh()
+    assert mod.g(3, 4) == -1
+
+
+def test_coordinator_restart(fanned):
+    mod, coord, edit = fanned
+    coord.stop()
+    open(coord.address, "w").close()
+    coord.start()
+    _client(coord).close()
+
+
+def test_coordinator_failed_refresh(fanned):
+    mod, coord, edit = fanned
+    edit("return x + y", "return x +")
+    assert list(coord._recorders) == [mod.__file__]
+    edit("return x +", "return x * y")
+    assert coord._recorders == {}
+
+
+def test_recv_bundle_closed():
+    a, b = socket.socketpair()
+    a.sendall(b"\x00\x00")
+    a.close()
+    assert recv_bundle(b) is None
+
+    a, b = socket.socketpair()
+    a.sendall(b"\x00\x00\x00\x10abc")
+    a.close()
+    assert recv_bundle(b) is None
+
+
+def test_subscriber(fanned):
+    mod, coord, edit = fanned
+    subscriber = subscribe(coord.address)
+    wait_until(lambda: coord.clients)
+    edit("return x + y", "return x + y + 10")
+    wait_until(lambda: subscriber.applied == 1)
+    assert mod.g(1) == 12
+    coord.stop()
+    subscriber.thread.join(5)
+    assert not subscriber.thread.is_alive()
+
+
+@pytest.mark.filterwarnings("ignore:This process:DeprecationWarning")
+def test_subscriber_in_other_process(fanned):
+    mod, coord, edit = fanned
+    rd, wr = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        try:
+            os.close(rd)
+            subscriber = Subscriber(coord.address)
+            subscriber.connect()
+            subscriber.serve()
+            results = (mod.f(1), mod.g(1), mod.Thing().compute(), mod.EXTRA)
+            os.write(wr, repr(results).encode())
+        finally:
+            os._exit(0)
+
+    os.close(wr)
+    wait_until(lambda: coord.clients)
+    edit("return x * SCALE", "return x * SCALE * 2")
+    edit("return 1\n", "return 100\n")
+    edit("SCALE = 2", "SCALE = 2\nEXTRA = 'extra'")
+    coord.stop()
+    os.waitpid(pid, 0)
+    with os.fdopen(rd) as f:
+        assert f.read() == repr((4, 2, 100, "extra"))
+
+
+def test_send_bundle_roundtrip():
+    a, b = socket.socketpair()
+    code = compile("x = 1", "<test>", "exec")
+    bundle = PatchBundle([PatchOperation("exec", "<test>", "m", code=code)])
+    send_bundle(a, bundle)
+    assert recv_bundle(b) == bundle
@@ -0,0 +1,232 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+from codefind import ConformException
+
+from jurigged import forkserver
+from jurigged.forkserver import (
+    ForkServer,
+    needs_restart,
+    preload,
+    restart,
+    restart_on_error,
+)
+from jurigged.utils import glob_filter
+
+
+def _write(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents)
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    src = tmp_path / "src"
+    deps = tmp_path / "deps"
+    _write(
+        src / "main.py",
+        "import os\nimport helper\nimport pkg\nimport helper.nope\n\ndef f():\n    import fs_lazy\n",
+    )
+    _write(
+        src / "helper.py",
+        "import fs_heavy\ntry:\n    import fs_missing\nexcept ImportError:\n    pass\n",
+    )
+    _write(
+        src / "pkg" / "__init__.py", "from . import sub\nfrom .sub import *\n"
+    )
+    _write(src / "pkg" / "sub.py", "from fs_deps import heavy2, broken\n")
+    _write(src / "bad.py", "import fs_heavy\ndef (:\n")
+    _write(deps / "fs_heavy.py", "")
+    _write(deps / "fs_lazy.py", "")
+    _write(deps / "fs_deps" / "__init__.py", "")
+    _write(deps / "fs_deps" / "heavy2.py", "")
+    _write(deps / "fs_deps" / "broken.py", "raise ValueError('no')\n")
+    monkeypatch.syspath_prepend(str(src))
+    monkeypatch.syspath_prepend(str(deps))
+    yield src
+    for name in list(sys.modules):
+        if name.split(".")[0] in ("fs_heavy", "fs_lazy", "fs_deps", "pkg"):
+            del sys.modules[name]
+
+
+def test_preload(project):
+    imported = preload(str(project / "main.py"), glob_filter(str(project)))
+    assert imported == ["fs_heavy", "fs_deps", "fs_deps.heavy2"]
+    # Watched modules are not imported
+    assert "helper" not in sys.modules
+    assert "pkg" not in sys.modules
+    # Imports inside functions are not preloaded
+    assert "fs_lazy" not in sys.modules
+
+
+def test_preload_scanned(project):
+    scanned = []
+    preload(
+        str(project / "main.py"), glob_filter(str(project)), scanned=scanned
+    )
+    assert sorted(os.path.basename(f) for f in scanned) == [
+        "__init__.py",
+        "helper.py",
+        "main.py",
+        "sub.py",
+    ]
+
+
+def test_preload_bad_files(project):
+    watched = glob_filter(str(project))
+    assert preload(str(project / "bad.py"), watched) == []
+    assert preload(str(project / "nonexistent.py"), watched) == []
+
+
+def test_preload_relative_in_script(tmp_path):
+    _write(tmp_path / "script.py", "from . import something\n")
+    assert (
+        preload(str(tmp_path / "script.py"), glob_filter(str(tmp_path))) == []
+    )
+
+
+def _read(path):
+    return int(path.read_text()) if path.exists() else 0
+
+
+def _counter(path):
+    n = int(path.read_text()) if path.exists() else 0
+    path.write_text(str(n + 1))
+    return n
+
+
+def test_exit_codes():
+    def bad():
+        raise ValueError("oh no")
+
+    def killed():
+        os.kill(os.getpid(), signal.SIGKILL)
+
+    assert ForkServer(lambda: None).serve() == 0
+    assert ForkServer(lambda: sys.exit()).serve() == 0
+    assert ForkServer(lambda: sys.exit(3)).serve() == 3
+    assert ForkServer(lambda: sys.exit("bye")).serve() == 1
+    assert ForkServer(bad).serve() == 1
+    assert ForkServer(killed).serve() == 128 + signal.SIGKILL
+
+
+def test_restart(tmp_path):
+    counter = tmp_path / "counter"
+
+    def main():
+        if _counter(counter) < 2:
+            restart()
+
+    server = ForkServer(main)
+    assert server.serve() == 0
+    assert server.restarts == 2
+
+
+def test_restart_on_error(tmp_path):
+    counter = tmp_path / "counter"
+    events = []
+    logger = restart_on_error(events.append)
+
+    def main():
+        logger("hello")
+        logger(SyntaxError("no restart"))
+        logger(NameError("no restart either"))
+        if _counter(counter) < 1:
+            logger(ConformException("restart"))
+        sys.exit(len(events))
+
+    server = ForkServer(main)
+    assert server.serve() == 3
+    assert server.restarts == 1
+
+
+def test_needs_restart():
+    assert needs_restart(ConformException("free variables changed"))
+    assert needs_restart(
+        TypeError("__class__ assignment: 'B' object layout differs from 'A'")
+    )
+    assert not needs_restart(TypeError("unsupported operand"))
+    assert not needs_restart(NameError("name 'x' is not defined"))
+    assert not needs_restart(SyntaxError("invalid syntax"))
+
+
+def _failing_restart(counter, command):
+    # Restarts, then fails once, then succeeds. The failing child runs
+    # command in the background, once the server is waiting.
+    def main():
+        n = _counter(counter)
+        if n == 0:
+            restart()
+        elif n == 1:
+            subprocess.Popen(["sh", "-c", f"sleep 0.1; {command}"])
+            raise ValueError("broken by the change")
+
+    return main
+
+
+def test_restarted_child_fails(tmp_path):
+    counter = tmp_path / "counter"
+    watched = tmp_path / "watched.py"
+    watched.write_text("x = 1\n")
+    server = ForkServer(
+        _failing_restart(counter, f"echo 'x = 22' > {watched}"),
+        files=[str(watched)],
+        interval=0.01,
+    )
+    assert server.serve() == 0
+    assert server.restarts == 2
+    assert _read(counter) == 3
+
+
+def test_restarted_child_fails_hup(tmp_path):
+    counter = tmp_path / "counter"
+    main = _failing_restart(counter, f"kill -HUP {os.getpid()}")
+    server = ForkServer(main, interval=0.01)
+    assert server.serve() == 0
+    assert server.restarts == 2
+
+
+def test_restarted_child_fails_interrupt(tmp_path):
+    counter = tmp_path / "counter"
+    main = _failing_restart(counter, f"kill -INT {os.getpid()}")
+    server = ForkServer(main, interval=0.01)
+    handler = signal.getsignal(signal.SIGINT)
+    assert server.serve() == 128 + signal.SIGINT
+    assert server.restarts == 1
+    assert signal.getsignal(signal.SIGINT) is handler
+
+
+def test_restart_on_hup(tmp_path):
+    counter = tmp_path / "counter"
+
+    def main():
+        if _counter(counter) < 1:
+            os.kill(os.getppid(), signal.SIGHUP)
+            time.sleep(10)
+
+    server = ForkServer(main)
+    assert server.serve() == 0
+    assert server.restarts == 1
+
+
+def test_hup_between_children():
+    server = ForkServer(lambda: None)
+    server._on_hup(signal.SIGHUP, None)
+    assert server._hup
+
+
+def test_restart_outside_server():
+    with pytest.raises(Exception, match="fork server"):
+        restart()
+
+
+def test_restart_on_error_exits(monkeypatch):
+    codes = []
+    monkeypatch.setattr(forkserver, "current_server", object())
+    monkeypatch.setattr(forkserver, "_exit", codes.append)
+    restart_on_error(lambda event: None)(ConformException("x"))
+    assert codes == [forkserver.RESTART_EXITCODE]
@@ -0,0 +1,163 @@
+import os
+import struct
+import sys
+
+import pytest
+
+from jurigged import inotify
+from jurigged.inotify import InotifyObserver, parse_events
+
+from .common import wait_until
+
+pytestmark = pytest.mark.skipif(
+    not inotify.available(), reason="inotify is not available"
+)
+
+
+class Handler:
+    def __init__(self, fail=None):
+        self.events = []
+        self.fail = fail
+
+    def on_modified(self, event):
+        self.events.append(event.src_path)
+        if self.fail:
+            raise self.fail(event.src_path)
+
+
+def _raw(wd, mask, name):
+    name = name.encode()
+    padded = name + b"\0" * (16 - len(name) % 16)
+    return struct.pack("iIII", wd, mask, 0, len(padded)) + padded
+
+
+def test_parse_events():
+    data = _raw(1, inotify.IN_MODIFY, "a.py") + _raw(2, inotify.IN_CREATE, "")
+    assert list(parse_events(data)) == [
+        (1, inotify.IN_MODIFY, "a.py"),
+        (2, inotify.IN_CREATE, ""),
+    ]
+
+
+def test_observer(tmp_path):
+    a = tmp_path / "a.py"
+    b = tmp_path / "b.py"
+    a.write_text("")
+    ha, hdir, hfail = Handler(), Handler(), Handler(fail=FileNotFoundError)
+    obs = InotifyObserver()
+    obs.schedule(ha, str(tmp_path), filename=str(a))
+    obs.schedule(hfail, str(tmp_path), filename=str(a))
+    obs.schedule(hdir, str(tmp_path))
+    obs.start()
+    assert obs.is_alive()
+
+    a.write_text("x = 1")
+    b.write_text("y = 1")
+    # Replace the file, like some editors do
+    (tmp_path / "a.tmp").write_text("x = 2")
+    os.rename(tmp_path / "a.tmp", a)
+    wait_until(lambda: len(ha.events) >= 3 and str(b) in hdir.events)
+    assert set(ha.events) == {str(a)}
+    assert hfail.events == ha.events
+    assert str(a) not in hdir.events
+
+    obs.stop()
+    obs.stop()
+    obs.join()
+    assert not obs.is_alive()
+
+
+def test_deleted_directory(tmp_path):
+    d = tmp_path / "sub"
+    d.mkdir()
+    h = Handler()
+    obs = InotifyObserver()
+    obs.schedule(h, str(d))
+    obs.start()
+    os.rmdir(d)
+    wait_until(lambda: not obs._wds)
+    assert obs._dirs == {}
+    obs.stop()
+    obs.join()
+
+
+def test_failing_handler(tmp_path, caplog):
+    a = tmp_path / "a.py"
+    h, hfail = Handler(), Handler(fail=ValueError)
+    obs = InotifyObserver()
+    obs.schedule(hfail, str(tmp_path), filename=str(a))
+    obs.schedule(h, str(tmp_path), filename=str(a))
+    obs.start()
+    a.write_text("x = 1")
+    wait_until(lambda: h.events)
+    # The thread survives the error
+    h.events.clear()
+    a.write_text("x = 2")
+    wait_until(lambda: h.events)
+    assert obs.is_alive()
+    assert f"Error while handling a change to {a}" in caplog.text
+    assert "ValueError" in caplog.text
+    obs.stop()
+    obs.join()
+
+
+def test_overflow(tmp_path):
+    a = tmp_path / "a.py"
+    sub = tmp_path / "sub"
+    gone = tmp_path / "gone"
+    sub.mkdir()
+    gone.mkdir()
+    (sub / "b.py").write_text("")
+    (sub / "nested").mkdir()
+    ha, hdir, hgone = Handler(), Handler(), Handler()
+    obs = InotifyObserver()
+    obs.schedule(ha, str(tmp_path), filename=str(a))
+    obs.schedule(hdir, str(sub))
+    obs.schedule(hgone, str(gone))
+    gone.rmdir()
+    obs.dispatch(
+        _raw(-1, inotify.IN_Q_OVERFLOW, "")
+        + _raw(-1, inotify.IN_Q_OVERFLOW, "")
+    )
+    # Every scheduled file is dispatched, once
+    assert ha.events == [str(a)]
+    assert hdir.events == [str(sub / "b.py")]
+    assert hgone.events == []
+    obs.stop()
+
+
+def test_unstarted():
+    obs = InotifyObserver()
+    # Unknown watches and events on the directory itself are ignored
+    obs.dispatch(_raw(1234, inotify.IN_MODIFY, "a.py"))
+    obs.join()
+    assert not obs.is_alive()
+    obs.stop()
+
+
+def test_errors(tmp_path, monkeypatch):
+    obs = InotifyObserver()
+    with pytest.raises(FileNotFoundError):
+        obs.schedule(Handler(), str(tmp_path / "nonexistent"))
+    obs.stop()
+    monkeypatch.setattr(inotify, "_libc", None)
+    with pytest.raises(OSError, match="not available"):
+        InotifyObserver()
+
+
+def test_load_libc(monkeypatch):
+    monkeypatch.setattr(sys, "platform", "darwin")
+    assert inotify._load_libc() is None
+
+
+def test_load_libc_fails(monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError("cannot load libc")
+
+    monkeypatch.setattr(inotify.ctypes, "CDLL", fail)
+    assert inotify._load_libc() is None
+
+
+def test_load_libc_without_inotify(monkeypatch):
+    monkeypatch.setattr(inotify.ctypes, "CDLL", lambda *args, **kw: object())
+    assert inotify._load_libc() is None
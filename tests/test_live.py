@@ -1,9 +1,15 @@
+import asyncio
 import builtins
+import threading
 import time
 
-from jurigged import codetools
+import pytest
+
+from jurigged import codetools, inotify
 from jurigged.live import (
+    Watcher,
     WatchOperation,
+    awatch,
     conservative_logger as conlog,
     default_logger,
     to_filter,
@@ -105,6 +111,30 @@ def test_watch(tmod):
     assert not watcher.observer.is_alive()
 
 
+@pytest.mark.skipif(not inotify.available(), reason="inotify is not available")
+def test_watch_inotify(tmod):
+    registry = Registry()
+    watcher = watch(
+        pattern=tmod.rel("*.py"),
+        registry=registry,
+        debounce=0,
+        backend="inotify",
+    )
+    za = tmod.imp("za", mangle="_22")
+    assert za.word == "tyrant"
+    tmod.write("za_22.py", 'word = "pirate"\n')
+    time.sleep(pause)
+    assert za.word == "pirate"
+    watcher.stop()
+    watcher.join()
+    assert not watcher.observer.is_alive()
+
+
+def test_watch_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown backend"):
+        Watcher(Registry(), backend="carrier pigeon")
+
+
 def test_debounce(tmod):
     def lg(evt):
         evts.append(type(evt).__name__)
@@ -155,6 +185,59 @@ def test_poll(tmod):
     assert evts.count("UpdateOperation") == 1
 
 
+def test_awatch(tmod):
+    threads = []
+    evts = []
+
+    def lg(evt):
+        evts.append(type(evt).__name__)
+        threads.append(threading.current_thread())
+
+    async def main():
+        registry = Registry()
+        watcher = await awatch(
+            pattern=tmod.rel("*.py"), registry=registry, debounce=0.1
+        )
+        registry.activity.register(lg)
+        za = tmod.imp("za", mangle="_20")
+        assert za.word == "tyrant"
+
+        tmod.write("za_20.py", "")
+        await asyncio.sleep(pause)
+        tmod.write("za_20.py", 'word = "tyrant"\nxxx = "xxx"')
+        await asyncio.sleep(0.2)
+        assert za.xxx == "xxx"
+        return watcher, za
+
+    watcher, za = asyncio.run(main())
+    # Debounced with the loop's timers, applied in the loop's thread
+    assert evts.count("AddOperation") == 1
+    assert evts.count("DeleteOperation") == 0
+    assert set(threads) == {threading.main_thread()}
+
+    # Changes are ignored once the loop is closed
+    tmod.write("za_20.py", 'word = "pirate"\n')
+    time.sleep(pause)
+    assert za.word == "tyrant"
+    watcher.stop()
+    watcher.join()
+
+
+def test_awatch_no_debounce(tmod):
+    async def main():
+        registry = Registry()
+        watcher = await awatch(
+            pattern=tmod.rel("*.py"), registry=registry, debounce=0
+        )
+        za = tmod.imp("za", mangle="_21")
+        tmod.write("za_21.py", 'word = "pirate"\n')
+        await asyncio.sleep(pause)
+        assert za.word == "pirate"
+        watcher.stop()
+
+    asyncio.run(main())
+
+
 def test_prerun(tmod):
     test_var = 0
 
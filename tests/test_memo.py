@@ -0,0 +1,153 @@
+import functools
+import gc
+
+import pytest
+
+from jurigged.memo import dependencies, memoize
+from jurigged.register import Registry
+
+from .common import LiveModule
+
+
+@pytest.fixture
+def memod():
+    lm = LiveModule("memod")
+    mod, reg = lm.module, lm.registry
+    mod.load = memoize(mod.load, registry=reg)
+    mod.process = memoize(registry=reg)(mod.process)
+    return mod, reg, lm.edit
+
+
+def _calls(mod):
+    calls = list(mod.calls)
+    mod.calls.clear()
+    return calls
+
+
+def test_memoize(memod):
+    mod, _, _ = memod
+    assert mod.process(3) == [0, 2, 4]
+    assert mod.process(3) == [0, 2, 4]
+    assert _calls(mod) == ["process", "load"]
+    assert mod.process(n=3) == [0, 2, 4]
+    assert mod.process(2) == [0, 2]
+    assert _calls(mod) == ["process", "process", "load"]
+    assert mod.process.__name__ == "process"
+
+
+def test_change_caller(memod):
+    mod, _, edit = memod
+    assert mod.process(3) == [0, 2, 4]
+    assert _calls(mod) == ["process", "load"]
+    edit("x * SCALE", "x * SCALE + 1")
+    assert mod.process(3) == [1, 3, 5]
+    # load did not change, so it is not called again
+    assert _calls(mod) == ["process"]
+
+
+def test_change_transitive(memod):
+    mod, _, edit = memod
+    assert mod.process(3) == [0, 2, 4]
+    assert _calls(mod) == ["process", "load"]
+    edit("list(range(n))", "list(range(1, n + 1))")
+    assert mod.process(3) == [2, 4, 6]
+    assert _calls(mod) == ["process", "load"]
+
+
+def test_change_global(memod):
+    mod, _, edit = memod
+    assert mod.process(3) == [0, 2, 4]
+    assert _calls(mod) == ["process", "load"]
+    edit("SCALE = 2", "SCALE = 10")
+    assert mod.process(3) == [0, 10, 20]
+    assert _calls(mod) == ["process"]
+
+
+def test_unrelated_change(memod):
+    mod, _, edit = memod
+    assert mod.process(3) == [0, 2, 4]
+    edit("return n * self.factor", "return n * self.factor * 2")
+    assert mod.process(3) == [0, 2, 4]
+    assert _calls(mod) == ["process", "load"]
+
+
+def test_change_class_attribute(memod):
+    mod, _, edit = memod
+    assert mod.process(3) == [0, 2, 4]
+    assert _calls(mod) == ["process", "load"]
+    edit("BONUS = 0", "BONUS = 1")
+    assert mod.process(3) == [1, 3, 5]
+    assert _calls(mod) == ["process"]
+
+
+def test_unhashable():
+    calls = []
+    size = memoize(lambda x: calls.append(x) or len(x), registry=Registry())
+    assert size([1]) == 1
+    assert size([1]) == 1
+    assert calls == [[1], [1]]
+
+
+def test_method(memod):
+    mod, reg, edit = memod
+    mod.Thing.compute = memoize(mod.Thing.compute, registry=reg)
+    assert mod.Thing.compute.__get__(None, mod.Thing) is mod.Thing.compute
+    t = mod.Thing(3)
+    assert t.compute(2) == 6
+    assert t.compute(2) == 6
+    assert mod.Thing(4).compute(2) == 8
+    assert _calls(mod) == ["compute", "compute"]
+    mod.Thing.compute.clear()
+    assert t.compute(2) == 6
+    assert _calls(mod) == ["compute"]
+
+
+def test_collected(memod):
+    mod, reg, edit = memod
+    n = len(reg.activity)
+    size = memoize(len, registry=reg)
+    assert len(reg.activity) == n + 1
+    assert size([1, 2]) == 2
+    del size
+    gc.collect()
+    assert len(reg.activity) == n
+    edit("SCALE = 2", "SCALE = 10")
+    assert mod.process(3) == [0, 10, 20]
+
+
+def test_dependencies_closure():
+    reg = Registry()
+    x = 1
+
+    def inner():
+        return x
+
+    def outer():
+        return inner() + later  # noqa: F821
+
+    deps = dependencies(outer, registry=reg)
+    holders = [(type(h).__name__, n) for h, n, _ in deps]
+    assert ("function", "__code__") in holders
+    assert holders.count(("cell", "cell_contents")) == 2
+    # inner is not in a watched file, so it is not followed
+    assert all(v is not inner.__code__ for _, _, v in deps)
+    later = 2  # noqa: F841
+
+
+def test_dependencies_unwrap():
+    reg = Registry()
+
+    def f():
+        return Registry.prepare, (lambda: SOMETHING)  # noqa: F821
+
+    @functools.wraps(f)
+    def wrapper():
+        return f()
+
+    deps = dependencies(wrapper, registry=reg)
+    assert deps[0] == (f, "__code__", f.__code__)
+    assert (Registry, "prepare", Registry.prepare) in deps
+    assert any(n == "SOMETHING" for _, n, _ in deps)
+
+    bound = Registry().prepare
+    assert dependencies(bound, registry=reg)[0][2] is Registry.prepare.__code__
@@ -0,0 +1,183 @@
+import ast
+import os
+
+import pytest
+from ovld import ovld, recurse
+
+from jurigged.parse import (
+    Variables,
+    fill_closures,
+    free_variables,
+    variables,
+)
+
+snippets_dir = os.path.join(os.path.dirname(__file__), "snippets")
+snippets = sorted(
+    name for name in os.listdir(snippets_dir) if name.endswith(".py")
+)
+
+
+# Reference implementation of variables(), kept to check that the optimized
+# version gives the same results.
+
+
+@ovld
+def reference_variables(seq: list, mapping):
+    fvs = Variables()
+    for node in seq:
+        fvs = fvs | recurse(node, mapping)
+    return fvs
+
+
+@ovld
+def reference_variables(node: (ast.FunctionDef, ast.AsyncFunctionDef), mapping):
+    fvs = (
+        recurse(node.body, mapping)
+        | recurse(node.args.args, mapping)
+        | recurse(node.args.posonlyargs, mapping)
+        | recurse(node.args.kwonlyargs, mapping)
+        | recurse(node.args.kwarg, mapping)
+        | recurse(node.args.vararg, mapping)
+    )
+    mapping[node] = fvs
+    outer = (
+        recurse(node.decorator_list, mapping)
+        | recurse(node.args.defaults, mapping)
+        | recurse(node.args.kw_defaults, mapping)
+    )
+    return outer | Variables(assigned={node.name}, read=fvs.free)
+
+
+@ovld
+def reference_variables(node: ast.ClassDef, mapping):
+    fvs = recurse(node.body, mapping) | Variables(assigned={"__class__"})
+    mapping[node] = fvs
+    outer = recurse(node.decorator_list, mapping)
+    return outer | Variables(assigned={node.name}, read=fvs.free)
+
+
+@ovld
+def reference_variables(node: ast.arg, mapping):
+    return Variables(assigned={node.arg})
+
+
+@ovld
+def reference_variables(node: ast.Name, mapping):
+    if isinstance(node.ctx, ast.Load):
+        read = {node.id}
+        if node.id == "super":
+            read.add("__class__")
+        return Variables(read=read)
+    elif isinstance(node.ctx, ast.Store):
+        return Variables(assigned={node.id})
+    else:
+        return Variables(read={node.id})
+
+
+@ovld
+def reference_variables(node: ast.AST, mapping):
+    return recurse(list(ast.iter_child_nodes(node)), mapping)
+
+
+@ovld
+def reference_variables(thing: object, mapping):
+    return Variables()
+
+
+def _check_parity(source):
+    tree = ast.parse(source)
+    expected_mapping = {}
+    expected = reference_variables(tree, expected_mapping)
+    mapping = {}
+    assert variables(tree, mapping) == expected
+    assert mapping == expected_mapping
+
+
+@pytest.mark.parametrize("name", snippets)
+def test_variables_parity(name):
+    with open(os.path.join(snippets_dir, name)) as f:
+        _check_parity(f.read())
+
+
+def test_variables_parity_jurigged():
+    import jurigged.codetools
+
+    with open(jurigged.codetools.__file__) as f:
+        _check_parity(f.read())
+
+
+def test_variables_parity_tricky():
+    _check_parity(
+        """
+@deco(a)
+async def f(x, /, y=b, *args, z=c, **kwargs):
+    global g
+    del w
+    q = [i + j for i in x]
+    return lambda k=d: k + e + (v := 1)
+
+class Q(Base):
+    def method(self):
+        return super().method()
+"""
+    )
+
+
+def test_variables_list():
+    tree = ast.parse("a = b\ndef f(): return c")
+    assert variables(tree.body, {}) == Variables(
+        assigned={"a", "f"}, read={"b", "c"}
+    )
+
+
+closure_source = """
+x = 1
+
+class A:
+    y = 2
+
+    def f(self):
+        return super().f() + x + y
+
+def outer():
+    z = 3
+    w = 4
+
+    def inner():
+        nonlocal z
+        z = 10
+        return [z for _ in range(w)]
+
+    def other():
+        global w
+        return w
+
+    return inner, other
+"""
+
+
+def test_free_variables():
+    assert free_variables(closure_source) == {
+        ("f", 7): [{"__class__"}],
+        ("outer", 10): [set()],
+        ("inner", 14): [{"z", "w"}],
+        ("other", 19): [set()],
+    }
+
+
+def test_fill_closures():
+    tree = ast.parse(closure_source)
+    mapping = {}
+    variables(tree, mapping)
+    fill_closures(closure_source, mapping)
+    closures = {
+        node.name: vs.closure
+        for node, vs in mapping.items()
+        if not isinstance(node, ast.ClassDef)
+    }
+    assert closures == {
+        "f": {"__class__"},
+        "outer": set(),
+        "inner": {"z", "w"},
+        "other": set(),
+    }
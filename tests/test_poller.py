@@ -0,0 +1,117 @@
+import os
+import time
+
+import pytest
+
+from jurigged.live import Watcher
+from jurigged.poller import StatObserver
+from jurigged.register import Registry
+
+
+class Handler:
+    def __init__(self, fail=False):
+        self.events = []
+        self.fail = fail
+
+    def on_modified(self, event):
+        self.events.append(event.src_path)
+        if self.fail:
+            raise FileNotFoundError(event.src_path)
+
+
+def _touch(path, contents):
+    path.write_text(contents)
+    # Make sure the mtime changes even on coarse filesystems
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+def _files(tmp_path, n):
+    files = [tmp_path / f"f{i}.py" for i in range(n)]
+    for f in files:
+        f.write_text("")
+    return files
+
+
+def test_poll(tmp_path):
+    a, b = _files(tmp_path, 2)
+    ha, hb, hfail = Handler(), Handler(), Handler(fail=True)
+    obs = StatObserver(0.1)
+    obs.schedule(ha, str(tmp_path), filename=str(a))
+    obs.schedule(hfail, str(tmp_path), filename=str(a))
+    obs.schedule(hb, str(tmp_path), filename=str(b))
+    assert not obs.poll()
+
+    _touch(a, "x = 1")
+    assert obs.poll()
+    assert ha.events == hfail.events == [str(a)]
+    assert hb.events == []
+
+    # Deleted, then recreated
+    os.unlink(b)
+    assert not obs.poll()
+    _touch(b, "y = 1")
+    assert obs.poll()
+    assert hb.events == [str(b)]
+
+
+def test_budget(tmp_path):
+    files = _files(tmp_path, 5)
+    h = Handler()
+    obs = StatObserver(0.1, budget=2)
+    for f in files:
+        obs.schedule(h, str(tmp_path), filename=str(f))
+    for f in files:
+        _touch(f, "x = 1")
+    for expected in (2, 4, 5):
+        obs.poll()
+        assert len(h.events) == expected
+    assert sorted(h.events) == sorted(map(str, files))
+
+
+def test_adaptive_interval(tmp_path):
+    (a,) = _files(tmp_path, 1)
+    obs = StatObserver(0.1, idle_interval=0.5)
+    obs.schedule(Handler(), str(tmp_path), filename=str(a))
+    intervals = []
+    for _ in range(4):
+        obs.poll()
+        intervals.append(obs.current_interval)
+    assert intervals == [0.2, 0.4, 0.5, 0.5]
+    _touch(a, "x = 1")
+    obs.poll()
+    assert obs.current_interval == 0.1
+    obs = StatObserver(0.1)
+    assert obs.idle_interval == 0.1
+    obs.schedule(Handler(), str(tmp_path), filename=str(a))
+    obs.poll()
+    assert obs.current_interval == 0.1
+
+
+def test_watcher_options():
+    w = Watcher(Registry(), poll=0.1, poll_budget=3, poll_idle=2)
+    assert w.observer.budget == 3
+    assert w.observer.idle_interval == 2
+
+
+def test_schedule_directory(tmp_path):
+    with pytest.raises(TypeError):
+        StatObserver(0.1).schedule(Handler(), str(tmp_path))
+
+
+def test_thread(tmp_path):
+    (a,) = _files(tmp_path, 1)
+    h = Handler()
+    obs = StatObserver(0.01, idle_interval=0.01)
+    obs.join()
+    obs.schedule(h, str(tmp_path), filename=str(a))
+    obs.start()
+    assert obs.is_alive()
+    _touch(a, "x = 1")
+    end = time.time() + 5
+    while not h.events:
+        assert time.time() < end
+        time.sleep(0.01)
+    obs.stop()
+    obs.join()
+    assert not obs.is_alive()
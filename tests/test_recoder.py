@@ -1,9 +1,19 @@
+import inspect
+import linecache
 import re
 import textwrap
 
 import pytest
 
-from jurigged.recode import OutOfSyncException, Recoder, make_recoder
+from jurigged import recode
+from jurigged.recode import (
+    OutOfSyncException,
+    Recoder,
+    collect_virtual_files,
+    make_recoder,
+    virtual_file,
+    virtual_file_stats,
+)
 from jurigged.register import registry
 
 from .test_codetools import CodeCollection, ballon, tmod  # noqa
@@ -298,3 +308,71 @@ def test_recoder_out_of_sync_2(ballon):
     rec1.repatch()
     assert ballon.module.inflate(4) == 8
     rec1.commit()
+
+
+def test_recoder_releases_virtual_files(ballon):
+    rec = make_recoder(ballon.module.inflate)
+    before = virtual_file_stats()
+    filenames = []
+    for i in range(5):
+        rec.patch(f"def inflate(x):\n    return x * {i}\n")
+        filenames.append(ballon.module.inflate.__code__.co_filename)
+    assert ballon.module.inflate(4) == 16
+
+    # Only the file of the last patch is still used
+    stats = virtual_file_stats()
+    assert stats["files"] == before["files"] + 1
+    assert stats["released"] == before["released"] + 4
+    assert [f in linecache.cache for f in filenames] == [False] * 4 + [True]
+    assert filenames[0] not in registry.cache
+    assert registry.find(ballon.module.inflate)[0] is rec.codefile
+    assert "x * 4" in inspect.getsource(ballon.module.inflate)
+
+    rec.revert()
+    collect_virtual_files()
+    assert filenames[-1] not in linecache.cache
+    assert virtual_file_stats()["files"] == before["files"]
+
+
+def test_recoder_keeps_files_of_lambdas(ballon):
+    rec = Recoder(name="test", codefile=ballon.main)
+    rec.patch_module(
+        textwrap.dedent(
+            """
+            square = lambda x: x * x
+
+
+            class Sphere:
+                area = property(lambda self: 4 * math.pi * self.radius ** 2)
+                grow = staticmethod(lambda r: r * 2)
+            """
+        )
+    )
+    square = ballon.module.square
+    area = ballon.module.Sphere.area.fget
+    grow = ballon.module.Sphere.grow
+    rec.patch("def inflate(x):\n    return x * 3\n")
+    assert ballon.module.inflate(4) == 12
+
+    # The lambdas are not definitions, but their file is still used
+    assert square.__code__.co_filename in linecache.cache
+    assert area.__code__.co_filename in linecache.cache
+    assert grow.__code__.co_filename in linecache.cache
+    assert "x * x" in inspect.getsource(square)
+
+    del ballon.module.square
+    del ballon.module.Sphere.area
+    del ballon.module.Sphere.grow
+    collect_virtual_files(ballon.main)
+    assert square.__code__.co_filename not in linecache.cache
+
+
+def test_virtual_file_limit(monkeypatch):
+    monkeypatch.setattr(recode, "MAX_VIRTUAL_FILES", 3)
+    monkeypatch.setattr(recode, "_virtual_files", {})
+    filenames = [virtual_file("limit", f"x = {i}\ny = 1") for i in range(5)]
+    assert [f in linecache.cache for f in filenames] == [False] * 2 + [True] * 3
+    assert virtual_file_stats()["files"] == 3
+    assert virtual_file_stats()["lines"] == sum(
+        len(linecache.cache[f][2]) for f in filenames[2:]
+    )
@@ -1,6 +1,8 @@
 import pytest
 
-from jurigged.rescript import redirect, redirect_code
+from jurigged.rescript import redirect, redirect_code, unredirect
+
+from .common import LiveModule
 
 
 def doubler(f):
@@ -40,3 +42,119 @@ def test_redirect_code_invalid():
     del f
     with pytest.raises(Exception, match="requires exactly one function"):
         redirect_code(co, doubler)
+
+
+def test_redirect_signature():
+    def f(a, b=2, /, c=3, *args, d, e=5, **kwargs):
+        return (a, b, c, args, d, e, kwargs)
+
+    redirect(f, doubler)
+    assert f(1, d=4) == (1, 2, 3, (), 4, 5, {}) * 2
+    assert f(1, 20, 30, 40, d=4, e=50, z=60) == (
+        (1, 20, 30, (40,), 4, 50, {"z": 60}) * 2
+    )
+    assert f.__code__.co_name == "f"
+    assert f.__code__.co_varnames[:6] == ("a", "b", "c", "d", "e", "args")
+    # Call errors are the same as for the original function
+    with pytest.raises(TypeError, match="missing 1 required keyword-only"):
+        f(1)
+    with pytest.raises(TypeError, match="missing 1 required positional"):
+        f(a=1, d=4)
+
+
+def test_redirect_kwonly():
+    def f(x, *, y=2):
+        return x + y
+
+    redirect(f, doubler)
+    assert f(1) == 6
+    assert f(1, y=3) == 8
+    with pytest.raises(TypeError):
+        f(1, 3)
+
+
+def test_redirect_closure():
+    z = 10
+
+    def f(x):
+        return x + z
+
+    redirect(f, doubler)
+    assert f(1) == 22
+    z = 20
+    assert f(1) == 42
+
+
+def test_redirect_no_globals():
+    def f(x):
+        return x
+
+    redirect(f, doubler)
+    assert not any("jurigged" in k for k in f.__globals__)
+
+
+def test_unredirect():
+    def f(x, y=1):
+        return x + y
+
+    orig_code = f.__code__
+    redirect(f, doubler)
+    redirect(f, doubler)
+    assert f(1) == 8
+    unredirect(f)
+    assert f(1) == 4
+    unredirect(f)
+    assert f(1) == 2
+    assert f.__code__ is orig_code
+    with pytest.raises(Exception, match="is not redirected"):
+        unredirect(f)
+
+
+def test_redirect_follows_changes():
+    lm = LiveModule("redirected")
+    f = lm.module.f
+    redirect(f, doubler)
+    assert f(1) == 4
+    lm.edit("y=1", "y=100")
+    assert f(1) == 202
+    lm.edit(
+        "(x, y=100):\n    return x + y",
+        "(x, y=10, *, z=0):\n    return x + y + z",
+    )
+    assert f(1) == 22
+    assert f(1, z=5) == 32
+    with pytest.raises(TypeError, match="unexpected keyword argument 'w'"):
+        f(1, w=5)
+
+
+def test_redirect_stacked_follows_changes():
+    lm = LiveModule("redirected")
+    f = lm.module.f
+    redirect(f, doubler)
+    redirect(f, doubler)
+    lm.edit("y=1", "y=100")
+    assert f(1) == 404
+    unredirect(f)
+    assert f(1) == 202
+    unredirect(f)
+    assert f(1) == 101
+    # Changes after unredirect are applied as usual
+    lm.edit("x + y\n", "x - y\n")
+    assert f(1) == -99
+
+
+def test_redirect_closure_follows_changes():
+    lm = LiveModule("redirected")
+    add = lm.module.adder(1)
+    redirect(add, doubler)
+    assert add(2) == 6
+    lm.edit("return x + y\n\n    return add", "return x * y\n\n    return add")
+    assert add(2) == 4
+
+
+def test_redirect_deleted():
+    lm = LiveModule("redirected")
+    g = lm.module.g
+    redirect(g, doubler)
+    lm.edit("def g(x):\n    return x\n", "")
+    assert g(3) == 6
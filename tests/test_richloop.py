@@ -0,0 +1,120 @@
+import gc
+import os
+import re
+
+import pytest
+from giving import give, given
+
+from jurigged.loop.richloop import (
+    Line,
+    RichDeveloopRunner,
+    TerminalLines,
+    breakline,
+)
+
+RED = "\x1b[31m"
+RESET = "\x1b[0m"
+
+
+def _plain(pane):
+    return [re.sub(r"\x1b\[[0-9;]*m", "", line.text) for line in pane.lines]
+
+
+def test_breakline_escapes():
+    lines = list(breakline(f"{RED}abcdef{RESET}gh", limit=4))
+    # The escapes are kept, and do not count in the width
+    assert lines == [Line(f"{RED}abcd", 4), Line(f"ef{RESET}gh", 4)]
+
+
+def test_breakline_wide():
+    assert list(breakline("日本語です", limit=4)) == [
+        Line("日本", 4),
+        Line("語で", 4),
+        Line("す", 2),
+    ]
+    # A wide character that does not fit moves to the next line
+    assert list(breakline("a日本", limit=4)) == [Line("a日", 3), Line("本", 2)]
+
+
+def test_breakline_initial():
+    assert list(breakline("cdef", limit=4, initial=Line("ab", 2))) == [
+        Line("abcd", 4),
+        Line("ef", 2),
+    ]
+    assert list(breakline("", limit=4, initial=Line("ab", 2))) == [
+        Line("ab", 2)
+    ]
+    assert list(breakline("日", limit=3, initial=Line("ab", 2))) == [
+        Line("ab", 2),
+        Line("日", 2),
+    ]
+
+
+def test_breakline_overflow():
+    # Too wide for any line, so it overflows on a line of its own
+    assert list(breakline("日x", limit=1)) == [Line("日", 2), Line("x", 1)]
+    assert list(breakline("x日", limit=1)) == [Line("x", 1), Line("日", 2)]
+
+
+def test_scrollback():
+    pane = TerminalLines("out", scrollback=2)
+    pane.add("a\nb\nc\n")
+    assert [line.text for line in pane.lines] == ["c", ""]
+    assert pane.dropped == 2
+    assert pane.subtitle() == "2 lines dropped"
+    with pytest.raises(ValueError, match="scrollback must be at least 1"):
+        TerminalLines("out", scrollback=0)
+
+
+def test_spill():
+    pane = TerminalLines("out", scrollback=2, spill=True)
+    filename = pane.spill_file.name
+    pane.add("a\nb\nc\n")
+    assert pane.subtitle() == f"2 lines dropped, see {filename}"
+    pane.clear()
+    pane.add("d\n")
+    # The file is kept when the pane is collected
+    del pane
+    gc.collect()
+    with open(filename) as f:
+        assert f.read() == "a\nb\nc\n\n--- rerun ---\nd\n"
+    os.unlink(filename)
+
+
+def test_spill_close():
+    pane = TerminalLines("out", spill=True)
+    pane.close()
+    assert not os.path.exists(pane.spill_file.name)
+    pane.close()
+    TerminalLines("out").close()
+
+
+@pytest.fixture
+def runner():
+    return RichDeveloopRunner(lambda: None, (), {})
+
+
+def test_given(runner):
+    pane = runner.dash.stack["given"]
+    cleared = []
+    with given() as gv:
+        runner.register_updates(gv)
+        pane.clear = lambda clear=pane.clear: cleared.append(1) or clear()
+
+        xs = [1]
+        give(xs=xs)
+        runner._update()
+        assert _plain(pane) == ["xs   [1]", ""]
+
+        # A new variable is appended to the pane
+        give(y=2)
+        runner._update()
+        assert _plain(pane) == ["xs   [1]", "y    2", ""]
+        assert cleared == []
+
+        # The same object, given again after a change, is rendered again
+        xs.append(2)
+        give(xs=xs)
+        runner._update()
+        assert _plain(pane) == ["xs   [1, 2]", "y    2", ""]
+        assert cleared == [1]
@@ -0,0 +1,169 @@
+import threading
+import time
+from itertools import count
+
+import pytest
+
+from jurigged.live import Watcher
+from jurigged.register import Registry
+from jurigged.safepoint import SafePoint
+
+from .common import TemporaryModule
+
+
+def test_idle():
+    sp = SafePoint()
+    calls = []
+    sp.defer(lambda: calls.append(1))
+    assert calls == [1]
+    assert sp.applied == 1
+    assert sp.pending == 0
+
+
+def test_after_request():
+    sp = SafePoint()
+    calls = []
+    with sp.request():
+        with sp.request():
+            sp.defer(lambda: calls.append(1))
+            assert sp.pending == 1
+        assert calls == []
+    assert calls == [1]
+    assert sp.pending == 0
+    assert len(sp.waits) == 1
+    assert sp.max_wait == sp.waits[0] > 0
+
+
+def test_requests_wait_for_changes():
+    sp = SafePoint()
+    events = []
+
+    def other_request():
+        with sp.request():
+            events.append("request")
+
+    with sp.request():
+        sp.defer(lambda: events.append("change"))
+        thread = threading.Thread(target=other_request)
+        thread.start()
+        time.sleep(0.05)
+        # The new request waits for the pending change
+        assert events == []
+    thread.join()
+    assert events == ["change", "request"]
+
+
+def test_nested_request_after_defer():
+    sp = SafePoint()
+    calls = []
+
+    def request():
+        with sp.request():
+            sp.defer(lambda: calls.append(1))
+            # Must not wait for the change, which waits for this block
+            with sp.request():
+                calls.append(0)
+
+    thread = threading.Thread(target=request, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert calls == [0, 1]
+
+
+def test_failing_change(caplog):
+    sp = SafePoint()
+    calls = []
+    with sp.request():
+        sp.defer(lambda: 1 / 0)
+        sp.defer(lambda: calls.append(1))
+    assert calls == [1]
+    assert sp.pending == 0
+    assert "Error while applying a deferred change" in caplog.text
+
+
+def test_checkpoint():
+    sp = SafePoint(auto=False)
+    calls = []
+    sp.defer(lambda: calls.append(1))
+    with sp.request():
+        pass
+    assert calls == []
+    sp.checkpoint()
+    assert calls == [1]
+    assert sp.max_wait > 0
+
+
+def test_checkpoint_waits_for_requests():
+    sp = SafePoint(auto=False)
+    events = []
+    sp.defer(lambda: events.append("change"))
+    started = threading.Event()
+    release = threading.Event()
+
+    def request():
+        with sp.request():
+            started.set()
+            release.wait()
+            events.append("request")
+
+    thread = threading.Thread(target=request)
+    thread.start()
+    started.wait()
+    threading.Timer(0.05, release.set).start()
+    sp.checkpoint()
+    thread.join()
+    assert events == ["request", "change"]
+
+
+def test_no_waits():
+    assert SafePoint().max_wait == 0.0
+
+
+counter = count()
+
+
+@pytest.fixture
+def safe_watcher():
+    tmod = TemporaryModule()
+    name = f"safe_{next(counter)}"
+    path = tmod.write(f"{name}.py", "def f():\n    return 1\n")
+    mod = __import__(name)
+    reg = Registry()
+    events = []
+    reg.set_logger(events.append)
+    reg.prepare(name, path)
+    sp = SafePoint()
+    watcher = Watcher(reg, safepoint=sp)
+    return mod, tmod, path, watcher, sp, events
+
+
+def test_watcher_safepoint(safe_watcher):
+    mod, tmod, path, watcher, sp, events = safe_watcher
+    with sp.request():
+        tmod.write(f"{mod.__name__}.py", "def f():\n    return 2\n")
+        watcher.refresh(path)
+        assert mod.f() == 1
+        assert sp.pending == 1
+    assert mod.f() == 2
+    assert sp.applied == 1
+
+
+def test_watcher_safepoint_revert(safe_watcher):
+    mod, tmod, path, watcher, sp, events = safe_watcher
+    with sp.request():
+        tmod.write(f"{mod.__name__}.py", "def f():\n    return 2\n")
+        watcher.refresh(path)
+        tmod.write(f"{mod.__name__}.py", "def f():\n    return 1\n")
+        watcher.refresh(path)
+    # The changes are applied in order
+    assert mod.f() == 1
+    assert sp.applied == 2
+
+
+def test_watcher_safepoint_syntax_error(safe_watcher):
+    mod, tmod, path, watcher, sp, events = safe_watcher
+    tmod.write(f"{mod.__name__}.py", "def f(:\n")
+    watcher.refresh(path)
+    assert sp.pending == 0
+    assert isinstance(events[-1], SyntaxError)
@@ -0,0 +1,167 @@
+import threading
+import time
+
+from jurigged.live import watch
+from jurigged.register import Registry
+from jurigged.utils import EventSource, ListenerStats
+
+
+def _replay(src):
+    log = []
+    src.register(lambda *args, **kwargs: log.append((args, kwargs)))
+    return log
+
+
+def test_event_source():
+    log = []
+    src = EventSource()
+    src.register(lambda x: log.append(x))
+    src.emit(1)
+    src.emit(2)
+    assert log == [1, 2]
+    assert _replay(src) == []
+
+
+def test_event_source_history():
+    src = EventSource(save_history=True)
+    src.emit(1)
+    src.emit(1, y=2)
+    assert _replay(src) == [((1,), {}), ((1,), {"y": 2})]
+    log = []
+    src.register(log.append, apply_history=False)
+    assert log == []
+
+
+def test_event_source_history_key():
+    src = EventSource(save_history=True, history_key=lambda x, y: x)
+    src.emit("a", 1)
+    src.emit("b", 2)
+    src.emit("a", 3)
+    assert _replay(src) == [(("b", 2), {}), (("a", 3), {})]
+
+
+def test_event_source_history_size():
+    src = EventSource(save_history=True, history_size=2)
+    for i in range(5):
+        src.emit(i)
+    assert _replay(src) == [((3,), {}), ((4,), {})]
+
+    src = EventSource(save_history=True, history_key=str, history_size=2)
+    for i in [1, 2, 1, 3, 1]:
+        src.emit(i)
+    assert _replay(src) == [((3,), {}), ((1,), {})]
+
+
+def test_precache_activity_dedup():
+    reg = Registry()
+    for _ in range(3):
+        reg.precache_activity.emit("mod", "/mod.py")
+    reg.precache_activity.emit("mod2", "/mod2.py")
+    assert _replay(reg.precache_activity) == [
+        (("mod", "/mod.py"), {}),
+        (("mod2", "/mod2.py"), {}),
+    ]
+
+
+def test_event_source_background():
+    log = []
+    errors = []
+    main = threading.get_ident()
+
+    def fail(x):
+        raise ValueError(x)
+
+    def slow(x):
+        time.sleep(0.05)
+        log.append((x, threading.get_ident() != main))
+
+    src = EventSource(
+        background=True, on_error=lambda listener, exc: errors.append(exc)
+    )
+    src.register(fail)
+    src.register(slow)
+    start = time.perf_counter()
+    src.emit(1)
+    src.emit(2)
+    # emit only enqueues
+    assert time.perf_counter() - start < 0.05
+    src.join()
+    assert log == [(1, True), (2, True)]
+    assert [e.args for e in errors] == [(1,), (2,)]
+    assert src.stats[fail].calls == src.stats[fail].errors == 2
+    assert src.stats[slow] == ListenerStats(
+        calls=2, errors=0, time=src.stats[slow].time
+    )
+    assert src.stats[slow].time >= 0.1
+
+
+def test_event_source_background_default_on_error(caplog):
+    src = EventSource(background=True)
+    src.register(lambda x: 1 / x)
+    src.emit(0)
+    src.join()
+    assert "Error in listener" in caplog.text
+
+
+def test_event_source_background_fork():
+    log = []
+    src = EventSource(background=True)
+    src.register(log.append)
+    src.join()
+    src.emit(1)
+    src.join()
+    # Pretend we are in a forked process, where the worker does not exist
+    src._worker_pid = -1
+    src.join()
+    src.emit(2)
+    src.join()
+    assert log == [1, 2]
+
+
+def test_background_logger():
+    events = []
+    reg = Registry()
+    reg.set_logger(events.append, background=True)
+    reg.log("a")
+    reg.log("b")
+    reg.log_events.join()
+    assert events == ["a", "b"]
+    thread = reg.log_events._thread
+    reg.set_logger(events.append)
+    # The previous worker is stopped
+    assert not thread.is_alive()
+    assert reg.log_events is None
+    reg.log("c")
+    assert events == ["a", "b", "c"]
+
+
+def test_event_source_stop():
+    log = []
+
+    def slow(x):
+        time.sleep(0.01)
+        log.append(x)
+
+    src = EventSource(background=True)
+    src.register(slow)
+    for i in range(3):
+        src.emit(i)
+    thread = src._thread
+    src.stop()
+    # Pending emits are processed before the thread stops
+    assert log == [0, 1, 2]
+    assert not thread.is_alive()
+    src.stop()
+    src.emit(3)
+    src.stop()
+    assert log == [0, 1, 2, 3]
+
+
+def test_watch_background_log():
+    reg = Registry()
+    watcher = watch(registry=reg, autostart=False)
+    assert reg.log_events is None
+    watcher = watch(registry=reg, autostart=False, background_log=True)
+    assert reg.log_events.background
+    reg.log_events.stop()
+    watcher.observer.stop()
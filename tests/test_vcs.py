@@ -0,0 +1,176 @@
+import asyncio
+import time
+from itertools import count
+
+from jurigged.live import Watcher
+from jurigged.register import Registry
+from jurigged.vcs import BatchOperation, VCSGuard, find_git_dir
+
+from .common import wait_until
+
+counter = count()
+
+
+def _repo(tmp_path, n=2):
+    (tmp_path / ".git").mkdir()
+    (tmp_path / "pkg").mkdir()
+    idx = next(counter)
+    names = [f"vcsmod_{idx}_{i}" for i in range(n)]
+    paths = []
+    for name in names:
+        path = tmp_path / "pkg" / f"{name}.py"
+        path.write_text("x = 1\n")
+        paths.append(str(path))
+    return names, paths
+
+
+def _setup(tmp_path, monkeypatch, **kwargs):
+    names, paths = _repo(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path / "pkg"))
+    mods = [__import__(name) for name in names]
+    reg = Registry()
+    events = []
+    reg.set_logger(events.append)
+    for name, path in zip(names, paths):
+        reg.prepare(name, path)
+        reg.get(path)
+    watcher = Watcher(reg, vcs_guard=VCSGuard(interval=0.01, **kwargs))
+    return watcher, mods, paths, events
+
+
+def _checkout(tmp_path, paths, value):
+    for path in paths:
+        with open(path, "w") as f:
+            f.write(f"x = {value}\n")
+
+
+def test_find_git_dir(tmp_path):
+    assert find_git_dir(str(tmp_path)) is None
+    (tmp_path / ".git").mkdir()
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    assert find_git_dir(str(tmp_path / "a" / "b")) == str(tmp_path / ".git")
+
+    # Worktrees and submodules have a .git file
+    (tmp_path / "a" / ".git").write_text("gitdir: ../.git/worktrees/a\n")
+    assert find_git_dir(str(tmp_path / "a" / "b")) == str(
+        tmp_path / ".git" / "worktrees" / "a"
+    )
+    # Unless it is not what we expect
+    (tmp_path / "a" / ".git").write_text("???")
+    assert find_git_dir(str(tmp_path / "a")) == str(tmp_path / ".git")
+
+
+def test_batch(tmp_path, monkeypatch):
+    watcher, mods, paths, events = _setup(tmp_path, monkeypatch)
+    lock = tmp_path / ".git" / "index.lock"
+
+    # Not busy: reloaded right away
+    _checkout(tmp_path, paths[:1], 2)
+    watcher.refresh(paths[0])
+    assert mods[0].x == 2
+
+    lock.write_text("")
+    _checkout(tmp_path, paths, 3)
+    for path in paths:
+        watcher.refresh(path)
+    watcher.refresh(paths[0])
+    time.sleep(0.05)
+    assert [mod.x for mod in mods] == [2, 1]
+
+    lock.unlink()
+    wait_until(lambda: [mod.x for mod in mods] == [3, 3])
+    batches = [e for e in events if isinstance(e, BatchOperation)]
+    assert batches == [BatchOperation(str(tmp_path / ".git"), paths)]
+    assert str(batches[0]) == "Reload 2 file(s) changed by git"
+
+
+def test_batch_sequence(tmp_path, monkeypatch):
+    # A rebase of two commits, with a gap between them
+    watcher, mods, paths, events = _setup(tmp_path, monkeypatch, settle=0.3)
+    gitdir = tmp_path / ".git"
+    lock = gitdir / "index.lock"
+    (gitdir / "rebase-merge").mkdir()
+
+    lock.write_text("")
+    _checkout(tmp_path, paths[:1], 7)
+    watcher.refresh(paths[0])
+    lock.unlink()
+    time.sleep(0.1)
+    assert [mod.x for mod in mods] == [1, 1]
+
+    (gitdir / "HEAD.lock").write_text("")
+    _checkout(tmp_path, paths, 8)
+    for path in paths:
+        watcher.refresh(path)
+    (gitdir / "HEAD.lock").unlink()
+    time.sleep(0.1)
+    assert [mod.x for mod in mods] == [1, 1]
+
+    (gitdir / "rebase-merge").rmdir()
+    wait_until(lambda: [mod.x for mod in mods] == [8, 8])
+    batches = [e for e in events if isinstance(e, BatchOperation)]
+    assert batches == [BatchOperation(str(gitdir), paths)]
+
+
+def test_stopped_sequence(tmp_path, monkeypatch):
+    # A rebase that stops on a conflict does not hold back the changes
+    watcher, mods, paths, events = _setup(tmp_path, monkeypatch, settle=0.1)
+    gitdir = tmp_path / ".git"
+    (gitdir / "sequencer").mkdir()
+    (gitdir / "index.lock").write_text("")
+    _checkout(tmp_path, paths[:1], 9)
+    watcher.refresh(paths[0])
+    (gitdir / "index.lock").unlink()
+    wait_until(lambda: mods[0].x == 9)
+
+    # Without a lock, the changes made to resolve the conflict are
+    # reloaded right away
+    time.sleep(0.1)
+    _checkout(tmp_path, paths[1:], 10)
+    watcher.refresh(paths[1])
+    assert mods[1].x == 10
+
+
+def test_stale_lock(tmp_path, monkeypatch):
+    watcher, mods, paths, events = _setup(tmp_path, monkeypatch, timeout=0.1)
+    (tmp_path / ".git" / "index.lock").write_text("")
+    _checkout(tmp_path, paths, 4)
+    watcher.refresh(paths[0])
+    assert mods[0].x == 1
+    wait_until(lambda: mods[0].x == 4)
+
+
+def test_batch_in_loop(tmp_path, monkeypatch):
+    watcher, mods, paths, events = _setup(tmp_path, monkeypatch)
+    lock = tmp_path / ".git" / "index.lock"
+
+    async def main():
+        watcher.attach_loop()
+        lock.write_text("")
+        _checkout(tmp_path, paths, 5)
+        for path in paths:
+            watcher.refresh(path)
+        await asyncio.sleep(0.05)
+        assert [mod.x for mod in mods] == [1, 1]
+        lock.unlink()
+        while mods[1].x != 5:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert mods[0].x == 5
+
+
+def test_no_guard(tmp_path, monkeypatch):
+    names, paths = _repo(tmp_path, n=1)
+    (tmp_path / ".git" / "index.lock").write_text("")
+    monkeypatch.syspath_prepend(str(tmp_path / "pkg"))
+    mod = __import__(names[0])
+    reg = Registry()
+    reg.prepare(names[0], paths[0])
+    reg.get(paths[0])
+    watcher = Watcher(reg, vcs_guard=False)
+    assert watcher.vcs_guard is None
+    _checkout(tmp_path, paths, 6)
+    watcher.refresh(paths[0])
+    assert mod.x == 6
+    assert isinstance(Watcher(reg).vcs_guard, VCSGuard)